@@ -0,0 +1,105 @@
+# api/asgi.py
+"""
+asyncio (ASGI) variant of the pricing API's read path:
+
+    uvicorn api.asgi:app --port 8000
+    WEB_WORKER_CLASS=uvicorn_worker.UvicornWorker gunicorn -c gunicorn.conf.py api.asgi:app
+
+GET /price-suggestions (same parameters, responses and snapshot-first behaviour as the
+Flask route; both use api/suggestions.py), GET /ready and GET /metrics; the write
+endpoints stay on the Flask app.
+Live suggestions go through suggest_price_for_sku_async: the feature, price, vendor rule
+and elasticity lookups of a request run concurrently on the DB executor
+(services.db_pool.run_blocking, DB_ASYNC_THREADS threads), and the model lookup and
+prediction run in the loop's default executor, so a worker keeps many requests in flight
+on one event loop instead of one thread per request.
+
+Importing app.py loads the serving state exactly as for the Flask app (MODEL_PRELOAD) and
+provides the gunicorn fork hooks, so gunicorn.conf.py works unchanged with this app.
+"""
+import json
+import logging
+import time
+from urllib.parse import parse_qs
+
+import app as _serving  # noqa: F401  (preloads the demand model, segment index and snapshot)
+from api.suggestions import (SUGGESTIONS_ENDPOINT, observe_request, parse_suggestion_args, snapshot_lookup,
+                             snapshot_response, live_response)
+from services.pricing_engine import suggest_price_for_sku_async
+from services.prediction_service import DemandModelHolder, SegmentModelCache
+from services.metrics import metrics_payload
+
+logger = logging.getLogger(__name__)
+
+JSON_CONTENT_TYPE = "application/json"
+
+def _json(payload, status=200):
+    return status, JSON_CONTENT_TYPE, json.dumps(payload, default=str).encode()
+
+async def price_suggestions(args):
+    """
+    GET /price-suggestions?sku=SKU-A&vendor_id=vendor_1[&price=49.99][&optimizer=grid|breakpoints]
+    """
+    started = time.perf_counter()
+    sku = None
+    try:
+        params, error = parse_suggestion_args(args)
+        if error:
+            observe_request(SUGGESTIONS_ENDPOINT, 400, "none", started)
+            return _json({"error": error}, status=400)
+        sku = params['sku']
+
+        hit = snapshot_lookup(params)
+        if hit is not None:
+            return 200, JSON_CONTENT_TYPE, snapshot_response(params, *hit, started)
+
+        suggestion = await suggest_price_for_sku_async(sku, vendor_id=params['vendor_id'], grid_relative=None, steps=21,
+                                                       target_price=params['target_price'], optimizer=params['optimizer'])
+        return _json(live_response(params, suggestion, started))
+    except Exception as e:
+        logger.exception("Error in price_suggestions endpoint")
+        observe_request(SUGGESTIONS_ENDPOINT, 500, "live", started)
+        return _json({"error": str(e), "sku": sku}, status=500)
+
+async def ready(args):
+    body = DemandModelHolder.instance().stats()
+    body["segments"] = SegmentModelCache.instance().stats()
+    return _json(body, status=200 if body["ready"] else 503)
+
+async def metrics(args):
+    body, content_type = metrics_payload()
+    return 200, content_type, body
+
+ROUTES = {
+    "/price-suggestions": price_suggestions,
+    "/ready": ready,
+    "/metrics": metrics,
+}
+
+async def _lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        return await _lifespan(receive, send)
+    if scope["type"] != "http":
+        return
+    handler = ROUTES.get(scope["path"])
+    if handler is None:
+        status, content_type, body = _json({"error": "not found"}, status=404)
+    elif scope["method"] not in ("GET", "HEAD"):
+        status, content_type, body = _json({"error": "method not allowed"}, status=405)
+    else:
+        query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+        status, content_type, body = await handler({k: v[0] for k, v in query.items()})
+    if isinstance(body, str):
+        body = body.encode()
+    await send({"type": "http.response.start", "status": status,
+                "headers": [(b"content-type", content_type.encode()), (b"content-length", str(len(body)).encode())]})
+    await send({"type": "http.response.body", "body": body if scope["method"] != "HEAD" else b""})
@@ -2,99 +2,141 @@
 """
 Flask routes for pricing engine
 """
-from flask import Blueprint, request, current_app
+from flask import Blueprint, request, current_app, Response
 from api.utils import json_response, make_api_request_id
-from services.pricing_engine import suggest_price_for_sku
+from api.suggestions import (SUGGESTIONS_ENDPOINT, elapsed_ms, observe_request, parse_suggestion_args, snapshot_lookup,
+                             snapshot_response, live_response)
+from services.pricing_engine import suggest_price_for_sku, suggest_prices_for_skus, OPTIMIZERS
+from services.feature_store import get_latest_features, get_latest_features_bulk, DEFAULT_BASE_FEATURES
 from services.feedback_service import save_feedback
+from services.write_behind import submit_row
+from services.prediction_service import DemandModelHolder, SegmentModelCache
+from services.metrics import FALLBACKS, stage_timer, metrics_payload
+import json
 import logging
+import os
+import time
 from datetime import datetime
 
 bp = Blueprint('pricing', __name__)
 logger = logging.getLogger(__name__)
 
+BATCH_MAX_SKUS = int(os.getenv("BATCH_MAX_SKUS", 1000))
+
 @bp.route("/price-suggestions", methods=["GET"])
 def price_suggestions():
     """
-    GET /price-suggestions?sku=SKU-A&vendor_id=vendor_1
+    GET /price-suggestions?sku=SKU-A&vendor_id=vendor_1[&price=49.99][&optimizer=grid|breakpoints]
     Returns JSON with suggestion and full metadata.
     """
+    started = time.perf_counter()
+    sku = None
     try:
-        sku = request.args.get('sku')
-        vendor_id = request.args.get('vendor_id')
-        target_price_str = request.args.get('price')
-        target_price = float(target_price_str) if target_price_str else None
-        if not sku:
-            return json_response({"error": "sku is required"}, status=400)
+        params, error = parse_suggestion_args(request.args)
+        if error:
+            observe_request(SUGGESTIONS_ENDPOINT, 400, "none", started)
+            return json_response({"error": error}, status=400)
+        sku = params['sku']
+
+        # Default suggestions (no target price or optimizer) are served from the precomputed snapshot when available
+        hit = snapshot_lookup(params)
+        if hit is not None:
+            return Response(snapshot_response(params, *hit, started), status=200, mimetype="application/json")
 
         # Fetch base features from feature store
-        from services.db_pool import SimpleMySQLPool
-        pool = SimpleMySQLPool.instance()
-        conn = pool.get_conn()
-        base_features = {}
-        
+        with stage_timer("feature_store"):
+            try:
+                base_features = get_latest_features(sku)
+            except Exception as e:
+                logger.error(f"Error fetching features: {e}")
+                # Use default features
+                base_features = dict(DEFAULT_BASE_FEATURES)
+                FALLBACKS.labels("default_features").inc()
+
+        suggestion = suggest_price_for_sku(sku, base_features=base_features, vendor_id=params['vendor_id'], grid_relative=None, steps=21,
+                                           target_price=params['target_price'], optimizer=params['optimizer'])
+        return json_response(live_response(params, suggestion, started))
+    
+    except Exception as e:
+        logger.exception("Error in price_suggestions endpoint")
+        observe_request(SUGGESTIONS_ENDPOINT, 500, "live", started)
+        return json_response({"error": str(e), "sku": sku}, status=500)
+
+@bp.route("/price-suggestions/batch", methods=["POST"])
+def price_suggestions_batch():
+    """
+    POST /price-suggestions/batch
+    Body JSON:
+    {
+        vendor_id: str (optional, default for all items),
+        optimizer: "grid" | "breakpoints" | "adaptive" (optional),
+        items: [{sku: str, vendor_id: str (optional), price: float (optional target price)}, ...]
+    }
+    `skus: [str, ...]` is accepted instead of `items` when no per-SKU options are needed.
+    Returns per-SKU results in request order; a failing SKU is reported with status "error"
+    without failing the rest of the batch.
+    """
+    started = time.perf_counter()
+    payload = request.get_json(silent=True) or {}
+    vendor_id = payload.get('vendor_id')
+    optimizer = payload.get('optimizer')
+    items = payload.get('items')
+    if items is None:
+        items = [{'sku': sku} for sku in payload.get('skus') or []]
+    if not isinstance(items, list) or not items:
+        observe_request("/price-suggestions/batch", 400, "none", started)
+        return json_response({"error": "items (or skus) must be a non-empty list"}, status=400)
+    if len(items) > BATCH_MAX_SKUS:
+        observe_request("/price-suggestions/batch", 400, "none", started)
+        return json_response({"error": f"at most {BATCH_MAX_SKUS} SKUs per batch"}, status=400)
+    if optimizer is not None and optimizer not in OPTIMIZERS:
+        observe_request("/price-suggestions/batch", 400, "none", started)
+        return json_response({"error": f"optimizer must be one of {', '.join(OPTIMIZERS)}"}, status=400)
+
+    normalized = []
+    for item in items:
+        if isinstance(item, str):
+            item = {'sku': item}
+        if not isinstance(item, dict) or not item.get('sku'):
+            observe_request("/price-suggestions/batch", 400, "none", started)
+            return json_response({"error": "every item needs a sku"}, status=400)
         try:
-            with conn.cursor() as cur:
-                cur.execute("SELECT * FROM features_daily WHERE sku=%s ORDER BY feature_date DESC LIMIT 1", (sku,))
-                row = cur.fetchone()
-                if row:
-                    # Convert row to base_features dict
-                    base_features = {
-                        'last_price': float(row.get('last_price') or 0.0),
-                        'avg_price_7d': float(row.get('avg_price_7d') or 0.0),
-                        'views_7d': int(row.get('views_7d') or 0),
-                        'addtocart_7d': int(row.get('addtocart_7d') or 0),
-                        'conversion_7d': float(row.get('conversion_7d') or 0.0),
-                        'inventory_qty': int(row.get('inventory_qty') or 0),
-                        'inventory_age_days': int(row.get('inventory_age_days') or 0),
-                        'promo_active': bool(row.get('promo_active') or False),
-                    }
-                else:
-                    # No features found, use defaults
-                    base_features = {
-                        'last_price': 50.0,
-                        'avg_price_7d': 50.0,
-                        'views_7d': 100,
-                        'addtocart_7d': 10,
-                        'conversion_7d': 0.1,
-                        'inventory_qty': 50,
-                        'inventory_age_days': 5,
-                        'promo_active': False,
-                    }
+            price = float(item['price']) if item.get('price') is not None else None
+        except (TypeError, ValueError):
+            observe_request("/price-suggestions/batch", 400, "none", started)
+            return json_response({"error": f"invalid price for sku {item['sku']}"}, status=400)
+        normalized.append({'sku': item['sku'], 'vendor_id': item.get('vendor_id'), 'price': price})
+
+    try:
+        skus = [item['sku'] for item in normalized]
+        try:
+            with stage_timer("feature_store", "batch"):
+                features_by_sku = get_latest_features_bulk(skus)
         except Exception as e:
             logger.error(f"Error fetching features: {e}")
-            # Use default features
-            base_features = {
-                'last_price': 50.0,
-                'avg_price_7d': 50.0,
-                'views_7d': 100,
-                'addtocart_7d': 10,
-                'conversion_7d': 0.1,
-                'inventory_qty': 50,
-                'inventory_age_days': 5,
-                'promo_active': False,
-            }
-        finally:
-            pool.return_conn(conn)
+            features_by_sku = {sku: dict(DEFAULT_BASE_FEATURES) for sku in skus}
+            FALLBACKS.labels("default_features").inc()
 
         api_request_id = make_api_request_id()
-        suggestion = suggest_price_for_sku(sku, base_features=base_features, vendor_id=vendor_id, grid_relative=None, steps=21, target_price=target_price)
-        suggestion['api_request_id'] = api_request_id
-
-        # Log API call in DB (api_logs) - optional, don't fail if this errors
+        results = suggest_prices_for_skus(normalized, features_by_sku, vendor_id=vendor_id, grid_relative=None, steps=21, api_request_id=api_request_id, optimizer=optimizer)
+        failed = sum(1 for r in results if r.get('status') != "ok")
         try:
-            conn2 = pool.get_conn()
-            with conn2.cursor() as cur:
-                sql = "INSERT INTO api_logs (endpoint, request_ts, request_body, response_body, latency_ms) VALUES (%s, NOW(), %s, %s, %s)"
-                cur.execute(sql, ("/price-suggestions", str({'sku': sku, 'vendor_id': vendor_id}), str(suggestion)[:1000], 0))
-            pool.return_conn(conn2)
+            submit_row('api_logs', ("/price-suggestions/batch", datetime.now(), json.dumps({'vendor_id': vendor_id, 'skus': skus[:100], 'count': len(skus)}),
+                                    json.dumps({'api_request_id': api_request_id, 'succeeded': len(results) - failed, 'failed': failed}), elapsed_ms(started)))
         except Exception:
             pass
-
-        return json_response(suggestion)
-    
+        observe_request("/price-suggestions/batch", 200, "live", started)
+        return json_response({
+            "api_request_id": api_request_id,
+            "count": len(results),
+            "succeeded": len(results) - failed,
+            "failed": failed,
+            "results": results,
+        })
     except Exception as e:
-        logger.exception("Error in price_suggestions endpoint")
-        return json_response({"error": str(e), "sku": sku}, status=500)
+        logger.exception("Error in price_suggestions_batch endpoint")
+        observe_request("/price-suggestions/batch", 500, "live", started)
+        return json_response({"error": str(e)}, status=500)
 
 @bp.route("/price-feedback", methods=["POST"])
 def price_feedback():
@@ -116,3 +158,27 @@ def price_feedback():
     # Save feedback
     save_feedback(payload)
     return json_response({"status": "ok", "received_at": datetime.utcnow().isoformat()})
+
+@bp.route("/ready", methods=["GET"])
+def ready():
+    """
+    GET /ready
+    200 once this process has loaded and warmed up the demand model, 503 before that
+    (for load balancer / orchestrator readiness checks). Also reports the segment model
+    cache: per-segment hits, misses, hit rate and load time.
+    """
+    holder = DemandModelHolder.instance()
+    body = holder.stats()
+    # segment models load on first use, so they do not gate readiness
+    body["segments"] = SegmentModelCache.instance().stats()
+    return json_response(body, status=200 if body["ready"] else 503)
+
+@bp.route("/metrics", methods=["GET"])
+def metrics():
+    """
+    GET /metrics
+    Prometheus exposition of request counters, per-stage latency histograms, pool and
+    queue gauges and the served model version (aggregated over workers in multiprocess mode).
+    """
+    body, content_type = metrics_payload()
+    return Response(body, status=200, mimetype=None, content_type=content_type)
@@ -0,0 +1,102 @@
+# api/suggestions.py
+"""
+Framework-independent parts of the price-suggestion endpoints, shared by the Flask routes
+(api/routes.py) and the ASGI app (api/asgi.py): GET /price-suggestions argument parsing,
+the snapshot response with its audit rows, the live response's api_logs row and the
+request metrics. The front ends only fetch the suggestion and wrap the results in their
+own response objects.
+"""
+import json
+import logging
+import time
+from datetime import datetime
+
+from api.utils import make_api_request_id
+from services.pricing_engine import SINGLE_SKU_OPTIMIZERS
+from services.write_behind import submit_row
+from services.suggestion_snapshot import SuggestionSnapshot, snapshot_response_body
+from services.metrics import REQUESTS, REQUEST_LATENCY, refresh_runtime_gauges
+
+logger = logging.getLogger(__name__)
+
+SUGGESTIONS_ENDPOINT = "/price-suggestions"
+
+def elapsed_ms(started):
+    return int(round((time.perf_counter() - started) * 1000))
+
+def observe_request(endpoint, status, served_from, started):
+    REQUESTS.labels(endpoint, str(status), served_from).inc()
+    REQUEST_LATENCY.labels(endpoint, served_from).observe(time.perf_counter() - started)
+    refresh_runtime_gauges()
+
+def log_summary(suggestion):
+    """
+    Compact api_logs.response_body: the suggestion without the full candidate grid.
+    """
+    return {k: v for k, v in suggestion.items() if k != 'candidates'}
+
+def parse_suggestion_args(args):
+    """
+    (params, error) from the GET /price-suggestions query arguments: params has sku,
+    vendor_id, target_price and optimizer; error is the 400 message (params None then).
+    A price that is not a number raises ValueError.
+    """
+    sku = args.get('sku')
+    target_price_str = args.get('price')
+    optimizer = args.get('optimizer')
+    params = {
+        'sku': sku,
+        'vendor_id': args.get('vendor_id'),
+        'target_price': float(target_price_str) if target_price_str else None,
+        'optimizer': optimizer,
+    }
+    if not sku:
+        return None, "sku is required"
+    if optimizer is not None and optimizer not in SINGLE_SKU_OPTIMIZERS:
+        return None, (f"optimizer must be one of {', '.join(SINGLE_SKU_OPTIMIZERS)}"
+                      " (adaptive is only available for batch requests)")
+    return params, None
+
+def snapshot_lookup(params):
+    """
+    The snapshot entry for a default suggestion (no target price or optimizer), else None.
+    """
+    if params['target_price'] is None and params['optimizer'] is None:
+        return SuggestionSnapshot.instance().lookup(params['sku'], params['vendor_id'])
+    return None
+
+def snapshot_response(params, version, body, audit, started):
+    """
+    JSON body for a snapshot hit, with the per-request fields added without re-serializing
+    the entry. Queues the price_suggestions / api_logs audit rows and records the request.
+    """
+    sku, vendor_id = params['sku'], params['vendor_id']
+    api_request_id = make_api_request_id()
+    current_price, suggested_price, expected_revenue, expected_units, reason, constraints_applied, model_version = audit
+    extra = {"api_request_id": api_request_id, "served_from": "snapshot", "snapshot_version": version}
+    response = snapshot_response_body(body, extra)
+    try:
+        submit_row('price_suggestions', (sku, datetime.now(), current_price, suggested_price, expected_revenue, expected_units,
+                                         None, reason, str(constraints_applied), model_version, api_request_id))
+        submit_row('api_logs', (SUGGESTIONS_ENDPOINT, datetime.now(), json.dumps({'sku': sku, 'vendor_id': vendor_id}),
+                                json.dumps({'suggested_price': suggested_price, 'snapshot_version': version}), elapsed_ms(started)))
+    except Exception:
+        logger.exception("Failed to queue audit rows for snapshot response")
+    observe_request(SUGGESTIONS_ENDPOINT, 200, "snapshot", started)
+    return response
+
+def live_response(params, suggestion, started):
+    """
+    Complete a live suggestion for the response (api_request_id, served_from), queue its
+    api_logs row and record the request. Returns the suggestion.
+    """
+    suggestion['api_request_id'] = make_api_request_id()
+    suggestion['served_from'] = "live"
+    # Log API call in DB (api_logs) via the write-behind queue - optional, don't fail if this errors
+    try:
+        submit_row('api_logs', (SUGGESTIONS_ENDPOINT, datetime.now(), json.dumps({'sku': params['sku'], 'vendor_id': params['vendor_id']}),
+                                json.dumps(log_summary(suggestion), default=str), elapsed_ms(started)))
+    except Exception:
+        pass
+    observe_request(SUGGESTIONS_ENDPOINT, 200, "live", started)
+    return suggestion
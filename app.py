@@ -0,0 +1,90 @@
+"""
+Production entrypoint for the pricing API.
+
+    gunicorn -c gunicorn.conf.py app:app     # prefork multi-worker server
+    python app.py                            # same (execs gunicorn with gunicorn.conf.py)
+    python app.py --dev [--port 8002]        # Flask development server, single process
+
+create_app() builds the Flask app and, unless MODEL_PRELOAD=0, loads the serving state
+(config.yaml is read when the routes import the pricing engine; the demand model is
+loaded and warmed up, the segment index and the suggestion snapshot are read). gunicorn
+preloads this module in the master (preload_app), so workers are forked with that state
+already in memory and share its pages copy-on-write. before_fork() and init_worker() are
+the gunicorn.conf.py hooks that make that safe: nothing that owns a thread, lock or socket
+crosses the fork.
+"""
+
+import gc
+import os
+import sys
+from flask import Flask
+from dotenv import load_dotenv
+from loguru import logger
+
+load_dotenv()
+
+MODEL_PRELOAD = os.getenv("MODEL_PRELOAD", "1").lower() not in ("0", "false", "no")
+GUNICORN_CONFIG = os.path.join(os.path.dirname(os.path.abspath(__file__)), "gunicorn.conf.py")
+
+def preload_serving_state():
+    """
+    Load everything requests would otherwise load lazily. A failed model load is logged and
+    retried on the first request (GET /ready stays 503 until a model is loaded).
+    """
+    from services.prediction_service import preload_serving_models
+    from services.suggestion_snapshot import SuggestionSnapshot
+    try:
+        logger.info(f"Demand model preloaded: {preload_serving_models()}")
+    except Exception as e:
+        logger.warning(f"Demand model preload failed, loading on first request: {e}")
+    logger.info(f"Suggestion snapshot preloaded: {SuggestionSnapshot.instance().preload()}")
+
+def create_app(preload=MODEL_PRELOAD):
+    app = Flask(__name__)
+    from api.routes import bp as api_bp
+    app.register_blueprint(api_bp)
+    if preload:
+        preload_serving_state()
+    return app
+
+def before_fork():
+    """
+    In the master, after preloading and before the first worker is forked: stop the
+    threads and close the DB connections preloading may have started, then freeze the
+    preloaded objects out of the garbage collector so collections in the workers do not
+    write to (and un-share) their pages.
+    """
+    from services.prediction_service import DemandModelHolder
+    from services.write_behind import WriteBehindWriter
+    from services.db_pool import MySQLPool
+    for holder in list(DemandModelHolder._instances.values()):
+        holder.stop_watcher(timeout=10.0)
+    if WriteBehindWriter._instance is not None:
+        WriteBehindWriter._instance.shutdown()
+    if MySQLPool._instance is not None:
+        MySQLPool._instance.close_all()
+        MySQLPool._instance = None
+    gc.freeze()
+
+def init_worker():
+    """
+    In each forked worker: fresh DB pool, write-behind writer and locks, and restarted
+    model watchers.
+    """
+    from services.prediction_service import DemandModelHolder, SegmentModelCache
+    from services.write_behind import WriteBehindWriter
+    from services.db_pool import MySQLPool
+    MySQLPool.reset_after_fork()
+    WriteBehindWriter.reset_after_fork()
+    SegmentModelCache.reset_after_fork()
+    DemandModelHolder.reset_after_fork()
+
+if __name__ == "__main__" and "--dev" not in sys.argv[1:]:
+    # hand over to gunicorn before preloading anything; it imports this module as app:app
+    os.execvp(sys.executable, [sys.executable, "-m", "gunicorn", "-c", GUNICORN_CONFIG, "app:app"])
+
+app = create_app()
+
+if __name__ == "__main__":
+    port = int(sys.argv[sys.argv.index("--port") + 1]) if "--port" in sys.argv else int(os.getenv("FLASK_PORT", 8000))
+    app.run(host=os.getenv("FLASK_HOST", "0.0.0.0"), port=port, threaded=True)
@@ -4,6 +4,7 @@ Minimal Flask app with debug mode to see actual errors
 from flask import Flask, request, jsonify
 import traceback
 import sys
+import os
 
 app = Flask(__name__)
 from api.routes import bp as api_bp
@@ -92,5 +93,13 @@ if __name__ == "__main__":
     print("Test endpoint: http://127.0.0.1:8002/test")
     print("Price endpoint: http://127.0.0.1:8002/price-suggestions?sku=SKU_001")
     print("="*60 + "\n")
-    
+
+    # load and warm up the demand model before serving; GET /ready reports 503 until then
+    if os.getenv("MODEL_PRELOAD", "1").lower() not in ("0", "false", "no"):
+        from services.prediction_service import preload_serving_models
+        try:
+            print(f"Demand model preloaded: {preload_serving_models()}")
+        except Exception as e:
+            print(f"WARNING: demand model preload failed, loading on first request: {e}", file=sys.stderr)
+
     app.run(host="0.0.0.0", port=8002, debug=True)
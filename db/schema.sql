@@ -82,6 +82,58 @@ CREATE TABLE IF NOT EXISTS features_daily (
     PRIMARY KEY (feature_date, sku)
 );
 
+-- Incremental ETL (etl/incremental.py): last processed id per source table, and the
+-- feature_date / start time of the last features_daily refresh (name = 'features_daily')
+-- and the last order_id seen by the incremental elasticity refresh (name = 'elasticity_results')
+CREATE TABLE IF NOT EXISTS etl_watermarks (
+    name VARCHAR(64) PRIMARY KEY,
+    last_id BIGINT NOT NULL DEFAULT 0,
+    last_date DATE NULL,
+    last_ts DATETIME NULL,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+);
+
+-- Per-SKU daily aggregates folded in by the incremental ETL
+-- (agg_date: (day - 1) 23:59:59 <= event ts < day 23:59:59, see etl.transform.event_days)
+CREATE TABLE IF NOT EXISTS sku_daily_agg (
+    sku VARCHAR(64) NOT NULL,
+    agg_date DATE NOT NULL,
+    quantity BIGINT NOT NULL DEFAULT 0,
+    revenue DOUBLE NOT NULL DEFAULT 0,
+    views BIGINT NOT NULL DEFAULT 0,
+    add_to_cart BIGINT NOT NULL DEFAULT 0,
+    conversions BIGINT NOT NULL DEFAULT 0,
+    last_order_ts DATETIME NULL,
+    last_price DECIMAL(10,4) NULL,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    PRIMARY KEY (sku, agg_date)
+);
+CREATE INDEX idx_sku_daily_agg_date ON sku_daily_agg (agg_date);
+CREATE INDEX idx_sku_daily_agg_updated ON sku_daily_agg (updated_at);
+
+-- Latest inventory snapshot per SKU (incremental ETL)
+CREATE TABLE IF NOT EXISTS sku_inventory_latest (
+    sku VARCHAR(64) PRIMARY KEY,
+    snapshot_id BIGINT,
+    snapshot_ts DATETIME,
+    qty_on_hand INT,
+    qty_reserved INT DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+);
+CREATE INDEX idx_sku_inventory_latest_updated ON sku_inventory_latest (updated_at);
+
+-- Finished shards of a features_daily backfill (etl/backfill.py); run_key = 'start:end'
+CREATE TABLE IF NOT EXISTS etl_backfill_progress (
+    run_key VARCHAR(64) NOT NULL,
+    shard INT NOT NULL,
+    num_shards INT NOT NULL,
+    status VARCHAR(16) NOT NULL,
+    rows_written BIGINT DEFAULT 0,
+    seconds FLOAT,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    PRIMARY KEY (run_key, shard)
+);
+
 -- Elasticity results
 CREATE TABLE IF NOT EXISTS elasticity_results (
     sku VARCHAR(64) PRIMARY KEY,
@@ -92,16 +144,20 @@ CREATE TABLE IF NOT EXISTS elasticity_results (
     last_computed TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
--- Demand model predictions (history)
+-- Demand model predictions (history): one row per SKU and day, the latest prediction
+-- (existing databases: ALTER TABLE demand_predictions ADD COLUMN pred_date DATE NOT NULL AFTER sku,
+--  then deduplicate and ADD UNIQUE KEY uq_demand_predictions_sku_date (sku, pred_date))
 CREATE TABLE IF NOT EXISTS demand_predictions (
     pred_id BIGINT PRIMARY KEY AUTO_INCREMENT,
     sku VARCHAR(64),
+    pred_date DATE NOT NULL,
     pred_ts DATETIME,
     predicted_units FLOAT,
     model_version VARCHAR(128),
     features_hash VARCHAR(64),
     price_tested DECIMAL(10,4),
-    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE KEY uq_demand_predictions_sku_date (sku, pred_date)
 );
 
 -- Price suggestions & audit
@@ -122,6 +178,19 @@ CREATE TABLE IF NOT EXISTS price_suggestions (
 );
 CREATE INDEX idx_price_suggestions_sku_ts ON price_suggestions (sku, request_ts);
 
+-- Precomputed default suggestions (services/suggestion_snapshot.py); vendor_id '' = no vendor
+CREATE TABLE IF NOT EXISTS price_suggestion_snapshot (
+    snapshot_version VARCHAR(32) NOT NULL,
+    sku VARCHAR(64) NOT NULL,
+    vendor_id VARCHAR(64) NOT NULL DEFAULT '',
+    suggested_price DECIMAL(10,4),
+    expected_revenue DECIMAL(12,4),
+    model_version VARCHAR(128),
+    suggestion JSON,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (snapshot_version, sku, vendor_id)
+);
+
 -- Vendor feedback (from /price-feedback)
 CREATE TABLE IF NOT EXISTS vendor_feedback (
     feedback_id BIGINT PRIMARY KEY AUTO_INCREMENT,
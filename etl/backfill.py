@@ -0,0 +1,184 @@
+# etl/backfill.py
+"""
+Historical feature backfill: materialize features_daily for every date in a range.
+
+The raw tables are extracted once for the whole range (plus LOOKBACK_DAYS of history
+for windows and last price). SKUs are split into shards by a stable hash of the SKU,
+and each shard is built for all dates at once by etl.transform.build_features_range in
+a worker process. Workers are forked after the extract and read the frames inherited
+from the parent, so nothing is pickled except each shard's result. The parent writes a
+finished shard with REPLACE (idempotent) and then records it in etl_backfill_progress.
+Re-running the same range skips the recorded shards, so an interrupted backfill resumes
+where it stopped.
+
+Usage: python -m etl.backfill --start 2024-01-01 --end 2024-12-31 [--workers 4] [--shards 64] [--restart]
+"""
+
+import argparse
+import math
+import multiprocessing
+import os
+import time
+import zlib
+import logging
+from datetime import date, datetime, timedelta
+import numpy as np
+import pandas as pd
+
+from services.db_pool import SimpleMySQLPool
+from etl.extract import (fetch_orders_between, fetch_product_analytics_between, fetch_inventory_between,
+                         fetch_promotions)
+from etl.transform import build_features_range, ROLLING_WINDOWS_DAYS, LAG_DAYS, ANALYTICS_WINDOW_DAYS
+from etl.load import load_features
+
+logger = logging.getLogger(__name__)
+
+BACKFILL_WORKERS = int(os.getenv("BACKFILL_WORKERS", os.cpu_count() or 1))
+# History before the first date for last_price / inventory (the daily ETL reads 90 days)
+BACKFILL_LOOKBACK_DAYS = int(os.getenv("BACKFILL_LOOKBACK_DAYS", 90))
+# Upper bound on SKUs x days per shard; sizes the dense matrices a worker holds
+BACKFILL_MAX_SHARD_CELLS = int(os.getenv("BACKFILL_MAX_SHARD_CELLS", 5_000_000))
+
+# Frames shared with forked workers: (orders, inventory, analytics, promotions, shard per row...)
+_SOURCE = None
+
+def shard_of(skus, num_shards):
+    """
+    Stable shard number per SKU (crc32 of the SKU string), independent of data order.
+    """
+    return np.fromiter((zlib.crc32(str(s).encode()) % num_shards for s in skus), dtype=np.int64, count=len(skus))
+
+def _row_shards(column, num_shards):
+    """
+    Shard per row, hashing each distinct SKU once.
+    """
+    codes, uniques = pd.factorize(pd.Series(np.asarray(column, dtype=object)))
+    shards = shard_of(uniques, num_shards)
+    return np.where(codes >= 0, shards[np.maximum(codes, 0)] if len(shards) else -1, -1)
+
+def _build_shard(task):
+    shard, start_date, end_date, windows, lags = task
+    orders, inventory, analytics, promotions, o_shard, i_shard, a_shard, p_shard = _SOURCE
+    started = time.time()
+    features = build_features_range(
+        orders[o_shard == shard], inventory[i_shard == shard], analytics[a_shard == shard],
+        promotions[(p_shard == shard) | promotions['sku'].isnull().values],
+        start_date, end_date, windows=windows, lags=lags,
+    )
+    return shard, features, time.time() - started
+
+def _progress(run_key):
+    """
+    (num_shards or None, set of finished shards) recorded for this run.
+    """
+    pool = SimpleMySQLPool.instance()
+    with pool.connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT shard, num_shards, status FROM etl_backfill_progress WHERE run_key = %s", (run_key,))
+            rows = cur.fetchall()
+    if not rows:
+        return None, set()
+    return int(rows[0]['num_shards']), {int(r['shard']) for r in rows if r['status'] == 'done'}
+
+def _mark_done(run_key, shard, num_shards, rows_written, seconds):
+    pool = SimpleMySQLPool.instance()
+    with pool.connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                "REPLACE INTO etl_backfill_progress (run_key, shard, num_shards, status, rows_written, seconds) "
+                "VALUES (%s,%s,%s,'done',%s,%s)",
+                (run_key, shard, num_shards, int(rows_written), float(seconds)),
+            )
+        conn.commit()
+
+def _reset_progress(run_key):
+    pool = SimpleMySQLPool.instance()
+    with pool.connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("DELETE FROM etl_backfill_progress WHERE run_key = %s", (run_key,))
+        conn.commit()
+
+def _day_end(d):
+    return datetime.combine(d, datetime.min.time()) + timedelta(days=1, seconds=-1)
+
+def backfill_features(start_date, end_date, workers=BACKFILL_WORKERS, shards=None, restart=False,
+                      windows=None, lags=None):
+    """
+    Write features_daily rows for every date in [start_date, end_date].
+    Returns {'dates', 'shards', 'skipped', 'rows', 'seconds'}.
+    """
+    global _SOURCE
+    started = time.time()
+    windows = ROLLING_WINDOWS_DAYS if windows is None else windows
+    lags = LAG_DAYS if lags is None else lags
+    n_dates = (end_date - start_date).days + 1
+    if n_dates <= 0:
+        raise ValueError("end_date must not be before start_date")
+    run_key = f"{start_date.isoformat()}:{end_date.isoformat()}"
+    if restart:
+        _reset_progress(run_key)
+    recorded_shards, done = _progress(run_key)
+
+    history = max(list(windows) + [k + 1 for k in lags] + [ANALYTICS_WINDOW_DAYS])
+    lookback_start = datetime.combine(start_date - timedelta(days=max(history, BACKFILL_LOOKBACK_DAYS)), datetime.min.time())
+    orders = fetch_orders_between(lookback_start, _day_end(end_date))
+    analytics = fetch_product_analytics_between(lookback_start, _day_end(end_date))
+    inventory = fetch_inventory_between(lookback_start, _day_end(end_date))
+    promotions = fetch_promotions()
+
+    if recorded_shards is not None:
+        num_shards = recorded_shards
+    elif shards:
+        num_shards = int(shards)
+    else:
+        n_skus = len(pd.unique(np.concatenate([np.asarray(orders['sku'], dtype=object), np.asarray(analytics['sku'], dtype=object),
+                                               np.asarray(inventory['sku'], dtype=object)])))
+        num_shards = max(workers, math.ceil(n_skus * (n_dates + history) / BACKFILL_MAX_SHARD_CELLS))
+    pending = [s for s in range(num_shards) if s not in done]
+    logger.info("backfill %s: %d dates, %d shards (%d already done), %d workers",
+                run_key, n_dates, num_shards, num_shards - len(pending), workers)
+
+    _SOURCE = (orders, inventory, analytics, promotions,
+               _row_shards(orders['sku'], num_shards), _row_shards(inventory['sku'], num_shards),
+               _row_shards(analytics['sku'], num_shards), _row_shards(promotions['sku'], num_shards))
+    tasks = [(s, start_date, end_date, windows, lags) for s in pending]
+    rows = 0
+    try:
+        if workers > 1 and len(tasks) > 1:
+            # fork so workers inherit _SOURCE instead of receiving it pickled
+            with multiprocessing.get_context("fork").Pool(processes=workers) as pool:
+                results = pool.imap_unordered(_build_shard, tasks)
+                for shard, features, seconds in results:
+                    rows += _write_shard(run_key, shard, num_shards, features, seconds)
+        else:
+            for task in tasks:
+                shard, features, seconds = _build_shard(task)
+                rows += _write_shard(run_key, shard, num_shards, features, seconds)
+    finally:
+        _SOURCE = None
+
+    result = {'dates': n_dates, 'shards': num_shards, 'skipped': num_shards - len(pending), 'rows': rows,
+              'seconds': round(time.time() - started, 1)}
+    logger.info("backfill %s finished: %s", run_key, result)
+    return result
+
+def _write_shard(run_key, shard, num_shards, features, seconds):
+    if not features.empty:
+        load_features(features)
+    _mark_done(run_key, shard, num_shards, len(features), seconds)
+    logger.info("backfill %s: shard %d/%d, %d rows (built in %.1fs)", run_key, shard + 1, num_shards, len(features), seconds)
+    return len(features)
+
+def _parse_date(value):
+    return datetime.strptime(value, "%Y-%m-%d").date()
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Backfill features_daily for a date range")
+    parser.add_argument("--start", type=_parse_date, required=True)
+    parser.add_argument("--end", type=_parse_date, default=date.today())
+    parser.add_argument("--workers", type=int, default=BACKFILL_WORKERS)
+    parser.add_argument("--shards", type=int, default=None, help="SKU shards (default: sized from BACKFILL_MAX_SHARD_CELLS)")
+    parser.add_argument("--restart", action="store_true", help="ignore recorded progress for this range")
+    args = parser.parse_args()
+    print(backfill_features(args.start, args.end, workers=args.workers, shards=args.shards, restart=args.restart))
@@ -1,58 +1,297 @@
 # etl/extract.py
 """
 ETL extract module: read raw tables from MySQL and return pandas DataFrames.
+
+Reads only the columns the transform stage uses, streams rows through a server-side
+cursor in EXTRACT_CHUNK_ROWS chunks on a pooled connection, and downcasts as it goes
+(categorical sku, float32 prices/rates, int32 counts) so peak memory stays close to the
+size of the final frame. Each fetch logs its row count, frame size and the process's peak
+RSS; ETL_MEMORY_REPORT=1 adds the peak allocation traced with tracemalloc during the
+fetch (slow, for profiling only). The latest figures are kept in EXTRACT_MEMORY_REPORT.
+
+With RAW_CACHE_ENABLED=1 the windowed fetches (fetch_orders, fetch_product_analytics,
+fetch_inventory_snapshot and the *_between range reads) refresh the local columnar
+cache in etl/raw_cache.py and read from it; the *_since reads always hit MySQL.
 """
 
 from services.db_pool import SimpleMySQLPool
+from etl import raw_cache
 import pandas as pd
+import numpy as np
+import pymysql
+import functools
+import os
+import resource
+import time
+import tracemalloc
 from datetime import datetime, timedelta
 import logging
 
 logger = logging.getLogger(__name__)
 
-def fetch_orders(since_days=60):
-    pool = SimpleMySQLPool.instance()
-    conn = pool.get_pandas_conn()
-    try:
-        sql = f"SELECT * FROM orders WHERE order_ts >= DATE_SUB(NOW(), INTERVAL {since_days} DAY)"
-        df = pd.read_sql(sql, conn)
-        return df
-    finally:
-        pool.close_pandas_conn(conn)
+EXTRACT_CHUNK_ROWS = int(os.getenv("EXTRACT_CHUNK_ROWS", 50000))
+# tracemalloc peak per extract; off by default because tracing slows every allocation
+ETL_MEMORY_REPORT = os.getenv("ETL_MEMORY_REPORT", "0").lower() not in ("0", "false", "no")
 
-def fetch_inventory_snapshot(latest_only=True):
+# Projected columns and their in-memory dtypes. "category" columns are dictionary-encoded
+# while streaming; "datetime" columns become datetime64[ns].
+ORDERS_COLUMNS = {
+    'order_id': np.int64,
+    'sku': 'category',
+    'order_ts': 'datetime',
+    'quantity': np.int32,
+    'price': np.float32,
+}
+INVENTORY_COLUMNS = {
+    'sku': 'category',
+    'snapshot_ts': 'datetime',
+    'qty_on_hand': np.int32,
+    'qty_reserved': np.int32,
+}
+ANALYTICS_COLUMNS = {
+    'sku': 'category',
+    'event_ts': 'datetime',
+    'views': np.int32,
+    'add_to_cart': np.int32,
+    'conversions': np.int32,
+}
+PROMOTIONS_COLUMNS = {
+    'promo_id': object,
+    'sku': object,
+    'start_ts': 'datetime',
+    'end_ts': 'datetime',
+    'discount_pct': np.float32,
+}
+
+# Orders per SKU and vendor (fetch_sku_vendors): ORDERS_COLUMNS leaves vendor_id out
+SKU_VENDOR_COLUMNS = {
+    'sku': 'category',
+    'vendor_id': 'category',
+    'orders': np.int64,
+}
+
+# Incremental extracts (etl/incremental.py) also read each table's id column, the watermark
+ORDERS_ID_COLUMNS = ORDERS_COLUMNS  # already starts with order_id
+ANALYTICS_ID_COLUMNS = {'analytics_id': np.int64, **ANALYTICS_COLUMNS}
+INVENTORY_ID_COLUMNS = {'snapshot_id': np.int64, **INVENTORY_COLUMNS}
+
+# name -> {'rows', 'frame_mb', 'peak_rss_mb', 'peak_mb', 'seconds'} for the most recent call
+EXTRACT_MEMORY_REPORT = {}
+
+def _report_memory(name):
+    """
+    Decorator: record rows, frame size, peak RSS (and, with ETL_MEMORY_REPORT, peak traced
+    allocation) and duration of an extract.
+    """
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            tracing = ETL_MEMORY_REPORT and not tracemalloc.is_tracing()
+            if tracing:
+                tracemalloc.start()
+            elif ETL_MEMORY_REPORT:
+                tracemalloc.reset_peak()
+            started = time.time()
+            try:
+                df = fn(*args, **kwargs)
+            finally:
+                peak = tracemalloc.get_traced_memory()[1] if ETL_MEMORY_REPORT else 0
+                if tracing:
+                    tracemalloc.stop()
+            report = {
+                'rows': len(df),
+                'frame_mb': round(float(df.memory_usage(deep=True).sum()) / 2**20, 2),
+                # ru_maxrss is in kB on Linux; it is the process high-water mark, not per call
+                'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2**10, 2),
+                'peak_mb': round(peak / 2**20, 2) if ETL_MEMORY_REPORT else None,
+                'seconds': round(time.time() - started, 2),
+            }
+            EXTRACT_MEMORY_REPORT[name] = report
+            logger.info("extract %s: %d rows, frame %.2f MB, peak RSS %.2f MB, traced peak %s MB, %.2fs",
+                        name, report['rows'], report['frame_mb'], report['peak_rss_mb'], report['peak_mb'], report['seconds'])
+            return df
+        return wrapper
+    return decorator
+
+def _read_streaming(sql, params, columns: dict, chunk_rows=EXTRACT_CHUNK_ROWS):
+    """
+    Run sql on a pooled connection with an unbuffered server-side cursor and build a
+    DataFrame chunk by chunk with the dtypes in `columns` (the SELECT list must match).
+    """
+    names = list(columns)
+    parts = {c: [] for c in names}
+    # category columns: shared code table across chunks so nothing is re-encoded at the end
+    codes = {c: {} for c, t in columns.items() if t == 'category'}
     pool = SimpleMySQLPool.instance()
-    conn = pool.get_pandas_conn()
-    try:
-        if latest_only:
-            sql = """
-            SELECT i1.* FROM inventory i1
-            JOIN (
-                SELECT sku, MAX(snapshot_ts) as mx FROM inventory GROUP BY sku
-            ) i2 ON i1.sku = i2.sku AND i1.snapshot_ts = i2.mx
-            """
-            df = pd.read_sql(sql, conn)
+    with pool.connection() as conn:
+        with conn.cursor(pymysql.cursors.SSCursor) as cur:
+            cur.execute(sql, params)
+            while True:
+                rows = cur.fetchmany(chunk_rows)
+                if not rows:
+                    break
+                for i, c in enumerate(names):
+                    values = [r[i] for r in rows]
+                    kind = columns[c]
+                    if kind == 'category':
+                        table = codes[c]
+                        parts[c].append(np.fromiter((table.setdefault(v, len(table)) for v in values), dtype=np.int32, count=len(values)))
+                    elif kind == 'datetime':
+                        parts[c].append(pd.to_datetime(pd.Series(values, dtype=object), errors='coerce').values)
+                    elif kind is object:
+                        parts[c].append(np.array(values, dtype=object))
+                    elif np.issubdtype(kind, np.floating):
+                        # NULL stays missing (NaN), as before the narrow dtypes
+                        parts[c].append(np.array([np.nan if v is None else v for v in values], dtype=kind))
+                    else:
+                        # NULL counts become 0 so the narrow integer dtypes hold
+                        parts[c].append(np.array([0 if v is None else v for v in values], dtype=kind))
+    data = {}
+    for c in names:
+        kind = columns[c]
+        if kind == 'category':
+            table = codes[c]
+            merged = np.concatenate(parts[c]) if parts[c] else np.empty(0, dtype=np.int32)
+            categories = list(table)
+            data[c] = pd.Categorical.from_codes(merged, categories=categories) if categories else pd.Categorical([])
+        elif kind == 'datetime':
+            data[c] = np.concatenate(parts[c]) if parts[c] else np.empty(0, dtype='datetime64[ns]')
+        elif kind is object:
+            data[c] = np.concatenate(parts[c]) if parts[c] else np.empty(0, dtype=object)
         else:
-            df = pd.read_sql("SELECT * FROM inventory", conn)
-        return df
-    finally:
-        pool.close_pandas_conn(conn)
+            data[c] = np.concatenate(parts[c]) if parts[c] else np.empty(0, dtype=kind)
+        parts[c] = None
+    return pd.DataFrame(data, columns=names)
+
+@_report_memory("orders")
+def fetch_orders(since_days=60):
+    """
+    Orders of the last since_days days (all orders if None).
+    """
+    if raw_cache.RAW_CACHE_ENABLED:
+        return raw_cache.read_recent('orders', since_days, columns=list(ORDERS_COLUMNS))
+    if since_days is None:
+        return _read_streaming(f"SELECT {', '.join(ORDERS_COLUMNS)} FROM orders", None, ORDERS_COLUMNS)
+    sql = f"SELECT {', '.join(ORDERS_COLUMNS)} FROM orders WHERE order_ts >= DATE_SUB(NOW(), INTERVAL %s DAY)"
+    return _read_streaming(sql, (int(since_days),), ORDERS_COLUMNS)
 
+@_report_memory("inventory")
+def fetch_inventory_snapshot(latest_only=True):
+    if raw_cache.RAW_CACHE_ENABLED:
+        # cached history is bounded by RAW_CACHE_RETENTION_DAYS
+        inventory = raw_cache.read_recent('inventory', columns=list(INVENTORY_COLUMNS))
+        if latest_only and len(inventory):
+            latest = inventory.groupby('sku', observed=True)['snapshot_ts'].transform('max')
+            inventory = inventory[inventory['snapshot_ts'] == latest].reset_index(drop=True)
+        return inventory
+    cols = ", ".join(f"i1.{c}" for c in INVENTORY_COLUMNS)
+    if latest_only:
+        sql = f"""
+        SELECT {cols} FROM inventory i1
+        JOIN (
+            SELECT sku, MAX(snapshot_ts) as mx FROM inventory GROUP BY sku
+        ) i2 ON i1.sku = i2.sku AND i1.snapshot_ts = i2.mx
+        """
+    else:
+        sql = f"SELECT {cols} FROM inventory i1"
+    return _read_streaming(sql, None, INVENTORY_COLUMNS)
+
+@_report_memory("product_analytics")
 def fetch_product_analytics(since_days=60):
-    pool = SimpleMySQLPool.instance()
-    conn = pool.get_pandas_conn()
-    try:
-        sql = f"SELECT * FROM product_analytics WHERE event_ts >= DATE_SUB(NOW(), INTERVAL {since_days} DAY)"
-        df = pd.read_sql(sql, conn)
-        return df
-    finally:
-        pool.close_pandas_conn(conn)
+    if raw_cache.RAW_CACHE_ENABLED:
+        return raw_cache.read_recent('product_analytics', since_days, columns=list(ANALYTICS_COLUMNS))
+    sql = f"SELECT {', '.join(ANALYTICS_COLUMNS)} FROM product_analytics WHERE event_ts >= DATE_SUB(NOW(), INTERVAL %s DAY)"
+    return _read_streaming(sql, (int(since_days),), ANALYTICS_COLUMNS)
 
+@_report_memory("promotions")
 def fetch_promotions():
-    pool = SimpleMySQLPool.instance()
-    conn = pool.get_pandas_conn()
-    try:
-        df = pd.read_sql("SELECT * FROM promotions", conn)
-        return df
-    finally:
-        pool.close_pandas_conn(conn)
+    return _read_streaming(f"SELECT {', '.join(PROMOTIONS_COLUMNS)} FROM promotions", None, PROMOTIONS_COLUMNS)
+
+@_report_memory("orders_since")
+def fetch_orders_since(last_order_id, upto_order_id=None):
+    """
+    Orders with last_order_id < order_id <= upto_order_id (no upper bound if None).
+    """
+    sql = f"SELECT {', '.join(ORDERS_ID_COLUMNS)} FROM orders WHERE order_id > %s"
+    params = [int(last_order_id)]
+    if upto_order_id is not None:
+        sql += " AND order_id <= %s"
+        params.append(int(upto_order_id))
+    return _read_streaming(sql, tuple(params), ORDERS_ID_COLUMNS)
+
+@_report_memory("product_analytics_since")
+def fetch_product_analytics_since(last_analytics_id, upto_analytics_id=None):
+    sql = f"SELECT {', '.join(ANALYTICS_ID_COLUMNS)} FROM product_analytics WHERE analytics_id > %s"
+    params = [int(last_analytics_id)]
+    if upto_analytics_id is not None:
+        sql += " AND analytics_id <= %s"
+        params.append(int(upto_analytics_id))
+    return _read_streaming(sql, tuple(params), ANALYTICS_ID_COLUMNS)
+
+@_report_memory("inventory_since")
+def fetch_inventory_since(last_snapshot_id, upto_snapshot_id=None):
+    sql = f"SELECT {', '.join(INVENTORY_ID_COLUMNS)} FROM inventory WHERE snapshot_id > %s"
+    params = [int(last_snapshot_id)]
+    if upto_snapshot_id is not None:
+        sql += " AND snapshot_id <= %s"
+        params.append(int(upto_snapshot_id))
+    return _read_streaming(sql, tuple(params), INVENTORY_ID_COLUMNS)
+
+@_report_memory("orders_for_skus")
+def fetch_orders_for_skus(skus, since_days=None, sku_chunk=1000):
+    """
+    Orders of the given SKUs in the last since_days days (all history if None).
+    """
+    skus = [str(s) for s in skus]
+    if raw_cache.RAW_CACHE_ENABLED:
+        orders = raw_cache.read_recent('orders', since_days, columns=list(ORDERS_COLUMNS))
+        return orders[orders['sku'].isin(skus)].reset_index(drop=True)
+    window = "" if since_days is None else " AND order_ts >= DATE_SUB(NOW(), INTERVAL %s DAY)"
+    frames = []
+    for start in range(0, len(skus), sku_chunk):
+        chunk = skus[start:start + sku_chunk]
+        sql = f"SELECT {', '.join(ORDERS_COLUMNS)} FROM orders WHERE sku IN ({', '.join(['%s'] * len(chunk))}){window}"
+        params = tuple(chunk) + (() if since_days is None else (int(since_days),))
+        frames.append(_read_streaming(sql, params, ORDERS_COLUMNS))
+    if not frames:
+        return _read_streaming(f"SELECT {', '.join(ORDERS_COLUMNS)} FROM orders WHERE 1=0", None, ORDERS_COLUMNS)
+    # per-chunk categories differ; re-encode once
+    return pd.concat(frames, ignore_index=True).astype({'sku': 'category'})
+
+@_report_memory("sku_vendors")
+def fetch_sku_vendors(since_days=None):
+    """
+    Number of orders per (sku, vendor_id) in the last since_days days (all history if None),
+    orders without a vendor left out. Segmented training (segments.by: vendor) routes each
+    SKU by its most frequent vendor. Always read from MySQL: the raw cache keeps the
+    ORDERS_COLUMNS projection only.
+    """
+    window = "" if since_days is None else " AND order_ts >= DATE_SUB(NOW(), INTERVAL %s DAY)"
+    sql = (f"SELECT sku, vendor_id, COUNT(*) AS orders FROM orders WHERE vendor_id IS NOT NULL{window} "
+           "GROUP BY sku, vendor_id")
+    return _read_streaming(sql, None if since_days is None else (int(since_days),), SKU_VENDOR_COLUMNS)
+
+# Date-range extracts for the historical backfill (etl/backfill.py); bounds are inclusive
+@_report_memory("orders_between")
+def fetch_orders_between(start_ts, end_ts):
+    if raw_cache.RAW_CACHE_ENABLED:
+        raw_cache.refresh_table('orders')
+        return raw_cache.read_table('orders', start_ts, end_ts, columns=list(ORDERS_COLUMNS))
+    sql = f"SELECT {', '.join(ORDERS_COLUMNS)} FROM orders WHERE order_ts BETWEEN %s AND %s"
+    return _read_streaming(sql, (start_ts, end_ts), ORDERS_COLUMNS)
+
+@_report_memory("product_analytics_between")
+def fetch_product_analytics_between(start_ts, end_ts):
+    if raw_cache.RAW_CACHE_ENABLED:
+        raw_cache.refresh_table('product_analytics')
+        return raw_cache.read_table('product_analytics', start_ts, end_ts, columns=list(ANALYTICS_COLUMNS))
+    sql = f"SELECT {', '.join(ANALYTICS_COLUMNS)} FROM product_analytics WHERE event_ts BETWEEN %s AND %s"
+    return _read_streaming(sql, (start_ts, end_ts), ANALYTICS_COLUMNS)
+
+@_report_memory("inventory_between")
+def fetch_inventory_between(start_ts, end_ts):
+    if raw_cache.RAW_CACHE_ENABLED:
+        raw_cache.refresh_table('inventory')
+        return raw_cache.read_table('inventory', start_ts, end_ts, columns=list(INVENTORY_COLUMNS))
+    sql = f"SELECT {', '.join(INVENTORY_COLUMNS)} FROM inventory WHERE snapshot_ts BETWEEN %s AND %s"
+    return _read_streaming(sql, (start_ts, end_ts), INVENTORY_COLUMNS)
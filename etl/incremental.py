@@ -0,0 +1,356 @@
+# etl/incremental.py
+"""
+Incremental ETL: fold only new source rows into persisted per-SKU daily aggregates and
+refresh features_daily only for the SKUs whose features can have changed.
+
+State (db/schema.sql):
+- etl_watermarks: last processed order_id / analytics_id / snapshot_id per source table,
+  plus the feature_date and start time of the last features_daily refresh.
+- sku_daily_agg: quantity, revenue, analytics counts and latest order price per
+  (sku, agg_date), agg_date as defined by etl.transform.event_days.
+- sku_inventory_latest: latest inventory snapshot per SKU.
+
+A run:
+1. For each source table, reads rows with watermark < id <= MAX(id) (captured at the
+   start, so the range is stable), aggregates them per (sku, day) and adds them into
+   sku_daily_agg / sku_inventory_latest. The upsert and the new watermark commit in one
+   transaction, so a failed run is simply repeated.
+2. Collects the SKUs to recompute: aggregates or inventory updated since the last
+   refresh, SKUs with activity on the days that enter or leave a rolling window between
+   the last feature_date and as_of_date, and SKUs with a promotion active on as_of_date.
+   The first refresh, or a refresh for an earlier date, recomputes every SKU.
+3. Copies the other SKUs' rows from the last feature_date (inventory age advanced by the
+   elapsed days, promo_active re-evaluated in SQL), then rebuilds the recomputed SKUs
+   with build_features_from_daily and writes them with write_features_to_db.
+
+Source rows are assumed to be append-only with increasing ids; later edits to already
+processed rows are not picked up (use a full run, ETL_MODE=full, to rebuild).
+"""
+
+import os
+import logging
+from datetime import datetime, date, timedelta
+import numpy as np
+import pandas as pd
+
+from services.db_pool import SimpleMySQLPool
+from services.cache import invalidate, FEATURES_CACHE, LATEST_PRICE_CACHE
+from etl.extract import (fetch_orders_since, fetch_product_analytics_since, fetch_inventory_since,
+                         fetch_promotions)
+from etl.transform import (aggregate_daily_orders, aggregate_daily_analytics, build_features_from_daily,
+                           promo_rows_active, ROLLING_WINDOWS_DAYS, ANALYTICS_WINDOW_DAYS)
+from etl.load import load_features
+
+logger = logging.getLogger(__name__)
+
+FEATURES_WATERMARK = 'features_daily'
+UPSERT_CHUNK_ROWS = int(os.getenv("ETL_UPSERT_CHUNK_ROWS", 1000))
+SKU_QUERY_CHUNK = 1000
+
+# source table -> (id column, fetch function)
+SOURCES = {
+    'orders': ('order_id', fetch_orders_since),
+    'product_analytics': ('analytics_id', fetch_product_analytics_since),
+    'inventory': ('snapshot_id', fetch_inventory_since),
+}
+
+FEATURE_COLUMNS = ['feature_date', 'sku', 'sales_7d', 'sales_14d', 'sales_30d', 'avg_price_7d', 'avg_price_14d',
+                   'avg_price_30d', 'views_7d', 'addtocart_7d', 'conversion_7d', 'inventory_qty',
+                   'inventory_age_days', 'promo_active', 'last_price']
+
+ORDERS_UPSERT_SQL = """
+INSERT INTO sku_daily_agg (sku, agg_date, quantity, revenue, last_order_ts, last_price)
+VALUES (%s,%s,%s,%s,%s,%s)
+ON DUPLICATE KEY UPDATE
+    quantity = quantity + VALUES(quantity),
+    revenue = revenue + VALUES(revenue),
+    last_price = IF(last_order_ts IS NULL OR VALUES(last_order_ts) >= last_order_ts, VALUES(last_price), last_price),
+    last_order_ts = IF(last_order_ts IS NULL OR VALUES(last_order_ts) >= last_order_ts, VALUES(last_order_ts), last_order_ts)
+"""
+
+ANALYTICS_UPSERT_SQL = """
+INSERT INTO sku_daily_agg (sku, agg_date, views, add_to_cart, conversions)
+VALUES (%s,%s,%s,%s,%s)
+ON DUPLICATE KEY UPDATE
+    views = views + VALUES(views),
+    add_to_cart = add_to_cart + VALUES(add_to_cart),
+    conversions = conversions + VALUES(conversions)
+"""
+
+INVENTORY_UPSERT_SQL = """
+INSERT INTO sku_inventory_latest (sku, snapshot_id, snapshot_ts, qty_on_hand, qty_reserved)
+VALUES (%s,%s,%s,%s,%s)
+ON DUPLICATE KEY UPDATE
+    snapshot_id = IF(VALUES(snapshot_ts) >= snapshot_ts, VALUES(snapshot_id), snapshot_id),
+    qty_on_hand = IF(VALUES(snapshot_ts) >= snapshot_ts, VALUES(qty_on_hand), qty_on_hand),
+    qty_reserved = IF(VALUES(snapshot_ts) >= snapshot_ts, VALUES(qty_reserved), qty_reserved),
+    snapshot_ts = GREATEST(snapshot_ts, VALUES(snapshot_ts))
+"""
+
+def _py(value):
+    """
+    DB parameter from a NumPy / pandas scalar.
+    """
+    if value is None or (not isinstance(value, str) and pd.isna(value)):
+        return None
+    if isinstance(value, pd.Timestamp):
+        return value.to_pydatetime()
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+def _executemany(cur, sql, rows, chunk_rows=UPSERT_CHUNK_ROWS):
+    for start in range(0, len(rows), chunk_rows):
+        cur.executemany(sql, rows[start:start + chunk_rows])
+
+def read_watermarks(cur):
+    """
+    name -> {'last_id', 'last_date', 'last_ts'}
+    """
+    cur.execute("SELECT name, last_id, last_date, last_ts FROM etl_watermarks")
+    return {row['name']: row for row in cur.fetchall()}
+
+def set_watermark(cur, name, last_id=0, last_date=None, last_ts=None):
+    cur.execute(
+        "INSERT INTO etl_watermarks (name, last_id, last_date, last_ts) VALUES (%s,%s,%s,%s) "
+        "ON DUPLICATE KEY UPDATE last_id = VALUES(last_id), last_date = VALUES(last_date), last_ts = VALUES(last_ts)",
+        (name, int(last_id), last_date, last_ts),
+    )
+
+def _order_rows(orders_df):
+    daily = aggregate_daily_orders(orders_df)
+    return [(r.sku, r.agg_date.date(), _py(r.quantity), _py(r.revenue), _py(r.last_order_ts), _py(r.last_price))
+            for r in daily.itertuples(index=False)]
+
+def _analytics_rows(analytics_df):
+    daily = aggregate_daily_analytics(analytics_df)
+    return [(r.sku, r.agg_date.date(), _py(r.views), _py(r.add_to_cart), _py(r.conversions))
+            for r in daily.itertuples(index=False)]
+
+def _inventory_rows(inventory_df):
+    df = inventory_df.dropna(subset=['snapshot_ts']).sort_values(['snapshot_ts', 'snapshot_id'], kind='stable')
+    latest = df.assign(sku=np.asarray(df['sku'], dtype=object)).drop_duplicates('sku', keep='last')
+    return [(r.sku, _py(r.snapshot_id), _py(r.snapshot_ts), _py(r.qty_on_hand), _py(r.qty_reserved))
+            for r in latest.itertuples(index=False)]
+
+_ROW_BUILDERS = {
+    'orders': (_order_rows, ORDERS_UPSERT_SQL),
+    'product_analytics': (_analytics_rows, ANALYTICS_UPSERT_SQL),
+    'inventory': (_inventory_rows, INVENTORY_UPSERT_SQL),
+}
+
+def fold_rows(cur, table, df):
+    """
+    Add a frame of new source rows (extract dtypes, including the id column) into the
+    aggregate tables on cur's connection. Returns the number of aggregate rows written.
+    """
+    build_rows, sql = _ROW_BUILDERS[table]
+    rows = build_rows(df) if len(df) else []
+    _executemany(cur, sql, rows)
+    return len(rows)
+
+def ingest_table(table, upto_id=None):
+    """
+    Fold rows with watermark < id <= upto_id (default: current MAX(id)) of one source
+    table and advance its watermark in the same transaction.
+    Returns {'rows', 'aggregates', 'from_id', 'to_id'}.
+    """
+    id_col, fetch = SOURCES[table]
+    pool = SimpleMySQLPool.instance()
+    with pool.connection() as conn:
+        try:
+            with conn.cursor() as cur:
+                last_id = int(read_watermarks(cur).get(table, {}).get('last_id') or 0)
+                if upto_id is None:
+                    cur.execute(f"SELECT COALESCE(MAX({id_col}), 0) AS max_id FROM {table}")
+                    upto_id = int(cur.fetchone()['max_id'])
+                result = {'rows': 0, 'aggregates': 0, 'from_id': last_id, 'to_id': max(last_id, upto_id)}
+                if upto_id <= last_id:
+                    return result
+                df = fetch(last_id, upto_id)
+                result['rows'] = len(df)
+                result['aggregates'] = fold_rows(cur, table, df)
+                set_watermark(cur, table, upto_id)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    logger.info("incremental %s: ids %d..%d, %d rows -> %d aggregate rows",
+                table, result['from_id'] + 1, result['to_id'], result['rows'], result['aggregates'])
+    return result
+
+def _db_now(cur):
+    cur.execute("SELECT NOW() AS now")
+    return cur.fetchone()['now']
+
+def _boundary_day_ranges(prev_date, as_of_date, windows):
+    """
+    (first, last) agg_date ranges whose rows enter or leave a window when the feature date
+    moves from prev_date to as_of_date.
+    """
+    ranges = [(prev_date + timedelta(days=1), as_of_date)]
+    for w in windows:
+        first, last = prev_date - timedelta(days=w - 1), min(prev_date, as_of_date - timedelta(days=w))
+        if first <= last:
+            ranges.append((first, last))
+    return ranges
+
+def _skus_to_refresh(cur, watermark, as_of_date, windows, promotions_df):
+    """
+    Set of SKUs whose features_daily row for as_of_date must be recomputed, or None for all.
+    """
+    if not watermark or watermark.get('last_ts') is None or watermark.get('last_date') is None:
+        return None
+    prev_date = watermark['last_date']
+    if prev_date > as_of_date:
+        return None
+    since = watermark['last_ts']
+    skus = set()
+    cur.execute("SELECT sku FROM sku_daily_agg WHERE updated_at >= %s "
+                "UNION SELECT sku FROM sku_inventory_latest WHERE updated_at >= %s", (since, since))
+    skus.update(row['sku'] for row in cur.fetchall())
+    if prev_date < as_of_date:
+        ranges = _boundary_day_ranges(prev_date, as_of_date, windows)
+        where = " OR ".join(["agg_date BETWEEN %s AND %s"] * len(ranges))
+        cur.execute(f"SELECT DISTINCT sku FROM sku_daily_agg WHERE {where}", [d for r in ranges for d in r])
+        skus.update(row['sku'] for row in cur.fetchall())
+    if len(promotions_df):
+        active = promo_rows_active(promotions_df, as_of_date) & promotions_df['sku'].notna().values
+        skus.update(promotions_df.loc[active, 'sku'])
+    return skus
+
+def _carry_forward(cur, prev_date, as_of_date):
+    """
+    Copy features_daily rows of prev_date to as_of_date (existing rows are kept), advancing
+    inventory age by the elapsed days for SKUs that have an inventory snapshot.
+    """
+    select = []
+    for c in FEATURE_COLUMNS:
+        if c == 'feature_date':
+            select.append("%s")
+        elif c == 'inventory_age_days':
+            select.append("IF(i.sku IS NULL, 0, f.inventory_age_days + DATEDIFF(%s, f.feature_date))")
+        else:
+            select.append(f"f.{c}")
+    cur.execute(
+        f"INSERT IGNORE INTO features_daily ({', '.join(FEATURE_COLUMNS)}) SELECT {', '.join(select)} "
+        f"FROM features_daily f LEFT JOIN sku_inventory_latest i ON i.sku = f.sku WHERE f.feature_date = %s",
+        (as_of_date, as_of_date, prev_date),
+    )
+    return cur.rowcount
+
+def _refresh_promo_flags(cur, as_of_date):
+    """
+    Re-evaluate promo_active of every as_of_date row in SQL (same rule as
+    etl.transform.promo_rows_active).
+    """
+    end_ts = datetime.combine(as_of_date, datetime.min.time()) + timedelta(days=1, seconds=-1)
+    start_ts = end_ts - timedelta(days=ANALYTICS_WINDOW_DAYS)
+    cur.execute(
+        "UPDATE features_daily f SET promo_active = EXISTS("
+        " SELECT 1 FROM promotions p WHERE (p.sku IS NULL OR p.sku = f.sku)"
+        " AND p.start_ts <= %s AND p.end_ts >= %s) WHERE f.feature_date = %s",
+        (end_ts, start_ts, as_of_date),
+    )
+
+def select_chunked(cur, sql, skus, params=()):
+    """
+    Run sql (containing '{skus}' where the SKU filter goes) for all SKUs or in IN-list chunks.
+    """
+    if skus is None:
+        cur.execute(sql.format(skus="1=1"), params)
+        return list(cur.fetchall())
+    rows = []
+    skus = list(skus)
+    for start in range(0, len(skus), SKU_QUERY_CHUNK):
+        chunk = skus[start:start + SKU_QUERY_CHUNK]
+        cur.execute(sql.format(skus=f"sku IN ({', '.join(['%s'] * len(chunk))})"), tuple(params) + tuple(chunk))
+        rows.extend(cur.fetchall())
+    return rows
+
+def load_daily_state(cur, skus, as_of_date, max_window):
+    """
+    (daily_df, inventory_df) for build_features_from_daily: aggregate rows inside the
+    longest window plus each SKU's latest order day, and latest inventory snapshots.
+    skus None loads every SKU.
+    """
+    first_day = as_of_date - timedelta(days=max_window - 1)
+    window_rows = select_chunked(
+        cur, "SELECT sku, agg_date, quantity, revenue, views, add_to_cart, conversions, last_order_ts, last_price "
+             "FROM sku_daily_agg WHERE {skus} AND agg_date BETWEEN %s AND %s", skus, (first_day, as_of_date))
+    latest_rows = select_chunked(
+        cur, "SELECT a.sku, a.agg_date, a.last_order_ts, a.last_price FROM sku_daily_agg a JOIN ("
+             " SELECT sku, MAX(agg_date) AS agg_date FROM sku_daily_agg"
+             " WHERE {skus} AND last_order_ts IS NOT NULL GROUP BY sku) m"
+             " ON a.sku = m.sku AND a.agg_date = m.agg_date", skus)
+    inventory_rows = select_chunked(
+        cur, "SELECT sku, snapshot_ts, qty_on_hand, qty_reserved FROM sku_inventory_latest WHERE {skus}", skus)
+
+    columns = ['sku', 'agg_date', 'quantity', 'revenue', 'views', 'add_to_cart', 'conversions', 'last_order_ts', 'last_price']
+    daily = pd.DataFrame(window_rows, columns=columns)
+    # latest-order rows only carry last_price; their counts are already in the window rows or outside it
+    latest = pd.DataFrame(latest_rows, columns=['sku', 'agg_date', 'last_order_ts', 'last_price'])
+    latest = latest.assign(quantity=0.0, revenue=0.0, views=0.0, add_to_cart=0.0, conversions=0.0, agg_date=pd.NaT)
+    daily = pd.concat([daily, latest[columns]], ignore_index=True)
+    for c in ('quantity', 'revenue', 'views', 'add_to_cart', 'conversions', 'last_price'):
+        daily[c] = pd.to_numeric(daily[c], errors='coerce').astype(np.float64)
+    daily['agg_date'] = pd.to_datetime(daily['agg_date'])
+    daily['last_order_ts'] = pd.to_datetime(daily['last_order_ts'])
+    inventory = pd.DataFrame(inventory_rows, columns=['sku', 'snapshot_ts', 'qty_on_hand', 'qty_reserved'])
+    return daily, inventory
+
+def refresh_features(as_of_date, run_started, promotions_df=None):
+    """
+    Bring features_daily for as_of_date up to date from the aggregate tables.
+    Returns {'mode': 'full' | 'incremental', 'carried', 'recomputed'}.
+    """
+    promotions_df = fetch_promotions() if promotions_df is None else promotions_df
+    windows = sorted(set(ROLLING_WINDOWS_DAYS) | {ANALYTICS_WINDOW_DAYS})
+    pool = SimpleMySQLPool.instance()
+    with pool.connection() as conn:
+        try:
+            with conn.cursor() as cur:
+                watermark = read_watermarks(cur).get(FEATURES_WATERMARK)
+                skus = _skus_to_refresh(cur, watermark, as_of_date, windows, promotions_df)
+                carried = 0
+                if skus is not None and watermark['last_date'] < as_of_date:
+                    carried = _carry_forward(cur, watermark['last_date'], as_of_date)
+                    _refresh_promo_flags(cur, as_of_date)
+                daily, inventory = load_daily_state(cur, skus, as_of_date, max(windows))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    if skus is None or skus:
+        features = build_features_from_daily(daily, inventory, promotions_df, as_of_date,
+                                             skus=None if skus is None else sorted(skus))
+    else:
+        features = pd.DataFrame(columns=FEATURE_COLUMNS)
+    if not features.empty:
+        load_features(features)
+    with pool.connection() as conn:
+        with conn.cursor() as cur:
+            last_date = as_of_date if not watermark or not watermark.get('last_date') else max(as_of_date, watermark['last_date'])
+            set_watermark(cur, FEATURES_WATERMARK, 0, last_date, run_started)
+        conn.commit()
+    if carried:
+        invalidate(FEATURES_CACHE)
+        invalidate(LATEST_PRICE_CACHE)
+    result = {'mode': 'full' if skus is None else 'incremental', 'carried': carried, 'recomputed': len(features)}
+    logger.info("features_daily %s refresh for %s: %d carried forward, %d recomputed",
+                result['mode'], as_of_date, carried, result['recomputed'])
+    return result
+
+def run_incremental_etl(as_of_date=None):
+    """
+    Ingest new rows of every source table, then refresh features_daily for as_of_date
+    (default today). Returns a summary dict.
+    """
+    as_of_date = as_of_date or date.today()
+    pool = SimpleMySQLPool.instance()
+    with pool.connection() as conn:
+        with conn.cursor() as cur:
+            run_started = _db_now(cur)
+    summary = {table: ingest_table(table) for table in SOURCES}
+    summary['features'] = refresh_features(as_of_date, run_started)
+    return summary
@@ -0,0 +1,234 @@
+# etl/raw_cache.py
+"""
+Local columnar cache of the raw orders / product_analytics / inventory tables.
+
+Each table is stored under RAW_CACHE_DIR/<table>/ as one directory per calendar day of
+the event timestamp, holding one .npy file per column (sku as int32 codes into the
+table's append-only sku dictionary, timestamps as datetime64[ns], numbers in the extract
+dtypes). Readers memory-map only the columns and day partitions they ask for, so a
+90-day read of two columns touches just those files.
+
+refresh_table() appends rows above the cached id watermark (the same id columns the
+incremental ETL uses) and rewrites only the day partitions they land in. Partition
+directories are versioned and manifest.json is replaced atomically last, so a reader
+sees either the old or the new set of partitions. Partitions older than
+RAW_CACHE_RETENTION_DAYS, and rows without a timestamp, are not kept. Like the
+incremental ETL, the cache assumes append-only source rows; delete the table's
+directory to rebuild it.
+
+With RAW_CACHE_ENABLED=1, the windowed reads in etl.extract (used by the ETL, the
+backfill, training and monitoring) refresh the cache and read from it instead of
+querying MySQL for the full window.
+"""
+
+import os
+import json
+import fcntl
+import shutil
+import time
+import logging
+from contextlib import contextmanager
+from datetime import datetime, date, timedelta
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+RAW_CACHE_ENABLED = os.getenv("RAW_CACHE_ENABLED", "0").lower() in ("1", "true", "yes")
+RAW_CACHE_DIR = os.getenv("RAW_CACHE_DIR", "./data/raw_cache")
+RAW_CACHE_RETENTION_DAYS = int(os.getenv("RAW_CACHE_RETENTION_DAYS", 400))
+
+MANIFEST = "manifest.json"
+SKU_DICTIONARY = "sku.txt"
+
+def _tables():
+    # imported lazily: etl.extract reads through this module when the cache is enabled
+    from etl.extract import (ORDERS_ID_COLUMNS, ANALYTICS_ID_COLUMNS, INVENTORY_ID_COLUMNS, fetch_orders_since,
+                             fetch_product_analytics_since, fetch_inventory_since)
+    return {
+        'orders': ('order_id', 'order_ts', ORDERS_ID_COLUMNS, fetch_orders_since),
+        'product_analytics': ('analytics_id', 'event_ts', ANALYTICS_ID_COLUMNS, fetch_product_analytics_since),
+        'inventory': ('snapshot_id', 'snapshot_ts', INVENTORY_ID_COLUMNS, fetch_inventory_since),
+    }
+
+def _table_dir(table, cache_dir=None):
+    return os.path.join(cache_dir or RAW_CACHE_DIR, table)
+
+def read_manifest(table, cache_dir=None):
+    path = os.path.join(_table_dir(table, cache_dir), MANIFEST)
+    if not os.path.exists(path):
+        return {'last_id': 0, 'partitions': {}}
+    with open(path) as f:
+        return json.load(f)
+
+def _write_atomic(path, text):
+    tmp = f"{path}.tmp.{os.getpid()}"
+    with open(tmp, "w") as f:
+        f.write(text)
+    os.replace(tmp, path)
+
+def _read_dictionary(directory):
+    path = os.path.join(directory, SKU_DICTIONARY)
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return f.read().split("\n")[:-1]
+
+@contextmanager
+def _table_lock(directory):
+    """
+    Exclusive lock for refreshers of one table (readers do not lock).
+    """
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, ".lock"), "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+def _encode_skus(values, dictionary, index):
+    """
+    int32 codes for SKU values, appending unseen SKUs to dictionary / index in place.
+    """
+    values = np.asarray(values, dtype=object)
+    uniques, inverse = np.unique(values.astype(str), return_inverse=True)
+    codes = np.empty(len(uniques), dtype=np.int32)
+    for i, sku in enumerate(uniques):
+        code = index.get(sku)
+        if code is None:
+            code = index[sku] = len(dictionary)
+            dictionary.append(sku)
+        codes[i] = code
+    return codes[inverse]
+
+def _partition_arrays(df, columns, ts_col, dictionary, index):
+    """
+    column -> ndarray in cache layout for a frame of extract rows.
+    """
+    arrays = {}
+    for c, kind in columns.items():
+        if c == 'sku':
+            arrays[c] = _encode_skus(df[c], dictionary, index)
+        elif kind == 'datetime':
+            arrays[c] = pd.to_datetime(df[c], errors='coerce').values.astype('datetime64[ns]')
+        else:
+            arrays[c] = np.asarray(df[c], dtype=kind)
+    return arrays
+
+def refresh_table(table, cache_dir=None):
+    """
+    Append rows with id above the cached watermark. Returns {'rows', 'partitions', 'last_id'}.
+    """
+    id_col, ts_col, columns, fetch = _tables()[table]
+    directory = _table_dir(table, cache_dir)
+    with _table_lock(directory):
+        manifest = read_manifest(table, cache_dir)
+        new = fetch(manifest['last_id'])
+        result = {'rows': len(new), 'partitions': 0, 'last_id': manifest['last_id']}
+        retention_floor = (date.today() - timedelta(days=RAW_CACHE_RETENTION_DAYS)).isoformat()
+        expired = [d for d in manifest['partitions'] if d < retention_floor]
+        if not len(new) and not expired:
+            return result
+        dictionary = _read_dictionary(directory)
+        index = {sku: i for i, sku in enumerate(dictionary)}
+        known = len(dictionary)
+        arrays = _partition_arrays(new, columns, ts_col, dictionary, index)
+        # rows without a timestamp get no partition ('' sorts before any retention floor)
+        days = pd.Series(arrays[ts_col]).dt.strftime("%Y-%m-%d").fillna('').values.astype(str)
+        if len(dictionary) > known:
+            _write_atomic(os.path.join(directory, SKU_DICTIONARY), "".join(f"{s}\n" for s in dictionary))
+
+        partitions = dict(manifest['partitions'])
+        replaced = []
+        version = int(time.time() * 1000)
+        for day in np.unique(days[days >= retention_floor]):
+            rows = (days == day)
+            old = partitions.get(day)
+            part_dir = os.path.join(directory, f"date={day}.v{version}")
+            os.makedirs(part_dir)
+            for c in columns:
+                values = arrays[c][rows]
+                if old:
+                    values = np.concatenate([np.load(os.path.join(directory, old['dir'], f"{c}.npy")), values])
+                np.save(os.path.join(part_dir, f"{c}.npy"), values)
+            partitions[day] = {'dir': os.path.basename(part_dir), 'rows': int(rows.sum()) + (old['rows'] if old else 0)}
+            if old:
+                replaced.append(old['dir'])
+            result['partitions'] += 1
+        for day in expired:
+            replaced.append(partitions.pop(day)['dir'])
+
+        last_id = int(np.max(new[id_col])) if len(new) else manifest['last_id']
+        result['last_id'] = max(last_id, manifest['last_id'])
+        _write_atomic(os.path.join(directory, MANIFEST), json.dumps({
+            'last_id': result['last_id'], 'columns': list(columns), 'partitions': partitions,
+            'refreshed_at': datetime.now().isoformat(timespec='seconds'),
+        }, indent=1, sort_keys=True))
+        # readers holding memory maps of replaced files keep them until they close
+        for old_dir in replaced:
+            shutil.rmtree(os.path.join(directory, old_dir), ignore_errors=True)
+    logger.info("raw cache %s: +%d rows, %d partitions written, %d expired, last_id %d",
+                table, result['rows'], result['partitions'], len(expired), result['last_id'])
+    return result
+
+def read_table(table, start=None, end=None, columns=None, cache_dir=None):
+    """
+    Cached rows of a table with start <= ts <= end (either bound optional; dates or
+    datetimes), restricted to the given columns (default: all). sku is categorical.
+    Only the matching day partitions and requested columns are read, memory-mapped.
+    """
+    id_col, ts_col, table_columns, _ = _tables()[table]
+    directory = _table_dir(table, cache_dir)
+    manifest = read_manifest(table, cache_dir)
+    wanted = list(table_columns) if columns is None else list(columns)
+    load = wanted + ([ts_col] if ts_col not in wanted and (start is not None or end is not None) else [])
+    start_ts = pd.Timestamp(start) if start is not None else None
+    end_ts = pd.Timestamp(end) if end is not None else None
+    if end_ts is not None and isinstance(end, date) and not isinstance(end, datetime):
+        end_ts = end_ts + pd.Timedelta(days=1) - pd.Timedelta(seconds=1)
+    first_day = start_ts.strftime("%Y-%m-%d") if start_ts is not None else None
+    last_day = end_ts.strftime("%Y-%m-%d") if end_ts is not None else None
+
+    parts = {c: [] for c in load}
+    for day in sorted(manifest['partitions']):
+        if (first_day and day < first_day) or (last_day and day > last_day):
+            continue
+        part_dir = os.path.join(directory, manifest['partitions'][day]['dir'])
+        for c in load:
+            parts[c].append(np.load(os.path.join(part_dir, f"{c}.npy"), mmap_mode='r'))
+
+    data = {}
+    for c in load:
+        kind = table_columns[c]
+        if parts[c]:
+            data[c] = np.concatenate(parts[c])
+        else:
+            data[c] = np.empty(0, dtype=np.int32 if c == 'sku' else ('datetime64[ns]' if kind == 'datetime' else kind))
+    mask = None
+    if start_ts is not None:
+        mask = data[ts_col] >= start_ts.to_datetime64()
+    if end_ts is not None:
+        upper = data[ts_col] <= end_ts.to_datetime64()
+        mask = upper if mask is None else mask & upper
+    if mask is not None:
+        data = {c: v[mask] for c, v in data.items()}
+    if 'sku' in data:
+        dictionary = _read_dictionary(directory)
+        data['sku'] = pd.Categorical.from_codes(data['sku'], categories=dictionary) if dictionary else pd.Categorical([])
+    return pd.DataFrame({c: data[c] for c in wanted}, columns=wanted)
+
+def read_recent(table, since_days=None, columns=None):
+    """
+    Refresh the table's cache, then read the last since_days days (all cached rows if None).
+    """
+    refresh_table(table)
+    start = datetime.now() - timedelta(days=since_days) if since_days is not None else None
+    return read_table(table, start=start, columns=columns)
+
+def refresh_all():
+    return {table: refresh_table(table) for table in _tables()}
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    print(refresh_all())
@@ -2,14 +2,401 @@
 """
 Transform stage: compute rolling windows, lags, promotion flags, inventory aging, etc.
 Produces a DataFrame compatible with features_daily schema.
+
+build_features maps every SKU to a row index and every event to a day bucket counted back
+from as_of_date, scatters quantities, revenue and analytics counts into dense
+(SKU x day) matrices with np.bincount and takes prefix sums along the day axis, so each
+rolling window is a single column lookup and each lag a single bucket. The cost is
+O(rows + SKUs x days) instead of one full-frame filter per SKU.
+Windows default to feature_store.rolling_windows_days in config/config.yaml. Lag columns
+(sales_lag_{k}d) are only built when a caller passes lags: features_daily has no columns
+for them, so the default output keeps exactly the features_daily columns.
 """
 
 from datetime import datetime, timedelta, date
+import os
+import yaml
 import pandas as pd
 import numpy as np
 
-def build_features(orders_df, inventory_df, analytics_df, promotions_df, as_of_date=None):
+CONFIG_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), "config", "config.yaml")
+if os.path.exists(CONFIG_PATH):
+    with open(CONFIG_PATH, "r") as f:
+        FEATURE_CONFIG = (yaml.safe_load(f) or {}).get('feature_store', {})
+else:
+    FEATURE_CONFIG = {}
+
+ROLLING_WINDOWS_DAYS = [int(w) for w in FEATURE_CONFIG.get('rolling_windows_days', [7, 14, 30])]
+# config lag_days is not applied by default (see module docstring)
+LAG_DAYS = []
+# views / add-to-cart / conversion and the promo flag use a fixed 7-day window (model features)
+ANALYTICS_WINDOW_DAYS = 7
+
+_DAY_NS = 86400 * 10**9
+
+def _day_buckets(ts, end_ts):
+    """
+    Day bucket per timestamp: 0 for (end_ts - 1 day, end_ts], k for (end_ts - (k+1) days,
+    end_ts - k days]. An event is inside the w-day window [end_ts - w days, end_ts] exactly
+    when its bucket is < w. Events after end_ts or without a timestamp get -1.
+    """
+    ts = pd.to_datetime(pd.Series(ts), errors='coerce')
+    valid = ts.notna().values & (ts.values <= end_ts.to_datetime64())
+    age = (end_ts.to_datetime64() - ts.values.astype('datetime64[ns]')).astype(np.int64)
+    buckets = np.maximum((age + _DAY_NS - 1) // _DAY_NS - 1, 0)
+    return np.where(valid, buckets, -1)
+
+def _scatter(sku_codes, buckets, days, n_skus, weights):
+    """
+    Dense (n_skus x days) matrix of summed weights; rows outside the day range are dropped.
+    """
+    keep = (sku_codes >= 0) & (buckets >= 0) & (buckets < days)
+    flat = sku_codes[keep] * days + buckets[keep]
+    w = np.nan_to_num(np.asarray(weights, dtype=np.float64)[keep])
+    return np.bincount(flat, weights=w, minlength=n_skus * days).reshape(n_skus, days)
+
+def _latest_per_sku(df, ts_col, sku_index):
+    """
+    (row positions in df, sku codes) of each SKU's latest row by ts_col; rows without a
+    timestamp only win when the SKU has no other rows.
+    """
+    codes = sku_index.get_indexer(df['sku'])
+    ts = pd.to_datetime(df[ts_col], errors='coerce').values.astype('datetime64[ns]').astype(np.int64)
+    ts = np.where(pd.isna(df[ts_col]).values, np.iinfo(np.int64).min, ts)
+    order = np.lexsort((ts, codes))
+    codes_sorted = codes[order]
+    last = np.r_[codes_sorted[1:] != codes_sorted[:-1], True] & (codes_sorted >= 0)
+    return order[last], codes_sorted[last]
+
+def _resolve_windows(windows, lags):
+    windows = sorted(set(int(w) for w in (ROLLING_WINDOWS_DAYS if windows is None else windows)))
+    lags = sorted(set(int(k) for k in (LAG_DAYS if lags is None else lags)))
+    return windows, lags
+
+def _end_ts(as_of_date):
+    return pd.Timestamp(as_of_date) + pd.Timedelta(days=1) - pd.Timedelta(seconds=1)
+
+def _sku_universe(*columns):
+    skus = pd.Index(pd.unique(np.concatenate([np.asarray(c, dtype=object) for c in columns])))
+    return skus[skus.notna()]
+
+def _inventory_state(inventory_df, skus, end_ts):
+    """
+    (inventory_qty, inventory_age_days) per SKU from each SKU's latest snapshot.
+    """
+    n = len(skus)
+    inventory_qty = np.zeros(n, dtype=np.int64)
+    inventory_age_days = np.zeros(n, dtype=np.int64)
+    if len(inventory_df):
+        rows, codes = _latest_per_sku(inventory_df, 'snapshot_ts', skus)
+        latest = inventory_df.iloc[rows]
+        reserved = latest['qty_reserved'] if 'qty_reserved' in latest else 0
+        inventory_qty[codes] = np.nan_to_num(np.asarray(latest['qty_on_hand'] - reserved, dtype=np.float64)).astype(np.int64)
+        age = (end_ts - pd.to_datetime(latest['snapshot_ts'], errors='coerce')).dt.days
+        inventory_age_days[codes] = age.fillna(0).astype(np.int64).values
+    return inventory_qty, inventory_age_days
+
+def promo_rows_active(promotions_df, as_of_date):
+    """
+    Bool per promotion row: the promo overlaps the 7-day window ending on as_of_date.
+    """
+    end_ts = _end_ts(as_of_date)
+    start = pd.to_datetime(promotions_df['start_ts'], errors='coerce')
+    end = pd.to_datetime(promotions_df['end_ts'], errors='coerce')
+    return ((start <= end_ts) & (end >= end_ts - pd.Timedelta(days=ANALYTICS_WINDOW_DAYS))).values
+
+def promo_active_for(promotions_df, skus, as_of_date):
+    """
+    Bool per SKU: any promo for the SKU (or a global one, sku NULL) overlapping the 7-day
+    window ending on as_of_date.
+    """
+    active = promo_rows_active(promotions_df, as_of_date)
+    promo_sku = promotions_df['sku']
+    if np.any(active & promo_sku.isnull().values):
+        return np.ones(len(skus), dtype=bool)
+    return np.asarray(skus.isin(promo_sku[active & promo_sku.notna().values]), dtype=bool)
+
+def _assemble(as_of_date, skus, windows, lags, orders, analytics, inventory_qty, inventory_age_days,
+              last_price, promo_active):
+    """
+    Feature frame from per-event (or per-day) arrays. orders = (sku codes, day buckets,
+    quantity, revenue); analytics = (sku codes, day buckets, views, add_to_cart, conversions).
+    """
+    n = len(skus)
+    o_codes, o_buckets, quantity, revenue = orders
+    days = max(windows + [k + 1 for k in lags] + [1])
+    qty_daily = _scatter(o_codes, o_buckets, days, n, quantity)
+    qty_cum = np.cumsum(qty_daily, axis=1)
+    revenue_cum = np.cumsum(_scatter(o_codes, o_buckets, days, n, revenue), axis=1)
+
+    a_codes, a_buckets, views, add_to_cart, conversions = analytics
+    views_7d = _scatter(a_codes, a_buckets, ANALYTICS_WINDOW_DAYS, n, views).sum(axis=1)
+    addtocart_7d = _scatter(a_codes, a_buckets, ANALYTICS_WINDOW_DAYS, n, add_to_cart).sum(axis=1)
+    conversions_7d = _scatter(a_codes, a_buckets, ANALYTICS_WINDOW_DAYS, n, conversions).sum(axis=1)
+
+    features = {'feature_date': [as_of_date] * n, 'sku': skus.values}
+    with np.errstate(divide='ignore', invalid='ignore'):
+        conversion_7d = np.where(views_7d > 0, conversions_7d / np.where(views_7d > 0, views_7d, 1), 0.0)
+        for w in windows:
+            features[f'sales_{w}d'] = qty_cum[:, w - 1].astype(np.int64)
+        for w in windows:
+            features[f'avg_price_{w}d'] = np.nan_to_num(revenue_cum[:, w - 1] / qty_cum[:, w - 1], nan=0.0, posinf=np.inf, neginf=-np.inf)
+    features.update({
+        'views_7d': views_7d.astype(np.int64),
+        'addtocart_7d': addtocart_7d.astype(np.int64),
+        'conversion_7d': conversion_7d,
+        'inventory_qty': inventory_qty,
+        'inventory_age_days': inventory_age_days,
+        'promo_active': promo_active,
+        'last_price': last_price,
+    })
+    for k in lags:
+        features[f'sales_lag_{k}d'] = qty_daily[:, k].astype(np.int64)
+    return pd.DataFrame(features)
+
+def build_features(orders_df, inventory_df, analytics_df, promotions_df, as_of_date=None,
+                   windows=None, lags=None):
+    """
+    orders_df: columns: order_id, sku, order_ts, quantity, price
+    inventory_df: sku, snapshot_ts, qty_on_hand, qty_reserved
+    analytics_df: sku, event_ts, views, add_to_cart, conversions
+    promotions_df: promo_id, sku, start_ts, end_ts, discount_pct
+    as_of_date: datetime.date
+    windows: rolling windows in days for sales_{w}d / avg_price_{w}d (default ROLLING_WINDOWS_DAYS)
+    lags: days back for sales_lag_{k}d, units sold on the day k days before as_of_date (default none)
+    """
+    if as_of_date is None:
+        as_of_date = datetime.utcnow().date()
+    windows, lags = _resolve_windows(windows, lags)
+    end_ts = _end_ts(as_of_date)
+    skus = _sku_universe(orders_df['sku'], analytics_df['sku'], inventory_df['sku'], promotions_df['sku'].dropna())
+
+    quantity = np.asarray(orders_df['quantity'], dtype=np.float64)
+    price = np.asarray(orders_df['price'], dtype=np.float64)
+    orders = (skus.get_indexer(orders_df['sku']), _day_buckets(orders_df['order_ts'], end_ts), quantity, price * quantity)
+    analytics = (skus.get_indexer(analytics_df['sku']), _day_buckets(analytics_df['event_ts'], end_ts),
+                 analytics_df['views'], analytics_df['add_to_cart'], analytics_df['conversions'])
+    inventory_qty, inventory_age_days = _inventory_state(inventory_df, skus, end_ts)
+
+    # Last order price (latest order overall, not windowed)
+    last_price = np.zeros(len(skus), dtype=np.float64)
+    if len(orders_df):
+        rows, codes = _latest_per_sku(orders_df, 'order_ts', skus)
+        last_price[codes] = np.nan_to_num(price[rows], nan=0.0)
+
+    return _assemble(as_of_date, skus, windows, lags, orders, analytics, inventory_qty, inventory_age_days,
+                     last_price, promo_active_for(promotions_df, skus, as_of_date))
+
+def event_days(ts):
+    """
+    Feature day of each timestamp: (day - 1) 23:59:59 <= ts < day 23:59:59, the day
+    buckets build_features uses. Windows built from these days match build_features
+    except for events stamped exactly as_of_date 23:59:59, which build_features also
+    counts (its windows are closed at both ends). NaT stays NaT.
+    """
+    ts = pd.to_datetime(pd.Series(ts), errors='coerce')
+    return (ts + pd.Timedelta(seconds=1)).dt.floor('D').where(ts.notna())
+
+def aggregate_daily_orders(orders_df):
+    """
+    Per (sku, agg_date) order totals: quantity, revenue, and the price / time of the
+    latest order that day. Rows without a timestamp are dropped.
+    """
+    df = pd.DataFrame({
+        'sku': np.asarray(orders_df['sku'], dtype=object),
+        'agg_date': event_days(orders_df['order_ts']).values,
+        'order_ts': pd.to_datetime(orders_df['order_ts'], errors='coerce').values,
+        'quantity': np.nan_to_num(np.asarray(orders_df['quantity'], dtype=np.float64)),
+        'price': np.asarray(orders_df['price'], dtype=np.float64),
+    }).dropna(subset=['sku', 'agg_date'])
+    df['revenue'] = np.nan_to_num(df['price'].values * df['quantity'].values)
+    df = df.sort_values('order_ts', kind='stable')
+    grouped = df.groupby(['sku', 'agg_date'], sort=False)
+    out = grouped.agg(quantity=('quantity', 'sum'), revenue=('revenue', 'sum'),
+                      last_order_ts=('order_ts', 'last'), last_price=('price', 'last')).reset_index()
+    return out
+
+def aggregate_daily_analytics(analytics_df):
+    """
+    Per (sku, agg_date) sums of views, add_to_cart and conversions.
+    """
+    df = pd.DataFrame({
+        'sku': np.asarray(analytics_df['sku'], dtype=object),
+        'agg_date': event_days(analytics_df['event_ts']).values,
+        'views': np.nan_to_num(np.asarray(analytics_df['views'], dtype=np.float64)),
+        'add_to_cart': np.nan_to_num(np.asarray(analytics_df['add_to_cart'], dtype=np.float64)),
+        'conversions': np.nan_to_num(np.asarray(analytics_df['conversions'], dtype=np.float64)),
+    }).dropna(subset=['sku', 'agg_date'])
+    return df.groupby(['sku', 'agg_date'], sort=False).sum().reset_index()
+
+def build_features_from_daily(daily_df, inventory_df, promotions_df, as_of_date, skus=None,
+                              windows=None, lags=None):
+    """
+    Same features as build_features, from per-SKU daily aggregates (sku_daily_agg rows:
+    sku, agg_date, quantity, revenue, views, add_to_cart, conversions, last_order_ts,
+    last_price) and each SKU's latest inventory snapshot. daily_df must hold every row
+    of the SKUs inside the longest window plus each SKU's latest order day.
+    skus: SKUs to build rows for (default: every SKU in the inputs).
+    """
+    windows, lags = _resolve_windows(windows, lags)
+    end_ts = _end_ts(as_of_date)
+    if skus is None:
+        skus = _sku_universe(daily_df['sku'], inventory_df['sku'], promotions_df['sku'].dropna())
+    else:
+        skus = pd.Index(pd.unique(np.asarray(skus, dtype=object)))
+    codes = skus.get_indexer(daily_df['sku'])
+    agg_date = pd.to_datetime(daily_df['agg_date']).values.astype('datetime64[D]')
+    buckets = (np.datetime64(pd.Timestamp(as_of_date).date(), 'D') - agg_date).astype(np.int64)
+    orders = (codes, buckets, daily_df['quantity'], daily_df['revenue'])
+    analytics = (codes, buckets, daily_df['views'], daily_df['add_to_cart'], daily_df['conversions'])
+    inventory_qty, inventory_age_days = _inventory_state(inventory_df, skus, end_ts)
+
+    last_price = np.zeros(len(skus), dtype=np.float64)
+    with_orders = daily_df[daily_df['last_order_ts'].notna()]
+    if len(with_orders):
+        rows, row_codes = _latest_per_sku(with_orders, 'last_order_ts', skus)
+        last_price[row_codes] = np.nan_to_num(np.asarray(with_orders['last_price'], dtype=np.float64)[rows], nan=0.0)
+
+    return _assemble(as_of_date, skus, windows, lags, orders, analytics, inventory_qty, inventory_age_days,
+                     last_price, promo_active_for(promotions_df, skus, as_of_date))
+
+def _day_index(ts, first_day):
+    """
+    Column index of each timestamp's event_days day relative to first_day (NaT -> -1).
+    Also returns the timestamps as int64 ns.
+    """
+    days = event_days(ts)
+    index = ((days - pd.Timestamp(first_day)) // pd.Timedelta(days=1)).fillna(-1).astype(np.int64).values
+    ts_ns = pd.to_datetime(pd.Series(ts), errors='coerce').values.astype('datetime64[ns]').astype(np.int64)
+    return index, ts_ns
+
+def _latest_rank(codes, index, ts_ns, n, n_days):
+    """
+    (n x n_days) int64 matrix: position (in ts order) of each SKU's latest row at or
+    before each day, -1 if none. Rows before the first day count as day 0.
+    """
+    valid = (codes >= 0) & (index < n_days) & (ts_ns != np.iinfo(np.int64).min)
+    order = np.argsort(ts_ns, kind='stable')
+    rank = np.empty(len(ts_ns), dtype=np.int64)
+    rank[order] = np.arange(len(ts_ns))
+    latest = np.full((n, n_days), -1, dtype=np.int64)
+    np.maximum.at(latest, (codes[valid], np.maximum(index[valid], 0)), rank[valid])
+    return np.maximum.accumulate(latest, axis=1), order
+
+def _take(values, rank):
+    """
+    values[rank] with rank -1 (no row) mapped to 0 / the first value.
+    """
+    if len(values) == 0:
+        return np.zeros(rank.shape, dtype=values.dtype)
+    return values[np.maximum(rank, 0)]
+
+def build_features_range(orders_df, inventory_df, analytics_df, promotions_df, start_date, end_date,
+                         windows=None, lags=None):
+    """
+    Features for every date in [start_date, end_date] in one pass: build_features' columns
+    with one row per (feature_date, sku) for SKUs seen in any input at or before that date.
+    Point in time: inventory and last_price use the latest snapshot / order at or before
+    each date's end, so the frames can span the whole range (plus the longest window of
+    history before start_date). Days follow event_days.
+    """
+    windows, lags = _resolve_windows(windows, lags)
+    dates = pd.date_range(pd.Timestamp(start_date), pd.Timestamp(end_date), freq='D')
+    n_dates = len(dates)
+    history = max(windows + [k + 1 for k in lags] + [ANALYTICS_WINDOW_DAYS])
+    first_day = dates[0] - pd.Timedelta(days=history - 1)
+    n_days = n_dates + history - 1
+    skus = _sku_universe(orders_df['sku'], analytics_df['sku'], inventory_df['sku'])
+    n = len(skus)
+    if n == 0 or n_dates == 0:
+        return pd.DataFrame()
+    ends = (dates + pd.Timedelta(days=1) - pd.Timedelta(seconds=1)).values.astype('datetime64[ns]').astype(np.int64)
+
+    o_codes = skus.get_indexer(orders_df['sku'])
+    o_index, o_ts = _day_index(orders_df['order_ts'], first_day)
+    quantity = np.asarray(orders_df['quantity'], dtype=np.float64)
+    price = np.asarray(orders_df['price'], dtype=np.float64)
+    qty_daily = _scatter(o_codes, o_index, n_days, n, quantity)
+    zero = np.zeros((n, 1))
+    qty_cum = np.hstack([zero, np.cumsum(qty_daily, axis=1)])
+    revenue_cum = np.hstack([zero, np.cumsum(_scatter(o_codes, o_index, n_days, n, price * quantity), axis=1)])
+
+    a_codes = skus.get_indexer(analytics_df['sku'])
+    a_index, a_ts = _day_index(analytics_df['event_ts'], first_day)
+    analytics_cum = {c: np.hstack([zero, np.cumsum(_scatter(a_codes, a_index, n_days, n, analytics_df[c]), axis=1)])
+                     for c in ('views', 'add_to_cart', 'conversions')}
+
+    cols = np.arange(history - 1, n_days)  # day column of each feature date
+    def window_sum(cum, w):
+        return cum[:, cols + 1] - cum[:, cols + 1 - w]
+
+    # latest order / snapshot at or before each date
+    order_rank, order_sorted = _latest_rank(o_codes, o_index, o_ts, n, n_days)
+    order_rank = order_rank[:, cols]
+    last_price = np.where(order_rank >= 0, np.nan_to_num(_take(price[order_sorted], order_rank)), 0.0)
+    i_codes = skus.get_indexer(inventory_df['sku'])
+    i_index, i_ts = _day_index(inventory_df['snapshot_ts'], first_day)
+    inv_rank, inv_sorted = _latest_rank(i_codes, i_index, i_ts, n, n_days)
+    inv_rank = inv_rank[:, cols]
+    has_inv = inv_rank >= 0
+    reserved = np.asarray(inventory_df['qty_reserved'], dtype=np.float64) if 'qty_reserved' in inventory_df else np.zeros(len(inventory_df))
+    on_hand = np.nan_to_num(np.asarray(inventory_df['qty_on_hand'], dtype=np.float64) - reserved)
+    inventory_qty = np.where(has_inv, _take(on_hand[inv_sorted], inv_rank), 0).astype(np.int64)
+    snapshot_ns = _take(i_ts[inv_sorted], inv_rank)
+    inventory_age_days = np.where(has_inv, (ends[None, :] - snapshot_ns) // _DAY_NS, 0).astype(np.int64)
+
+    # promo_active via a difference array over the dates each promo is active on
+    promo_diff = np.zeros((n + 1, n_dates + 1), dtype=np.int32)
+    start = pd.to_datetime(promotions_df['start_ts'], errors='coerce').values.astype('datetime64[ns]')
+    end = pd.to_datetime(promotions_df['end_ts'], errors='coerce').values.astype('datetime64[ns]')
+    ok = ~(np.isnat(start) | np.isnat(end))
+    first = np.searchsorted(ends, start[ok].astype(np.int64), side='left')
+    last = np.searchsorted(ends, (end[ok] + np.timedelta64(ANALYTICS_WINDOW_DAYS, 'D')).astype(np.int64), side='right')
+    promo_sku = promotions_df['sku'][ok]
+    promo_codes = np.where(promo_sku.isnull().values, n, skus.get_indexer(promo_sku.fillna('')))
+    keep = (promo_codes >= 0) & (first < last)
+    np.add.at(promo_diff, (promo_codes[keep], first[keep]), 1)
+    np.add.at(promo_diff, (promo_codes[keep], last[keep]), -1)
+    promo_active = np.cumsum(promo_diff, axis=1)[:, :n_dates] > 0
+    promo_active = promo_active[:n] | promo_active[n]  # row n: global promos
+
+    # rows only from the first day a SKU appears in any input
+    seen = np.zeros((n, n_days), dtype=bool)
+    for codes, index, ts_ns in ((o_codes, o_index, o_ts), (a_codes, a_index, a_ts), (i_codes, i_index, i_ts)):
+        valid = (codes >= 0) & (ts_ns != np.iinfo(np.int64).min) & (index < n_days)
+        seen[codes[valid], np.maximum(index[valid], 0)] = True
+    present = np.logical_or.accumulate(seen, axis=1)[:, cols]
+    sku_pos, date_pos = np.nonzero(present.T)[::-1]
+
+    def flat(matrix):
+        return matrix[sku_pos, date_pos]
+
+    features = {'feature_date': dates.date[date_pos], 'sku': skus.values[sku_pos]}
+    with np.errstate(divide='ignore', invalid='ignore'):
+        sums = {w: (window_sum(qty_cum, w), window_sum(revenue_cum, w)) for w in windows}
+        for w in windows:
+            features[f'sales_{w}d'] = flat(sums[w][0]).astype(np.int64)
+        for w in windows:
+            features[f'avg_price_{w}d'] = np.nan_to_num(flat(sums[w][1]) / flat(sums[w][0]), nan=0.0, posinf=np.inf, neginf=-np.inf)
+        views = flat(window_sum(analytics_cum['views'], ANALYTICS_WINDOW_DAYS))
+        conversions = flat(window_sum(analytics_cum['conversions'], ANALYTICS_WINDOW_DAYS))
+        features['views_7d'] = views.astype(np.int64)
+        features['addtocart_7d'] = flat(window_sum(analytics_cum['add_to_cart'], ANALYTICS_WINDOW_DAYS)).astype(np.int64)
+        features['conversion_7d'] = np.where(views > 0, conversions / np.where(views > 0, views, 1), 0.0)
+    features.update({
+        'inventory_qty': flat(inventory_qty),
+        'inventory_age_days': flat(inventory_age_days),
+        'promo_active': flat(promo_active),
+        'last_price': flat(last_price),
+    })
+    for k in lags:
+        features[f'sales_lag_{k}d'] = flat(qty_daily[:, cols - k]).astype(np.int64)
+    return pd.DataFrame(features)
+
+def build_features_legacy(orders_df, inventory_df, analytics_df, promotions_df, as_of_date=None):
     """
+    Per-SKU reference implementation (filters the full frames once per SKU). Kept for the
+    parity check in scripts/bench_build_features.py; use build_features.
     orders_df: columns: order_id, sku, order_ts, quantity, price
     inventory_df: sku, snapshot_ts, qty_on_hand, qty_reserved
     analytics_df: sku, event_ts, views, add_to_cart, conversions
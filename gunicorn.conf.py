@@ -0,0 +1,53 @@
+# gunicorn.conf.py
+"""
+gunicorn settings for the pricing API: gunicorn -c gunicorn.conf.py app:app
+(or api.asgi:app with WEB_WORKER_CLASS=uvicorn_worker.UvicornWorker)
+
+app.py is imported once in the master (preload_app), which loads the demand model,
+segment index, suggestion snapshot and config.yaml; workers are forked from it and share
+that memory copy-on-write. The hooks below close the master's DB connections and threads
+before forking (app.before_fork), give every worker its own pool, writer and model watcher
+(app.init_worker), and drop an exited worker's metrics (services.metrics.mark_worker_dead).
+
+Multi-worker metrics need PROMETHEUS_MULTIPROC_DIR; its files from a previous run are
+removed here, before the app is imported.
+"""
+
+import glob
+import multiprocessing
+import os
+
+bind = f"{os.getenv('FLASK_HOST', '0.0.0.0')}:{os.getenv('FLASK_PORT', '8000')}"
+workers = int(os.getenv("WEB_WORKERS", multiprocessing.cpu_count()))
+# a few threads per worker overlap the DB lookups of live (non-snapshot) requests;
+# api.asgi:app runs with WEB_WORKER_CLASS=uvicorn_worker.UvicornWorker (WEB_THREADS is then unused)
+worker_class = os.getenv("WEB_WORKER_CLASS", "gthread")
+threads = int(os.getenv("WEB_THREADS", 4))
+preload_app = True
+timeout = int(os.getenv("WEB_TIMEOUT_SEC", 30))
+graceful_timeout = 30
+keepalive = 5
+# recycle workers after this many requests (0 = never); jitter keeps them from restarting together
+max_requests = int(os.getenv("WEB_MAX_REQUESTS", 0))
+max_requests_jitter = max_requests // 10
+accesslog = os.getenv("WEB_ACCESS_LOG") or None
+
+_metrics_dir = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+if _metrics_dir:
+    os.makedirs(_metrics_dir, exist_ok=True)
+    for _path in glob.glob(os.path.join(_metrics_dir, "*.db")):
+        os.remove(_path)
+
+def when_ready(server):
+    from app import before_fork
+    if workers > 1 and not _metrics_dir:
+        server.log.warning("PROMETHEUS_MULTIPROC_DIR is not set: /metrics will only show the worker that serves the scrape")
+    before_fork()
+
+def post_fork(server, worker):
+    from app import init_worker
+    init_worker()
+
+def child_exit(server, worker):
+    from services.metrics import mark_worker_dead
+    mark_worker_dead(worker.pid)
@@ -1,35 +1,212 @@
 # models/model_utils.py
 """
 Utilities for saving/loading model artifacts, versions, and metadata.
+
+Registry layout under a model directory (e.g. models_artifacts/demand):
+
+    <name>/<version>/model.joblib   immutable once published (model.ubj for XGBoost
+    <name>/<version>/meta.json      Boosters, saved in XGBoost's own format)
+    <name>/CURRENT                  the version readers load
+
+publish_model() writes a version into a temporary directory and renames it into place,
+then switches CURRENT with an atomic os.replace, so a reader always gets a complete
+version. Flat <name>.joblib (or <name>.xgb) / <name>.meta.json files from before the
+registry are still loaded when <name>/CURRENT does not exist.
+
+Segmented demand models (models.train_demand.train_and_save_segmented) are ordinary
+registry entries named <name>.<segment>; <name>.segments is a published dict routing
+SKUs to them (see route_segment).
 """
 
 import os
 import json
+import shutil
+import zlib
 from datetime import datetime
 import joblib
 from typing import Dict
 
+CURRENT_POINTER = "CURRENT"
+MODEL_FILE = "model.joblib"
+XGBOOST_MODEL_FILE = "model.ubj"
+META_FILE = "meta.json"
+# published versions kept per model (CURRENT is never pruned)
+MODEL_REGISTRY_KEEP_VERSIONS = int(os.getenv("MODEL_REGISTRY_KEEP_VERSIONS", 10))
+
+SEGMENT_INDEX_SUFFIX = ".segments"
+
 def ensure_dir(path):
     os.makedirs(path, exist_ok=True)
 
-def save_model(model, path, name, metadata: dict):
-    ensure_dir(path)
-    model_path = os.path.join(path, f"{name}.joblib")
-    meta_path = os.path.join(path, f"{name}.meta.json")
-    joblib.dump(model, model_path)
+def _registry_dir(path, name):
+    return os.path.join(path, name)
+
+def current_version(path, name):
+    """
+    Version CURRENT points to, or None if the model has no registry yet.
+    """
+    try:
+        with open(os.path.join(_registry_dir(path, name), CURRENT_POINTER)) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+def list_versions(path, name):
+    """
+    Published versions, oldest first (version ids sort chronologically).
+    """
+    root = _registry_dir(path, name)
+    if not os.path.isdir(root):
+        return []
+    return sorted(v for v in os.listdir(root)
+                  if not v.startswith('.') and os.path.isfile(os.path.join(root, v, META_FILE)))
+
+def set_current(path, name, version):
+    """
+    Atomically point CURRENT at an already published version.
+    """
+    root = _registry_dir(path, name)
+    if not os.path.isfile(os.path.join(root, version, META_FILE)):
+        raise FileNotFoundError(f"Model version not found: {name}/{version}")
+    tmp = os.path.join(root, f".{CURRENT_POINTER}.{os.getpid()}")
+    with open(tmp, "w") as f:
+        f.write(version + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, os.path.join(root, CURRENT_POINTER))
+
+def artifact_format(model):
+    """
+    'xgboost' for XGBoost Boosters (not reliably picklable across versions), else 'joblib'.
+    """
+    if type(model).__module__.startswith('xgboost') and hasattr(model, 'save_raw'):
+        return 'xgboost'
+    return 'joblib'
+
+def _dump(model, directory):
+    if artifact_format(model) == 'xgboost':
+        model.save_model(os.path.join(directory, XGBOOST_MODEL_FILE))
+    else:
+        joblib.dump(model, os.path.join(directory, MODEL_FILE))
+
+def _load_artifact(model_path):
+    if model_path.endswith(('.ubj', '.xgb', '.json')):
+        import xgboost as xgb
+        booster = xgb.Booster()
+        booster.load_model(model_path)
+        return booster
+    return joblib.load(model_path)
+
+def _new_version(root):
+    version = datetime.utcnow().strftime("%Y%m%dT%H%M%S%f")
+    suffix = 0
+    candidate = version
+    while os.path.exists(os.path.join(root, candidate)):
+        suffix += 1
+        candidate = f"{version}-{suffix}"
+    return candidate
+
+def publish_model(model, path, name, metadata: dict, make_current=True):
+    """
+    Write model + metadata as a new immutable version; point CURRENT at it unless
+    make_current is False. Returns the version id (also stored as metadata['version']).
+    """
+    root = _registry_dir(path, name)
+    ensure_dir(root)
+    version = _new_version(root)
+    metadata['version'] = version
     metadata['saved_at'] = datetime.utcnow().isoformat()
-    with open(meta_path, "w") as f:
-        json.dump(metadata, f, indent=2)
-    return model_path, meta_path
+    metadata['artifact_format'] = artifact_format(model)
+    staging = os.path.join(root, f".staging-{version}-{os.getpid()}")
+    ensure_dir(staging)
+    try:
+        _dump(model, staging)
+        with open(os.path.join(staging, META_FILE), "w") as f:
+            json.dump(metadata, f, indent=2)
+        os.rename(staging, os.path.join(root, version))
+    except Exception:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+    if make_current:
+        set_current(path, name, version)
+    prune_versions(path, name)
+    return version
+
+def prune_versions(path, name, keep=None):
+    """
+    Delete the oldest versions beyond `keep`, never the current one.
+    """
+    keep = MODEL_REGISTRY_KEEP_VERSIONS if keep is None else keep
+    current = current_version(path, name)
+    versions = [v for v in list_versions(path, name) if v != current]
+    excess = len(versions) - max(keep - (1 if current else 0), 0)
+    for version in versions[:max(excess, 0)]:
+        shutil.rmtree(os.path.join(_registry_dir(path, name), version), ignore_errors=True)
+
+def save_model(model, path, name, metadata: dict):
+    """
+    Publish model as the new current version. Returns (model_path, meta_path).
+    """
+    version = publish_model(model, path, name, metadata)
+    return artifact_paths(path, name, version)
 
-def load_model(path, name):
-    model_path = os.path.join(path, f"{name}.joblib")
-    meta_path = os.path.join(path, f"{name}.meta.json")
+def artifact_paths(path, name, version=None):
+    """
+    (model_path, meta_path) of a version (default: CURRENT, falling back to the flat
+    pre-registry files).
+    """
+    version = version or current_version(path, name)
+    if version is not None:
+        root = os.path.join(_registry_dir(path, name), version)
+        candidates, meta_path = [MODEL_FILE, XGBOOST_MODEL_FILE], os.path.join(root, META_FILE)
+    else:
+        root = path
+        candidates, meta_path = [f"{name}.joblib", f"{name}.xgb"], os.path.join(path, f"{name}.meta.json")
+    for candidate in candidates:
+        if os.path.exists(os.path.join(root, candidate)):
+            return os.path.join(root, candidate), meta_path
+    return os.path.join(root, candidates[0]), meta_path
+
+def load_metadata(path, name, version=None):
+    meta_path = artifact_paths(path, name, version)[1]
+    if not os.path.exists(meta_path):
+        return {}
+    with open(meta_path, "r") as f:
+        return json.load(f)
+
+def load_model(path, name, version=None):
+    """
+    Load (model, metadata) for a version (default: CURRENT, falling back to the flat
+    pre-registry files).
+    """
+    version = version or current_version(path, name)
+    model_path, _ = artifact_paths(path, name, version)
     if not os.path.exists(model_path):
         raise FileNotFoundError(f"Model file not found: {model_path}")
-    model = joblib.load(model_path)
-    metadata = {}
-    if os.path.exists(meta_path):
-        with open(meta_path, "r") as f:
-            metadata = json.load(f)
-    return model, metadata
+    model = _load_artifact(model_path)
+    return model, load_metadata(path, name, version)
+
+def segment_model_name(name, segment):
+    return f"{name}.{segment}"
+
+def segment_index_name(name):
+    return f"{name}{SEGMENT_INDEX_SUFFIX}"
+
+def sku_hash_segment(sku, buckets):
+    """
+    Stable hash bucket of a SKU ('h00'..), the same in every process and Python version.
+    """
+    return f"h{zlib.crc32(str(sku).encode()) % int(buckets):02d}"
+
+def route_segment(index, sku):
+    """
+    Segment whose model serves `sku` under a segment index, or None for the global model.
+    index: {'by', 'buckets', 'skus': {sku: segment}, 'segments': {segment: version}}.
+    """
+    if not index or not index.get('segments'):
+        return None
+    if index.get('by') == 'sku_hash':
+        segment = sku_hash_segment(sku, index['buckets'])
+    else:
+        segment = index['skus'].get(str(sku))
+    return segment if segment in index['segments'] else None
@@ -2,12 +2,27 @@
 """
 Train demand model (LightGBM or XGBoost) to predict units given features including price.
 Saves model artifact and metadata.
+
+Warm start (train_and_save_incremental / --warm-start): continue boosting the current
+LightGBM artifact with init_model on the features_daily rows newer than its
+trained_through date. The result is published as a new registry version
+(models/model_utils.py) and only becomes CURRENT if its error on the new rows'
+validation split is not worse than the previous model's by more than
+DEMAND_WARM_START_MAX_REGRESSION.
+
+Segmented training (train_and_save_segmented, models.demand.segments in config.yaml):
+besides the global model, one model per SKU segment (SKU hash bucket, vendor, or any
+per-SKU column such as a category) with enough rows, plus a segment index the serving
+side uses to route each SKU (services.prediction_service.SegmentModelCache).
 """
 
 import pandas as pd
 import numpy as np
 import os
-from models.model_utils import save_model
+import re
+import logging
+from models.model_utils import (save_model, load_model, load_metadata, publish_model, current_version,
+                                segment_model_name, segment_index_name, sku_hash_segment)
 import json
 from datetime import datetime
 from sklearn.model_selection import train_test_split
@@ -28,6 +43,18 @@ DEFAULT_PARAMS = {
     'num_boost_round': 500,
     'early_stopping_rounds': 50,
 }
+DEFAULT_MODEL_DIR = "./models_artifacts/demand"
+# boosting rounds added per warm start (params.warm_start_rounds in config.yaml overrides)
+WARM_START_ROUNDS = 100
+# relative MSE increase on the new rows' validation split a warm-started model may have
+# over the previous model and still replace it
+DEMAND_WARM_START_MAX_REGRESSION = float(os.getenv("DEMAND_WARM_START_MAX_REGRESSION", 0.05))
+DEMAND_WARM_START_MIN_ROWS = int(os.getenv("DEMAND_WARM_START_MIN_ROWS", 100))
+# segments.buckets / segments.min_rows defaults (config.yaml overrides)
+SEGMENT_HASH_BUCKETS = 16
+SEGMENT_MIN_ROWS = 1000
+
+logger = logging.getLogger(__name__)
 
 def prepare_training_data(features_df, orders_df):
     """
@@ -48,12 +75,8 @@ def prepare_training_data(features_df, orders_df):
     y = df['label']
     return X, y, feature_cols
 
-def train_lightgbm(X, y, params, model_name="demand_model", model_dir="./models_artifacts/demand"):
-    import lightgbm as lgb
-    X_train, X_val, y_train, y_val = train_test_split(X, y, test_size=0.2, random_state=42)
-    dtrain = lgb.Dataset(X_train, label=y_train)
-    dvalid = lgb.Dataset(X_val, label=y_val, reference=dtrain)
-    lgb_params = {
+def _lightgbm_params(params):
+    return {
         'objective': 'regression',
         'metric': 'l2',
         'verbosity': -1,
@@ -61,6 +84,13 @@ def train_lightgbm(X, y, params, model_name="demand_model", model_dir="./models_
         'learning_rate': params.get('learning_rate', 0.05),
         'num_leaves': int(params.get('num_leaves', 31))
     }
+
+def train_lightgbm(X, y, params, model_name="demand_model", model_dir=DEFAULT_MODEL_DIR, extra_meta=None):
+    import lightgbm as lgb
+    X_train, X_val, y_train, y_val = train_test_split(X, y, test_size=0.2, random_state=42)
+    dtrain = lgb.Dataset(X_train, label=y_train)
+    dvalid = lgb.Dataset(X_val, label=y_val, reference=dtrain)
+    lgb_params = _lightgbm_params(params)
     callbacks = [lgb.early_stopping(stopping_rounds=int(params.get('early_stopping_rounds', 50)))]
     model = lgb.train(
         lgb_params,
@@ -77,13 +107,14 @@ def train_lightgbm(X, y, params, model_name="demand_model", model_dir="./models_
         'mape': float(mape),
         'mse': float(mse),
         'trained_at': datetime.utcnow().isoformat(),
-        'feature_columns': X.columns.tolist()
+        'feature_columns': X.columns.tolist(),
+        **(extra_meta or {})
     }
     os.makedirs(model_dir, exist_ok=True)
     model_path, meta_path = save_model(model, model_dir, model_name, meta)
     return model, meta
 
-def train_xgboost(X, y, params, model_name="demand_xgb", model_dir="./models_artifacts/demand"):
+def train_xgboost(X, y, params, model_name="demand_model", model_dir=DEFAULT_MODEL_DIR, extra_meta=None):
     import xgboost as xgb
     X_train, X_val, y_train, y_val = train_test_split(X, y, test_size=0.2, random_state=42)
     dtrain = xgb.DMatrix(X_train, label=y_train)
@@ -103,7 +134,8 @@ def train_xgboost(X, y, params, model_name="demand_xgb", model_dir="./models_art
         evals_result=evals_result,
         verbose_eval=False
     )
-    y_pred = model.predict(dvalid)
+    best_iteration = int(getattr(model, 'best_iteration', model.num_boosted_rounds() - 1))
+    y_pred = model.predict(dvalid, iteration_range=(0, best_iteration + 1))
     mape = mean_absolute_percentage_error(y_val, y_pred)
     mse = mean_squared_error(y_val, y_pred)
     meta = {
@@ -111,34 +143,246 @@ def train_xgboost(X, y, params, model_name="demand_xgb", model_dir="./models_art
         'mape': float(mape),
         'mse': float(mse),
         'trained_at': datetime.utcnow().isoformat(),
-        'feature_columns': X.columns.tolist()
+        'feature_columns': X.columns.tolist(),
+        'best_iteration': best_iteration,
+        **(extra_meta or {})
     }
-    os.makedirs(model_dir, exist_ok=True)
-    # xgboost objects are not picklable via joblib by default; use save_model
-    model_path = os.path.join(model_dir, f"{model_name}.xgb")
-    model.save_model(model_path)
-    with open(os.path.join(model_dir, f"{model_name}.meta.json"), "w") as f:
-        json.dump(meta, f, indent=2)
+    # the registry stores XGBoost Boosters in XGBoost's own format (model.ubj)
+    save_model(model, model_dir, model_name, meta)
     return model, meta
 
-def train_and_save(features_df, orders_df, config):
+def _trained_through(features_df):
+    """
+    Latest feature_date in the training rows (ISO date), recorded for warm starts.
+    """
+    if 'feature_date' not in features_df.columns or features_df.empty:
+        return {}
+    return {'trained_through': pd.to_datetime(features_df['feature_date']).max().date().isoformat()}
+
+def train_and_save(features_df, orders_df, config, model_dir=DEFAULT_MODEL_DIR, model_name="demand_model"):
     X, y, feature_cols = prepare_training_data(features_df, orders_df)
     model_type = config.get('model_type', 'lightgbm')
     params = config.get('params', {})
-    if model_type == 'lightgbm':
-        model, meta = train_lightgbm(X, y, params)
+    trainer = train_lightgbm if model_type == 'lightgbm' else train_xgboost
+    model, meta = trainer(X, y, params, model_name=model_name, model_dir=model_dir,
+                          extra_meta=_trained_through(features_df))
+    return model, meta
+
+def _segment_id(value):
+    """
+    Registry-safe segment id for a column value (letters, digits, '_' and '-').
+    """
+    return re.sub(r'[^A-Za-z0-9_-]+', '_', str(value)).strip('_') or None
+
+def _orders_window_days(orders_df):
+    """
+    Days covered by the orders frame (from its oldest order_ts to now), None if unknown.
+    """
+    if orders_df is None or 'order_ts' not in orders_df.columns or orders_df.empty:
+        return None
+    oldest = pd.to_datetime(orders_df['order_ts']).min()
+    return None if pd.isna(oldest) else (datetime.now() - oldest).days + 1
+
+def segment_assignments(features_df, orders_df, by, buckets=SEGMENT_HASH_BUCKETS, sku_vendors=None):
+    """
+    Series sku -> segment id. by: 'sku_hash' (stable crc32 bucket), 'vendor' (orders.vendor_id)
+    or the name of any other column in features_df or orders_df, e.g. a category column; a
+    SKU with several values gets its most frequent one. SKUs without a value are left out.
+
+    The orders extract does not carry vendor_id, so for 'vendor' the per-SKU vendor order
+    counts come from sku_vendors (sku, vendor_id, orders), by default
+    etl.extract.fetch_sku_vendors over the orders frame's window.
+    """
+    skus = features_df['sku'].astype(str).unique()
+    if by == 'sku_hash':
+        return pd.Series([sku_hash_segment(sku, buckets) for sku in skus], index=skus, dtype=object)
+    column = 'vendor_id' if by == 'vendor' else by
+    source = features_df if column in features_df.columns else orders_df
+    weights = None
+    if (source is None or column not in source.columns) and by == 'vendor':
+        if sku_vendors is None:
+            from etl.extract import fetch_sku_vendors
+            sku_vendors = fetch_sku_vendors(since_days=_orders_window_days(orders_df))
+        source, weights = sku_vendors, 'orders'
+    if source is None or column not in source.columns:
+        raise ValueError(f"segment column '{column}' not found in features or orders")
+    pairs = source[['sku', column]].dropna().astype(str)
+    if weights is None:
+        counts = pairs.value_counts()
     else:
-        model, meta = train_xgboost(X, y, params)
+        counts = source.loc[pairs.index, weights].groupby([pairs['sku'], pairs[column]]).sum()
+        counts = counts.sort_values(ascending=False, kind='stable')
+    # counts are sorted by frequency, so the first row per SKU is its most frequent value
+    top = counts.reset_index().drop_duplicates('sku')
+    return pd.Series(top[column].map(_segment_id).values, index=top['sku'].values, dtype=object).dropna()
+
+def train_and_save_segmented(features_df, orders_df, config, model_dir=DEFAULT_MODEL_DIR, model_name="demand_model",
+                             sku_vendors=None):
+    """
+    Train the global model, then one model per segment (config['segments']: by, buckets,
+    min_rows) with at least min_rows training rows, and publish the segment index
+    <model_name>.segments that routes SKUs to them. SKUs in smaller segments, or without
+    a segment, are served by the global model. Without segments.by only the global model
+    is trained, and an existing index is replaced by an empty one so servers stop routing.
+    sku_vendors is passed to segment_assignments for segments.by: vendor.
+    Returns (global meta, index meta or None).
+    """
+    seg_cfg = config.get('segments') or {}
+    by = seg_cfg.get('by')
+    by = None if by in (None, '', 'none') else by
+    _, global_meta = train_and_save(features_df, orders_df, config, model_dir, model_name)
+    index_name = segment_index_name(model_name)
+    if by is None:
+        if current_version(model_dir, index_name) is None:
+            return global_meta, None
+        index_meta = {'segment_by': None, 'segments': {}, 'global_version': global_meta.get('version')}
+        publish_model({'by': None, 'buckets': None, 'skus': {}, 'segments': {}}, model_dir, index_name, index_meta)
+        return global_meta, index_meta
+
+    buckets = int(seg_cfg.get('buckets', SEGMENT_HASH_BUCKETS))
+    min_rows = int(seg_cfg.get('min_rows', SEGMENT_MIN_ROWS))
+    assignments = segment_assignments(features_df, orders_df, by, buckets, sku_vendors)
+    row_segments = features_df['sku'].astype(str).map(assignments)
+    trainer = train_lightgbm if config.get('model_type', 'lightgbm') == 'lightgbm' else train_xgboost
+    params = config.get('params', {})
+    segments = {}
+    for segment, rows in features_df.groupby(row_segments, sort=True):
+        if len(rows) < min_rows:
+            logger.info(f"Segment {segment}: {len(rows)} rows (minimum {min_rows}), served by the global model")
+            continue
+        X, y, _ = prepare_training_data(rows, orders_df)
+        try:
+            _, meta = trainer(X, y, params, model_name=segment_model_name(model_name, segment), model_dir=model_dir,
+                              extra_meta={'segment': segment, **_trained_through(rows)})
+        except Exception:
+            logger.exception(f"Training segment {segment} failed, its SKUs fall back to the global model")
+            continue
+        segments[segment] = {'version': meta['version'], 'rows': int(len(rows)),
+                             'mse': meta['mse'], 'mape': meta['mape']}
+
+    routed = assignments[assignments.isin(list(segments))]
+    index = {
+        'by': by,
+        'buckets': buckets,
+        # hash buckets are computed from the SKU at serving time, including for new SKUs
+        'skus': {} if by == 'sku_hash' else dict(zip(routed.index, routed.values)),
+        'segments': {segment: info['version'] for segment, info in segments.items()},
+    }
+    index_meta = {
+        'segment_by': by,
+        'buckets': buckets,
+        'min_rows': min_rows,
+        'segments': segments,
+        'skus_routed': int(len(routed)),
+        'skus_global': int(features_df['sku'].astype(str).nunique() - len(routed)),
+        'global_version': global_meta.get('version'),
+        'trained_at': datetime.utcnow().isoformat(),
+    }
+    publish_model(index, model_dir, index_name, index_meta)
+    return global_meta, index_meta
+
+def warm_start_lightgbm(X, y, params, model_name="demand_model", model_dir=DEFAULT_MODEL_DIR, extra_meta=None):
+    """
+    Continue boosting the saved model on (X, y). Returns (model, meta); meta['promoted']
+    says whether the serving artifact was replaced.
+    """
+    import lightgbm as lgb
+    previous, previous_meta = load_model(model_dir, model_name)
+    if previous_meta.get('model_type', 'lightgbm') != 'lightgbm':
+        raise ValueError("warm start needs a LightGBM demand model")
+    if list(previous_meta.get('feature_columns', X.columns)) != X.columns.tolist():
+        raise ValueError("feature columns changed since the last full training; retrain from scratch")
+    # continue from the trees serving actually uses, not the ones past the early-stopping optimum
+    best = getattr(previous, 'best_iteration', 0) or 0
+    base = previous
+    if 0 < best < previous.current_iteration():
+        base = lgb.Booster(model_str=previous.model_to_string(num_iteration=best))
+
+    X_train, X_val, y_train, y_val = train_test_split(X, y, test_size=0.2, random_state=42)
+    dtrain = lgb.Dataset(X_train, label=y_train)
+    dvalid = lgb.Dataset(X_val, label=y_val, reference=dtrain)
+    rounds = int(params.get('warm_start_rounds', WARM_START_ROUNDS))
+    callbacks = [lgb.early_stopping(stopping_rounds=int(params.get('early_stopping_rounds', 50)))]
+    model = lgb.train(
+        _lightgbm_params(params),
+        dtrain,
+        num_boost_round=rounds,
+        init_model=base,
+        valid_sets=[dvalid],
+        callbacks=callbacks
+    )
+    y_pred = model.predict(X_val, num_iteration=model.best_iteration)
+    y_prev = base.predict(X_val)
+    mse = mean_squared_error(y_val, y_pred)
+    previous_mse = mean_squared_error(y_val, y_prev)
+    promoted = bool(mse <= previous_mse * (1.0 + DEMAND_WARM_START_MAX_REGRESSION))
+    meta = {
+        'model_type': 'lightgbm',
+        'mape': float(mean_absolute_percentage_error(y_val, y_pred)),
+        'mse': float(mse),
+        'previous_mape': float(mean_absolute_percentage_error(y_val, y_prev)),
+        'previous_mse': float(previous_mse),
+        'trained_at': datetime.utcnow().isoformat(),
+        'feature_columns': X.columns.tolist(),
+        'warm_start_from': previous_meta.get('version') or previous_meta.get('saved_at'),
+        'warm_start_rows': int(len(X)),
+        'rounds_added': int((model.best_iteration or model.current_iteration()) - base.current_iteration()),
+        'promoted': promoted,
+        **(extra_meta or {})
+    }
+    publish_model(model, model_dir, model_name, meta, make_current=promoted)
     return model, meta
 
+def train_and_save_incremental(features_df, orders_df, config, model_dir=DEFAULT_MODEL_DIR, model_name="demand_model"):
+    """
+    Warm-start the current demand model on features_df rows after its trained_through date.
+    Returns (model, meta), or (None, {'skipped': reason}) when there is nothing to do.
+    """
+    if config.get('model_type', 'lightgbm') != 'lightgbm':
+        return None, {'skipped': "warm start is only supported for LightGBM; run a full training"}
+    since = load_metadata(model_dir, model_name).get('trained_through')
+    if since is None:
+        return None, {'skipped': "current model has no trained_through date; run a full training"}
+    new_rows = features_df[pd.to_datetime(features_df['feature_date']) > pd.Timestamp(since)]
+    if len(new_rows) < DEMAND_WARM_START_MIN_ROWS:
+        return None, {'skipped': f"{len(new_rows)} new feature rows since {since} (minimum {DEMAND_WARM_START_MIN_ROWS})"}
+    X, y, feature_cols = prepare_training_data(new_rows, orders_df)
+    meta_extra = _trained_through(new_rows)
+    return warm_start_lightgbm(X, y, config.get('params', {}), model_name=model_name, model_dir=model_dir,
+                               extra_meta=meta_extra)
+
+def fetch_new_feature_rows(model_dir=DEFAULT_MODEL_DIR, model_name="demand_model"):
+    """
+    features_daily rows after the current model's trained_through date (all rows if unknown).
+    """
+    from services.db_pool import SimpleMySQLPool
+    since = load_metadata(model_dir, model_name).get('trained_through')
+    pool = SimpleMySQLPool.instance()
+    conn = pool.get_pandas_conn()
+    try:
+        if since is None:
+            return pd.read_sql("SELECT * FROM features_daily", conn)
+        return pd.read_sql("SELECT * FROM features_daily WHERE feature_date > %s", conn, params=(since,))
+    finally:
+        pool.close_pandas_conn(conn)
+
 if __name__ == "__main__":
     # CLI training example. This expects features_daily to be populated in DB.
+    import sys
     from services.db_pool import SimpleMySQLPool
+    from etl.extract import fetch_orders
+    if "--warm-start" in sys.argv[1:]:
+        import yaml
+        with open(os.path.join("config", "config.yaml")) as f:
+            demand_cfg = yaml.safe_load(f)['models']['demand']
+        model, meta = train_and_save_incremental(fetch_new_feature_rows(), None, demand_cfg)
+        print("Warm-start metadata:", meta)
+        sys.exit(0)
     pool = SimpleMySQLPool.instance()
     conn = pool.get_conn()
     try:
         features_df = pd.read_sql("SELECT * FROM features_daily", conn)
-        orders_df = pd.read_sql("SELECT * FROM orders WHERE order_ts >= DATE_SUB(NOW(), INTERVAL 90 DAY)", conn)
+        orders_df = fetch_orders(since_days=90)
     finally:
         pool.return_conn(conn)
 
@@ -1,17 +1,44 @@
 # models/train_elasticity.py
 """
-Train per-SKU elasticity using log-log OLS (statsmodels).
+Train per-SKU elasticity using log-log OLS: log(q) ~ const + log(price) on daily sales.
 Saves results into elasticity_results table.
+
+compute_elasticities() fits every SKU at once: orders are aggregated to SKU x day once,
+and slope, R^2, p-value and sample size come from per-SKU sums of centred log price and
+log quantity (np.bincount over the SKU codes). compute_elasticity_for_sku() is the
+statsmodels reference for a single SKU (scripts/bench_elasticity.py checks parity).
+
+refresh_changed_elasticities() is the incremental mode: it refits only the SKUs with
+orders above the order_id watermark of the previous refresh (etl_watermarks, name
+'elasticity_results'), over their last ELASTICITY_HISTORY_DAYS days of orders, and
+upserts only those rows. The first refresh fits every SKU.
 """
 
 import pandas as pd
 import numpy as np
 import statsmodels.api as sm
+from scipy import stats
 from services.db_pool import SimpleMySQLPool
+from services.cache import invalidate, ELASTICITY_CACHE
 from datetime import datetime
 from models.model_utils import save_model
 import os
 import json
+import time
+import argparse
+import logging
+
+logger = logging.getLogger(__name__)
+
+MIN_SAMPLE_DAYS = 5
+LOG_EPS = 1e-6
+PERSIST_CHUNK_ROWS = 1000
+ELASTICITY_WATERMARK = 'elasticity_results'
+# order history each incremental refit uses (the training scripts pass 180 days of orders)
+ELASTICITY_HISTORY_DAYS = int(os.getenv("ELASTICITY_HISTORY_DAYS", 180))
+# SKUs whose daily price never moves have no price signal (statsmodels' add_constant
+# would even drop the intercept for them); they get no elasticity row
+_CONSTANT_PRICE_RTOL = 1e-9
 
 def compute_elasticity_for_sku(orders_df, sku, min_sales_threshold=20):
     """
@@ -22,20 +49,20 @@ def compute_elasticity_for_sku(orders_df, sku, min_sales_threshold=20):
     if df.empty:
         return None
 
-    # Aggregate at daily level
+    # Aggregate at daily level; price is the quantity-weighted average price of the day
     df['order_date'] = pd.to_datetime(df['order_ts']).dt.date
-    daily = df.groupby('order_date').agg({
-        'quantity': 'sum',
-        'price': lambda s: (s * df.loc[s.index, 'quantity']).sum() / s.sum() if s.sum() > 0 else np.nan
-    }).rename(columns={'quantity': 'q', 'price': 'price'}).reset_index()
+    df['revenue'] = df['price'].astype(float) * df['quantity']
+    daily = df.groupby('order_date').agg(q=('quantity', 'sum'), revenue=('revenue', 'sum')).reset_index()
+    daily['price'] = daily['revenue'] / daily['q'].where(daily['q'] > 0)
     daily = daily.dropna()
-    if daily['q'].sum() < min_sales_threshold or daily.shape[0] < 5:
+    if daily['q'].sum() < min_sales_threshold or daily.shape[0] < MIN_SAMPLE_DAYS:
+        return None
+    if np.ptp(daily['price'].values) <= _CONSTANT_PRICE_RTOL * daily['price'].abs().max():
         return None
 
     # log transform, add small eps
-    eps = 1e-6
-    daily['log_q'] = np.log(daily['q'] + eps)
-    daily['log_price'] = np.log(daily['price'] + eps)
+    daily['log_q'] = np.log(daily['q'] + LOG_EPS)
+    daily['log_price'] = np.log(daily['price'] + LOG_EPS)
 
     X = sm.add_constant(daily[['log_price']])
     y = daily['log_q']
@@ -46,7 +73,81 @@ def compute_elasticity_for_sku(orders_df, sku, min_sales_threshold=20):
     r2 = float(model.rsquared)
     sample_size = len(daily)
 
-    return dict(elasticity=coef, r_squared=r2, p_value=pval, sample_size=sample_size, model_summary=model.summary().as_text())
+    return dict(elasticity=coef, r_squared=r2, p_value=pval, sample_size=sample_size)
+
+def daily_sales(orders_df):
+    """
+    SKU x day aggregates of the orders: (sku values, sku code per row, q, price) with one
+    row per SKU and day that sold, sorted by SKU code. price is quantity-weighted.
+    """
+    ts = pd.to_datetime(orders_df['order_ts'], errors='coerce')
+    codes, skus = pd.factorize(orders_df['sku'])
+    valid = ts.notna().values & (codes >= 0)
+    codes = codes[valid]
+    day = ts.values[valid].astype('datetime64[D]').astype(np.int64)
+    quantity = np.asarray(orders_df['quantity'], dtype=np.float64)[valid]
+    revenue = np.asarray(orders_df['price'], dtype=np.float64)[valid] * quantity
+    if not len(codes):
+        return np.asarray(skus, dtype=object), np.empty(0, dtype=np.int64), np.empty(0), np.empty(0)
+
+    span = int(day.max() - day.min()) + 1
+    key = codes.astype(np.int64) * span + (day - day.min())
+    key_index, keys = pd.factorize(key, sort=True)
+    q = np.bincount(key_index, weights=quantity, minlength=len(keys))
+    rev = np.bincount(key_index, weights=revenue, minlength=len(keys))
+    sold = q > 0
+    return np.asarray(skus, dtype=object), (keys // span)[sold], q[sold], rev[sold] / q[sold]
+
+def compute_elasticities(orders_df, min_sales_threshold=20):
+    """
+    Elasticity of every SKU with at least min_sales_threshold units over at least
+    MIN_SAMPLE_DAYS selling days. Returns a DataFrame with sku, elasticity, r_squared,
+    p_value, sample_size (same values as compute_elasticity_for_sku).
+    """
+    skus, g, q, price = daily_sales(orders_df)
+    columns = ['sku', 'elasticity', 'r_squared', 'p_value', 'sample_size']
+    if not len(g):
+        return pd.DataFrame(columns=columns)
+    m = len(skus)
+    x = np.log(price + LOG_EPS)
+    y = np.log(q + LOG_EPS)
+
+    n = np.bincount(g, minlength=m).astype(np.float64)
+    units = np.bincount(g, weights=q, minlength=m)
+    # g is sorted, so each SKU's days are contiguous
+    starts = np.searchsorted(g, np.arange(m))
+    has_days = n > 0
+    price_min = np.full(m, np.nan)
+    price_max = np.full(m, np.nan)
+    price_min[has_days] = np.minimum.reduceat(price, starts[has_days])
+    price_max[has_days] = np.maximum.reduceat(price, starts[has_days])
+    fit = (units >= min_sales_threshold) & (n >= MIN_SAMPLE_DAYS) & \
+          (price_max - price_min > _CONSTANT_PRICE_RTOL * np.abs(price_max))
+    if not fit.any():
+        return pd.DataFrame(columns=columns)
+
+    # centred sums (two passes) keep the precision of statsmodels' least squares
+    with np.errstate(divide='ignore', invalid='ignore'):
+        dx = x - (np.bincount(g, weights=x, minlength=m) / n)[g]
+        dy = y - (np.bincount(g, weights=y, minlength=m) / n)[g]
+        sxx = np.bincount(g, weights=dx * dx, minlength=m)
+        sxy = np.bincount(g, weights=dx * dy, minlength=m)
+        syy = np.bincount(g, weights=dy * dy, minlength=m)
+        slope = sxy / sxx
+        resid = dy - slope[g] * dx
+        ssr = np.bincount(g, weights=resid * resid, minlength=m)
+        df_resid = n - 2
+        r2 = 1.0 - ssr / syy
+        t = slope / np.sqrt(ssr / df_resid / sxx)
+        p = 2.0 * stats.t.sf(np.abs(t), df_resid)
+
+    return pd.DataFrame({
+        'sku': skus[fit],
+        'elasticity': slope[fit],
+        'r_squared': r2[fit],
+        'p_value': p[fit],
+        'sample_size': n[fit].astype(np.int64),
+    }, columns=columns)
 
 def persist_elasticity_results(results):
     """
@@ -55,28 +156,21 @@ def persist_elasticity_results(results):
     pool = SimpleMySQLPool.instance()
     conn = pool.get_conn()
     try:
+        sql = """
+        REPLACE INTO elasticity_results (sku, elasticity, r_squared, p_value, sample_size, last_computed)
+        VALUES (%s,%s,%s,%s,%s,NOW())
+        """
+        rows = [(r['sku'], r['elasticity'], r['r_squared'], r['p_value'], r['sample_size']) for r in results]
         with conn.cursor() as cur:
-            for r in results:
-                sql = """
-                REPLACE INTO elasticity_results (sku, elasticity, r_squared, p_value, sample_size, last_computed)
-                VALUES (%s,%s,%s,%s,%s,NOW())
-                """
-                cur.execute(sql, (r['sku'], r['elasticity'], r['r_squared'], r['p_value'], r['sample_size']))
+            for i in range(0, len(rows), PERSIST_CHUNK_ROWS):
+                cur.executemany(sql, rows[i:i + PERSIST_CHUNK_ROWS])
         conn.commit()
     finally:
         pool.return_conn(conn)
+    invalidate(ELASTICITY_CACHE, [r['sku'] for r in results])
 
 def train_and_save_all(orders_df, output_dir="./models_artifacts/elasticity", min_sales_threshold=20):
-    skus = orders_df['sku'].unique()
-    results = []
-    for sku in skus:
-        try:
-            res = compute_elasticity_for_sku(orders_df, sku, min_sales_threshold=min_sales_threshold)
-            if res:
-                res['sku'] = sku
-                results.append(res)
-        except Exception as e:
-            print(f"Elasticity compute error for {sku}: {e}")
+    results = _as_results(compute_elasticities(orders_df, min_sales_threshold=min_sales_threshold))
 
     persist_elasticity_results(results)
     # Optionally save a summary file
@@ -85,13 +179,88 @@ def train_and_save_all(orders_df, output_dir="./models_artifacts/elasticity", mi
         json.dump(results, f, indent=2)
     return results
 
-if __name__ == "__main__":
-    # simple CLI runner for local training
+def _as_results(fitted):
+    """
+    Rows of compute_elasticities as plain dicts for persist_elasticity_results / JSON.
+    """
+    # NaN (e.g. a perfect fit's R^2 on constant demand) is stored as NULL
+    fitted = fitted.astype({'elasticity': object, 'r_squared': object, 'p_value': object})
+    results = fitted.where(fitted.notna(), None).to_dict('records')
+    for r in results:
+        r['sku'] = str(r['sku'])
+        r['sample_size'] = int(r['sample_size'])
+    return results
+
+def refresh_changed_elasticities(since_days=ELASTICITY_HISTORY_DAYS, min_sales_threshold=20):
+    """
+    Refit and upsert only SKUs with new orders since the last refresh.
+    Returns {'changed', 'fitted', 'below_threshold', 'skipped', 'from_id', 'to_id', 'seconds'};
+    skipped counts the elasticity rows left as they were.
+    """
+    from etl.extract import fetch_orders, fetch_orders_for_skus
+    from etl.incremental import read_watermarks, set_watermark, select_chunked
+
+    started = time.time()
     pool = SimpleMySQLPool.instance()
-    conn = pool.get_conn()
-    try:
-        orders_df = pd.read_sql("SELECT * FROM orders", conn)
-    finally:
-        pool.return_conn(conn)
-    res = train_and_save_all(orders_df)
-    print("Elasticity results saved:", len(res))
+    with pool.connection() as conn:
+        with conn.cursor() as cur:
+            watermark = read_watermarks(cur).get(ELASTICITY_WATERMARK)
+            cur.execute("SELECT COALESCE(MAX(order_id), 0) AS max_id FROM orders")
+            upto_id = int(cur.fetchone()['max_id'])
+            cur.execute("SELECT COUNT(*) AS n FROM elasticity_results")
+            existing = int(cur.fetchone()['n'])
+            last_id = int(watermark['last_id']) if watermark else None
+            changed = None
+            refitted_existing = existing
+            if last_id is not None:
+                cur.execute("SELECT DISTINCT sku FROM orders WHERE order_id > %s AND order_id <= %s", (last_id, upto_id))
+                changed = [row['sku'] for row in cur.fetchall()]
+                refitted_existing = len(select_chunked(cur, "SELECT sku FROM elasticity_results WHERE {skus}", changed)) \
+                    if changed else 0
+
+    if changed is None:
+        orders = fetch_orders(since_days=since_days)
+    elif changed:
+        orders = fetch_orders_for_skus(changed, since_days=since_days)
+    else:
+        orders = None
+    results = _as_results(compute_elasticities(orders, min_sales_threshold)) if orders is not None else []
+    if results:
+        persist_elasticity_results(results)
+
+    # advanced after the upsert: an interrupted refresh refits the same SKUs next time
+    with pool.connection() as conn:
+        with conn.cursor() as cur:
+            set_watermark(cur, ELASTICITY_WATERMARK, max(upto_id, last_id or 0))
+        conn.commit()
+
+    n_changed = len(changed) if changed is not None else (orders['sku'].nunique() if orders is not None else 0)
+    report = {
+        'changed': int(n_changed),
+        'fitted': len(results),
+        'below_threshold': int(n_changed) - len(results),
+        'skipped': existing - refitted_existing,
+        'from_id': last_id or 0,
+        'to_id': max(upto_id, last_id or 0),
+        'seconds': round(time.time() - started, 2),
+    }
+    logger.info("elasticity refresh: %s", report)
+    return report
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Fit per-SKU price elasticity")
+    parser.add_argument("--changed-only", action="store_true",
+                        help="refit only SKUs with new orders since the last --changed-only run")
+    parser.add_argument("--since-days", type=int, default=None,
+                        help="order history to fit on (default: all orders; ELASTICITY_HISTORY_DAYS with --changed-only)")
+    args = parser.parse_args()
+    if args.changed_only:
+        since_days = args.since_days if args.since_days is not None else ELASTICITY_HISTORY_DAYS
+        print(refresh_changed_elasticities(since_days=since_days))
+    else:
+        # simple CLI runner for local training
+        from etl.extract import fetch_orders
+        orders_df = fetch_orders(since_days=args.since_days)
+        res = train_and_save_all(orders_df)
+        print("Elasticity results saved:", len(res))
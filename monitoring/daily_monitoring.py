@@ -14,6 +14,7 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 import pandas as pd
 from services.db_pool import SimpleMySQLPool
+from etl import raw_cache
 from datetime import datetime, timedelta
 from sklearn.metrics import mean_absolute_percentage_error
 import json
@@ -22,16 +23,23 @@ import logging
 logger = logging.getLogger(__name__)
 
 def compute_mape_for_model(model_meta):
-    # For simplicity, compute MAPE using demand_predictions vs actual recent sales (join on sku)
+    # MAPE of demand_predictions vs actual sales over the last 7 days (join on sku).
+    # The model predicts 7-day units (sales_7d) and demand_predictions holds one prediction
+    # per SKU and day, so each SKU's daily predictions are averaged, not summed: the result
+    # does not depend on how many requests (or which serving path) produced them.
     pool = SimpleMySQLPool.instance()
     conn = pool.get_conn()
     try:
-        preds = pd.read_sql("SELECT sku, pred_ts, predicted_units FROM demand_predictions WHERE pred_ts >= DATE_SUB(NOW(), INTERVAL 7 DAY)", conn)
+        preds = pd.read_sql("SELECT sku, pred_date, predicted_units FROM demand_predictions WHERE pred_date >= DATE_SUB(CURDATE(), INTERVAL 7 DAY)", conn)
         if preds.empty:
             return None
-        # Aggregate predicted units by sku
-        preds_agg = preds.groupby('sku')['predicted_units'].sum().reset_index()
-        actual = pd.read_sql("SELECT sku, SUM(quantity) as actual_units FROM orders WHERE order_ts >= DATE_SUB(NOW(), INTERVAL 7 DAY) GROUP BY sku", conn)
+        preds_agg = preds.groupby('sku')['predicted_units'].mean().reset_index()
+        if raw_cache.RAW_CACHE_ENABLED:
+            recent = raw_cache.read_recent('orders', 7, columns=['sku', 'quantity'])
+            actual = recent.groupby('sku', observed=True)['quantity'].sum().rename('actual_units').reset_index()
+            actual['sku'] = actual['sku'].astype(str)
+        else:
+            actual = pd.read_sql("SELECT sku, SUM(quantity) as actual_units FROM orders WHERE order_ts >= DATE_SUB(NOW(), INTERVAL 7 DAY) GROUP BY sku", conn)
         df = preds_agg.merge(actual, on='sku', how='left').fillna(0)
         mape = mean_absolute_percentage_error(df['actual_units'], df['predicted_units'])
         return mape, df
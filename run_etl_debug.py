@@ -16,6 +16,11 @@ def run_etl_process():
     logger.info("Running ETL...")
     
     try:
+        if os.getenv("ETL_MODE", "full").lower() == "incremental":
+            from etl.incremental import run_incremental_etl
+            logger.info(f"Incremental ETL: {run_incremental_etl()}")
+            return
+
         orders = fetch_orders(since_days=90)
         logger.info(f"Orders: {orders.shape}")
         logger.info(orders.dtypes)
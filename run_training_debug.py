@@ -3,9 +3,10 @@ import sys
 import logging
 import traceback
 from services.db_pool import SimpleMySQLPool
+from etl.extract import fetch_orders
 import pandas as pd
 from models.train_elasticity import train_and_save_all
-from models.train_demand import train_and_save
+from models.train_demand import train_and_save_segmented, train_and_save_incremental, fetch_new_feature_rows
 import yaml
 from dotenv import load_dotenv
 
@@ -16,11 +17,13 @@ logger = logging.getLogger(__name__)
 def run_training_process():
     logger.info("Running Model Training...")
     
+    warm_start = os.getenv("DEMAND_TRAIN_MODE", "full").lower() == "warm_start"
     pool = SimpleMySQLPool.instance()
     conn = pool.get_pandas_conn()
     try:
-        orders = pd.read_sql("SELECT * FROM orders WHERE order_ts >= DATE_SUB(NOW(), INTERVAL 180 DAY)", conn)
-        features = pd.read_sql("SELECT * FROM features_daily", conn)
+        orders = fetch_orders(since_days=180)
+        # a warm start only reads the feature rows newer than the current model
+        features = fetch_new_feature_rows() if warm_start else pd.read_sql("SELECT * FROM features_daily", conn)
         logger.info(f"Orders shape: {orders.shape}")
         logger.info(f"Features shape: {features.shape}")
     finally:
@@ -47,7 +50,14 @@ def run_training_process():
                  cfg = yaml.safe_load(f)['models']['demand']
         
         try:
-            train_and_save(features, orders, cfg)
+            if warm_start:
+                _, meta = train_and_save_incremental(features, orders, cfg)
+                logger.info(f"Demand warm start: {meta}")
+            else:
+                # global model, plus per-segment models when models.demand.segments.by is set
+                _, index_meta = train_and_save_segmented(features, orders, cfg)
+                if index_meta:
+                    logger.info(f"Demand segments: {index_meta['segments']}")
             logger.info("Demand training success.")
         except Exception:
             traceback.print_exc()
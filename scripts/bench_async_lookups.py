@@ -0,0 +1,180 @@
+"""
+Live price-suggestion throughput of the threaded path (one thread per in-flight request,
+as the gthread workers run api/routes.py) against the asyncio path (one event loop, as
+api/asgi.py runs suggest_price_for_sku_async) at increasing concurrency.
+
+Both paths serve the same SKUs with a synthetic LightGBM demand model published to a
+temporary DEMAND_MODEL_DIR, with the lookup caches disabled (LOOKUP_CACHE_TTL_SEC=0) so
+every request does its four lookups (features, latest price, vendor rules, elasticity).
+By default the lookups do not reach MySQL: each _fetch_* function sleeps --simulate-db-ms
+and returns a fixed row, and the write-behind writer drops its batches. --real-db uses
+the configured database instead. For each concurrency level, --concurrency closed-loop
+clients (threads or coroutines) run for --duration seconds; reports requests/s, latency
+percentiles and the process's peak thread count.
+
+Usage: python scripts/bench_async_lookups.py [--concurrency 1,8,32,128] [--duration 5] [--simulate-db-ms 2]
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+def publish_synthetic_model(model_dir):
+    import numpy as np
+    import lightgbm as lgb
+    from models.model_utils import publish_model
+    columns = ['last_price', 'avg_price_7d', 'views_7d', 'addtocart_7d', 'conversion_7d',
+               'inventory_qty', 'promo_active', 'inventory_age_days']
+    rng = np.random.default_rng(0)
+    n = 20000
+    price = rng.uniform(5, 200, n)
+    views = rng.poisson(300, n)
+    X = np.column_stack([price, price * rng.uniform(0.95, 1.05, n), views, rng.poisson(30, n),
+                         rng.uniform(0, 0.2, n), rng.integers(0, 500, n), rng.integers(0, 2, n),
+                         rng.integers(0, 120, n)]).astype(float)
+    y = np.maximum(views * 0.05 * (price / 50.0) ** -1.3 + rng.normal(0, 1, n), 0.0)
+    model = lgb.LGBMRegressor(n_estimators=200, num_leaves=31, verbose=-1).fit(X, y)
+    publish_model(model, model_dir, "demand_model", {"model_type": "lightgbm", "feature_columns": columns})
+
+def simulate_db(delay):
+    """
+    Replace the per-SKU DB fetches with a sleep and a fixed row; drop write-behind batches.
+    """
+    import services.pricing_engine as pricing_engine
+    import services.feature_store as feature_store
+    from services.write_behind import WriteBehindWriter
+
+    def sleeping(value):
+        def fetch(key):
+            time.sleep(delay)
+            return value
+        return fetch
+
+    feature_store._fetch_latest_features_row = sleeping({
+        'last_price': 49.99, 'avg_price_7d': 50.5, 'views_7d': 300, 'addtocart_7d': 30, 'conversion_7d': 0.05,
+        'inventory_qty': 200, 'promo_active': 0, 'inventory_age_days': 30})
+    pricing_engine._fetch_latest_price_for_sku = sleeping(49.99)
+    pricing_engine._fetch_vendor_rules = sleeping({'vendor_id': 'vendor_1', 'min_margin': 0.1, 'max_discount': 0.3,
+                                                   'max_daily_price_change': 0.15})
+    pricing_engine._fetch_elasticity_for_sku = sleeping(None)
+    WriteBehindWriter._write = lambda self, batches: None
+
+class ThreadCount:
+    """
+    Peak threading.active_count() sampled every few milliseconds.
+    """
+    def __init__(self):
+        self.peak = threading.active_count()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(0.005):
+            self.peak = max(self.peak, threading.active_count())
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+def run_threaded(skus, concurrency, duration):
+    from services.pricing_engine import suggest_price_for_sku
+    from services.feature_store import get_latest_features
+    stop_at = time.monotonic() + duration
+    out = []
+
+    def client(offset):
+        latencies, errors, i = [], 0, offset
+        while time.monotonic() < stop_at:
+            sku = skus[i % len(skus)]
+            i += 1
+            started = time.perf_counter()
+            try:
+                suggest_price_for_sku(sku, base_features=get_latest_features(sku), vendor_id="vendor_1")
+            except Exception:
+                errors += 1
+            latencies.append(time.perf_counter() - started)
+        out.append((latencies, errors))
+
+    with ThreadCount() as threads:
+        clients = [threading.Thread(target=client, args=(7919 * c,)) for c in range(concurrency)]
+        for c in clients:
+            c.start()
+        for c in clients:
+            c.join()
+    return [x for lat, _ in out for x in lat], sum(e for _, e in out), threads.peak
+
+def run_async(skus, concurrency, duration):
+    from services.pricing_engine import suggest_price_for_sku_async
+    out = []
+
+    async def client(offset, stop_at):
+        latencies, errors, i = [], 0, offset
+        while time.monotonic() < stop_at:
+            sku = skus[i % len(skus)]
+            i += 1
+            started = time.perf_counter()
+            try:
+                await suggest_price_for_sku_async(sku, vendor_id="vendor_1")
+            except Exception:
+                errors += 1
+            latencies.append(time.perf_counter() - started)
+        out.append((latencies, errors))
+
+    async def main():
+        stop_at = time.monotonic() + duration
+        await asyncio.gather(*(client(7919 * c, stop_at) for c in range(concurrency)))
+
+    with ThreadCount() as threads:
+        asyncio.run(main())
+    return [x for lat, _ in out for x in lat], sum(e for _, e in out), threads.peak
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--concurrency", default="1,8,32,128", help="comma-separated in-flight request counts")
+    parser.add_argument("--duration", type=float, default=5.0)
+    parser.add_argument("--skus", type=int, default=1000)
+    parser.add_argument("--simulate-db-ms", type=float, default=2.0, help="latency of each simulated DB lookup")
+    parser.add_argument("--real-db", action="store_true", help="query the configured MySQL instead of simulating it")
+    args = parser.parse_args()
+
+    os.environ["LOOKUP_CACHE_TTL_SEC"] = "0"
+    os.environ["LOOKUP_CACHE_NEGATIVE_TTL_SEC"] = "0"
+    os.environ.setdefault("DEMAND_MODEL_DIR", os.path.join(tempfile.mkdtemp(prefix="bench_async_"), "demand"))
+    import numpy as np
+    from loguru import logger
+    logger.remove()
+    if not args.real_db:
+        publish_synthetic_model(os.environ["DEMAND_MODEL_DIR"])
+        simulate_db(args.simulate_db_ms / 1000.0)
+    from services.prediction_service import preload_serving_models
+    from services.db_pool import DB_ASYNC_THREADS
+    preload_serving_models()
+
+    skus = [f"BENCH_{i:06d}" for i in range(args.skus)]
+    run_threaded(skus, 1, min(1.0, args.duration))  # warm up
+    run_async(skus, 1, min(1.0, args.duration))
+    db = "configured MySQL" if args.real_db else f"simulated DB, {args.simulate_db_ms:g} ms per lookup"
+    print(f"live suggestions, lookup caches off, {db}; {args.duration:.0f} s per run; "
+          f"DB_ASYNC_THREADS={DB_ASYNC_THREADS}; {os.cpu_count()} CPUs")
+    print(f"{'path':<10} {'in-flight':>9} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'errors':>7} {'threads':>8}")
+    for concurrency in [int(c) for c in args.concurrency.split(",")]:
+        for label, run in (("threaded", run_threaded), ("asyncio", run_async)):
+            latencies, errors, peak = run(skus, concurrency, args.duration)
+            latencies = np.array(latencies)
+            print(f"{label:<10} {concurrency:>9} {len(latencies) / args.duration:>8.0f} "
+                  f"{np.percentile(latencies, 50) * 1000:>8.2f} {np.percentile(latencies, 99) * 1000:>8.2f} "
+                  f"{errors:>7} {peak:>8}")
+
+if __name__ == "__main__":
+    main()
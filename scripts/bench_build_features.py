@@ -0,0 +1,150 @@
+"""
+Parity check and benchmark for etl.transform.build_features (dense SKU x day matrices)
+against build_features_legacy (per-SKU filtering).
+
+Parity is checked on a small synthetic extract that includes events on the window
+boundaries, future and missing timestamps, global and per-SKU promotions and SKUs that
+only appear in one table. The benchmark times both at each --skus size on synthetic
+extracts with --orders-per-sku / --events-per-sku rows per SKU over --days days. The
+legacy version is only run up to --legacy-max-skus (it is O(SKUs x rows)).
+
+Usage: python scripts/bench_build_features.py [--skus 1000 100000 1000000] [--legacy-max-skus 2000]
+"""
+
+import argparse
+import os
+import sys
+import time
+from datetime import date
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pandas as pd
+from etl.transform import build_features, build_features_legacy
+
+AS_OF = date(2024, 3, 31)
+
+def synthetic_extract(n_skus, orders_per_sku, events_per_sku, days, rng, edge_cases=False):
+    """
+    Frames shaped like etl.extract output (categorical sku, float32 prices, int32 counts).
+    """
+    skus = np.array([f"SKU-{i:07d}" for i in range(n_skus)], dtype=object)
+    end = pd.Timestamp(AS_OF) + pd.Timedelta(days=1)
+
+    def timestamps(n):
+        seconds = rng.integers(0, days * 86400, n)
+        return (end - pd.to_timedelta(seconds, unit='s')).values
+
+    n_orders = n_skus * orders_per_sku
+    orders = pd.DataFrame({
+        'order_id': np.arange(n_orders, dtype=np.int64),
+        'sku': pd.Categorical(skus[rng.integers(0, n_skus, n_orders)]),
+        'order_ts': timestamps(n_orders),
+        'quantity': rng.integers(1, 5, n_orders).astype(np.int32),
+        'price': rng.uniform(5, 200, n_orders).astype(np.float32),
+    })
+    n_events = n_skus * events_per_sku
+    analytics = pd.DataFrame({
+        'sku': pd.Categorical(skus[rng.integers(0, n_skus, n_events)]),
+        'event_ts': timestamps(n_events),
+        'views': rng.integers(0, 50, n_events).astype(np.int32),
+        'add_to_cart': rng.integers(0, 5, n_events).astype(np.int32),
+        'conversions': rng.integers(0, 2, n_events).astype(np.int32),
+    })
+    inventory = pd.DataFrame({
+        'sku': pd.Categorical(skus[rng.permutation(n_skus)[: n_skus * 9 // 10]]),
+        'snapshot_ts': timestamps(n_skus * 9 // 10),
+        'qty_on_hand': rng.integers(0, 500, n_skus * 9 // 10).astype(np.int32),
+        'qty_reserved': rng.integers(0, 20, n_skus * 9 // 10).astype(np.int32),
+    })
+    n_promos = max(1, n_skus // 20)
+    start = timestamps(n_promos)
+    promotions = pd.DataFrame({
+        'promo_id': [f"P{i}" for i in range(n_promos)],
+        'sku': skus[rng.integers(0, n_skus, n_promos)],
+        'start_ts': start,
+        'end_ts': start + pd.to_timedelta(rng.integers(1, 10, n_promos), unit='D').values,
+        'discount_pct': rng.uniform(0.05, 0.3, n_promos).astype(np.float32),
+    })
+    if edge_cases:
+        end_ts = end - pd.Timedelta(seconds=1)
+        boundary = [end_ts, end_ts - pd.Timedelta(days=7), end_ts - pd.Timedelta(days=7, seconds=1),
+                    end_ts - pd.Timedelta(days=30), end_ts + pd.Timedelta(hours=5), pd.NaT]
+        extra = pd.DataFrame({
+            'order_id': np.arange(n_orders, n_orders + len(boundary), dtype=np.int64),
+            'sku': skus[:len(boundary)],
+            'order_ts': boundary,
+            'quantity': np.full(len(boundary), 3, dtype=np.int32),
+            'price': np.full(len(boundary), 9.5, dtype=np.float32),
+        })
+        orders = pd.concat([orders.astype({'sku': object}), extra], ignore_index=True)
+        orders.loc[len(orders)] = [n_orders + 99, 'SKU-ONLY-ORDERS', end_ts, 2, 11.0]
+        analytics = pd.concat([analytics.astype({'sku': object}), pd.DataFrame({
+            'sku': ['SKU-ONLY-ANALYTICS'], 'event_ts': [end_ts], 'views': [0], 'add_to_cart': [0], 'conversions': [0]})],
+            ignore_index=True)
+        promotions.loc[len(promotions)] = ['P-GLOBAL-OLD', None, end_ts - pd.Timedelta(days=40),
+                                           end_ts - pd.Timedelta(days=35), 0.1]
+    return orders, inventory, analytics, promotions
+
+def check_parity(frames, windows=None, lags=None):
+    expected = build_features_legacy(*[f.copy() for f in frames], as_of_date=AS_OF)
+    got = build_features(*frames, as_of_date=AS_OF, windows=windows, lags=lags)
+    ok = len(expected) == len(got)
+    for col in expected.columns:
+        if col == 'sku':
+            continue
+        if not ok:
+            break
+        if col not in got.columns:
+            print(f"missing column {col}")
+            ok = False
+            break
+        a = expected.set_index('sku')[col]
+        b = got.set_index('sku')[col].reindex(a.index)
+        if a.dtype.kind in 'fi' or col.startswith(('avg_price', 'conversion', 'last_price')):
+            same = np.allclose(a.astype(float), b.astype(float), rtol=1e-9, atol=1e-9, equal_nan=True)
+        else:
+            same = (a.astype(str) == b.astype(str)).all()
+        if not same:
+            print(f"column {col} differs")
+            ok = False
+    extra = [c for c in got.columns if c not in expected.columns]
+    if extra and lags is None:
+        ok = False  # the default output must keep the features_daily columns exactly
+    print(f"parity {len(got)} SKUs: {'ok' if ok else 'MISMATCH'}; additional columns: {', '.join(extra) or 'none'}")
+    return ok
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--skus", type=int, nargs="+", default=[1000, 100000, 1000000])
+    parser.add_argument("--orders-per-sku", type=int, default=5)
+    parser.add_argument("--events-per-sku", type=int, default=5)
+    parser.add_argument("--days", type=int, default=45)
+    parser.add_argument("--legacy-max-skus", type=int, default=2000)
+    args = parser.parse_args()
+    rng = np.random.default_rng(11)
+
+    ok = check_parity(synthetic_extract(300, 20, 20, args.days, rng, edge_cases=True))
+
+    print(f"\n{'skus':>9} {'order rows':>11} {'legacy s':>9} {'dense s':>8} {'speedup':>8}")
+    for n in args.skus:
+        frames = synthetic_extract(n, args.orders_per_sku, args.events_per_sku, args.days, rng)
+        started = time.perf_counter()
+        build_features(*frames, as_of_date=AS_OF)
+        dense = time.perf_counter() - started
+        legacy = None
+        if n <= args.legacy_max_skus:
+            started = time.perf_counter()
+            build_features_legacy(*[f.copy() for f in frames], as_of_date=AS_OF)
+            legacy = time.perf_counter() - started
+        legacy_text = f"{legacy:>9.2f}" if legacy is not None else f"{'-':>9}"
+        speedup = f"{legacy / dense:>7.0f}x" if legacy is not None else f"{'-':>8}"
+        print(f"{n:>9} {len(frames[0]):>11} {legacy_text} {dense:>8.2f} {speedup}")
+        del frames
+
+    if not ok:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
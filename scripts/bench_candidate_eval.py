@@ -0,0 +1,98 @@
+"""
+Benchmark: per-request candidate evaluation cost, row-wise pandas vs vectorized NumPy.
+
+Compares the previous implementation (DataFrame.iterrows constraints, copy + sort to pick
+the best candidate) with services.pricing_engine.evaluate_candidates + candidate_records
+at 21, 201 and 2001 candidates, and checks that both produce identical responses.
+
+Usage: python scripts/bench_candidate_eval.py
+"""
+
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pandas as pd
+from services.pricing_engine import (
+    PRICING_CONFIG, evaluate_candidates, candidate_records,
+)
+
+CANDIDATE_COUNTS = [21, 201, 2001]
+VENDOR_RULE = {'min_margin': 0.1, 'max_discount': 0.1, 'max_daily_price_change': 0.12}
+CURRENT_PRICE = 50.0
+
+# -------------------------------------------------------
+# Previous row-wise implementation (reference)
+# -------------------------------------------------------
+def legacy_apply_constraints(candidate_df, vendor_rule, current_price):
+    candidate_df = candidate_df.copy()
+    reasons = []
+    allowed = []
+    max_discount = float(vendor_rule.get('max_discount')) if vendor_rule and vendor_rule.get('max_discount') is not None else PRICING_CONFIG.get('max_discount', 0.30)
+    max_daily_change = float(vendor_rule.get('max_daily_price_change')) if vendor_rule and vendor_rule.get('max_daily_price_change') is not None else PRICING_CONFIG.get('daily_price_change_limit_pct', 0.15)
+    for _, row in candidate_df.iterrows():
+        p = row['price']
+        rlist = []
+        allowed_flag = True
+        if current_price and p < current_price * (1 - max_discount) - 1e-9:
+            allowed_flag = False
+            rlist.append("exceeds_max_discount")
+        if current_price and (abs(p - current_price) / max(1e-6, current_price) > max_daily_change + 1e-9):
+            allowed_flag = False
+            rlist.append("exceeds_daily_change_limit")
+        if p < PRICING_CONFIG.get('min_price', 0.5):
+            allowed_flag = False
+            rlist.append("below_min_price")
+        if p > PRICING_CONFIG.get('max_price', 100000.0):
+            allowed_flag = False
+            rlist.append("above_max_price")
+        allowed.append(allowed_flag)
+        reasons.append(",".join(rlist) if rlist else "")
+    candidate_df['allowed'] = allowed
+    candidate_df['constraint_reasons'] = reasons
+    return candidate_df
+
+def legacy_evaluate(pred_df, vendor_rule, current_price):
+    candidates = legacy_apply_constraints(pred_df, vendor_rule, current_price)
+    candidates = candidates.copy()
+    candidates['expected_revenue'] = candidates['price'] * candidates['predicted_units']
+    allowed = candidates[candidates['allowed'] == True]
+    if allowed.empty:
+        best = candidates.sort_values('expected_revenue', ascending=False).iloc[0]
+    else:
+        best = allowed.sort_values('expected_revenue', ascending=False).iloc[0]
+    records = candidates.to_dict(orient='records')
+    constraints_applied = [c for c in candidates['constraint_reasons'].unique() if c]
+    return records, best.to_dict(), constraints_applied
+
+def vectorized_evaluate(pred_df, vendor_rule, current_price):
+    evaluation = evaluate_candidates(pred_df['price'].values, pred_df['predicted_units'].values, vendor_rule, current_price)
+    records = candidate_records(evaluation)
+    constraints_applied = list(dict.fromkeys(c['constraint_reasons'] for c in records if c['constraint_reasons']))
+    return records, records[evaluation['best_index']], constraints_applied
+
+def make_pred_df(n, rng):
+    # wider band than the constraint limits so every reason combination shows up
+    prices = list(np.linspace(CURRENT_PRICE * 0.6, CURRENT_PRICE * 1.4, n))
+    units = np.maximum(rng.normal(100.0, 30.0, n) * (np.asarray(prices) / CURRENT_PRICE) ** -1.5, 0.0)
+    return pd.DataFrame({'price': prices, 'predicted_units': units})
+
+def main():
+    rng = np.random.default_rng(42)
+    print(f"{'candidates':>10} {'legacy ms':>10} {'vectorized ms':>14} {'speedup':>8}  parity")
+    for n in CANDIDATE_COUNTS:
+        pred_df = make_pred_df(n, rng)
+        legacy = legacy_evaluate(pred_df, VENDOR_RULE, CURRENT_PRICE)
+        fast = vectorized_evaluate(pred_df, VENDOR_RULE, CURRENT_PRICE)
+        parity = legacy[0] == fast[0] and legacy[1] == fast[1] and legacy[2] == fast[2]
+
+        reps = max(3, 2000 // n)
+        t_legacy = min(timeit.repeat(lambda: legacy_evaluate(pred_df, VENDOR_RULE, CURRENT_PRICE), number=reps, repeat=3)) / reps
+        t_fast = min(timeit.repeat(lambda: vectorized_evaluate(pred_df, VENDOR_RULE, CURRENT_PRICE), number=reps, repeat=3)) / reps
+        print(f"{n:>10} {t_legacy * 1e3:>10.3f} {t_fast * 1e3:>14.3f} {t_legacy / t_fast:>7.1f}x  {'ok' if parity else 'MISMATCH'}")
+
+if __name__ == "__main__":
+    main()
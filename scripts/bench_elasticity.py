@@ -0,0 +1,115 @@
+"""
+Parity check and benchmark for models.train_elasticity.compute_elasticities (all SKUs
+from grouped sufficient statistics) against the per-SKU statsmodels fit
+compute_elasticity_for_sku.
+
+Parity is checked on a small synthetic order history that includes SKUs below the
+sales / day thresholds, constant-price SKUs, zero-quantity days and missing timestamps.
+The benchmark times the vectorized engine at each --skus size (--orders-per-sku orders
+over --days days per SKU) and the per-SKU loop up to --reference-max-skus.
+
+Usage: python scripts/bench_elasticity.py [--skus 1000 100000] [--reference-max-skus 2000]
+"""
+
+import argparse
+import os
+import sys
+import time
+import warnings
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pandas as pd
+from models.train_elasticity import compute_elasticities, compute_elasticity_for_sku
+
+def synthetic_orders(n_skus, orders_per_sku, days, rng, edge_cases=False):
+    """
+    Orders shaped like etl.extract.fetch_orders output with a log-log demand per SKU.
+    """
+    n = n_skus * orders_per_sku
+    sku_index = rng.integers(0, n_skus, n)
+    base_price = rng.uniform(5, 200, n_skus)
+    true_elasticity = rng.uniform(-3.0, -0.2, n_skus)
+    price = base_price[sku_index] * rng.choice([0.8, 0.9, 1.0, 1.1], n)
+    mean_units = 3.0 * (price / base_price[sku_index]) ** true_elasticity[sku_index]
+    orders = pd.DataFrame({
+        'order_id': np.arange(n, dtype=np.int64),
+        'sku': pd.Categorical(np.array([f"SKU-{i:07d}" for i in range(n_skus)], dtype=object)[sku_index]),
+        'order_ts': (pd.Timestamp("2024-01-01") + pd.to_timedelta(rng.integers(0, days * 86400, n), unit='s')).values,
+        'quantity': rng.poisson(mean_units).astype(np.int32),
+        'price': price.astype(np.float32),
+    })
+    if edge_cases:
+        orders = orders.astype({'sku': object})
+        extra = []
+        for d in range(10):  # constant price: no price signal
+            extra.append(('SKU-CONST', pd.Timestamp("2024-01-01") + pd.Timedelta(days=d), 5, 9.99))
+        for d in range(4):  # too few selling days
+            extra.append(('SKU-FEWDAYS', pd.Timestamp("2024-01-01") + pd.Timedelta(days=d), 50, 10.0 + d))
+        extra.append((orders['sku'].iloc[0], pd.NaT, 3, 12.0))
+        extra.append((orders['sku'].iloc[1], pd.Timestamp("2024-01-03"), 0, 99.0))
+        orders = pd.concat([orders, pd.DataFrame(extra, columns=['sku', 'order_ts', 'quantity', 'price']).assign(
+            order_id=-1, quantity=lambda f: f['quantity'].astype(np.int32), price=lambda f: f['price'].astype(np.float32))],
+            ignore_index=True)
+    return orders
+
+def reference(orders, min_sales_threshold=20):
+    rows = []
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        for sku in orders['sku'].dropna().unique():
+            res = compute_elasticity_for_sku(orders, sku, min_sales_threshold=min_sales_threshold)
+            if res:
+                rows.append(dict(res, sku=str(sku)))
+    return pd.DataFrame(rows, columns=['sku', 'elasticity', 'r_squared', 'p_value', 'sample_size'])
+
+def check_parity(orders):
+    expected = reference(orders).set_index('sku').sort_index()
+    got = compute_elasticities(orders).assign(sku=lambda f: f['sku'].astype(str)).set_index('sku').sort_index()
+    ok = expected.index.equals(got.index)
+    if not ok:
+        print(f"SKU sets differ: {sorted(set(expected.index) ^ set(got.index))[:10]}")
+    else:
+        for col in expected.columns:
+            # p-values are compared on an absolute scale (tiny p-values differ in the tail)
+            same = np.allclose(expected[col].astype(float), got[col].astype(float),
+                               rtol=1e-7, atol=1e-10 if col != 'p_value' else 1e-9, equal_nan=True)
+            if not same:
+                print(f"column {col} differs by up to {np.nanmax(np.abs(expected[col] - got[col])):.3g}")
+                ok = False
+    print(f"parity {len(got)} fitted SKUs (of {orders['sku'].nunique()}): {'ok' if ok else 'MISMATCH'}")
+    return ok
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--skus", type=int, nargs="+", default=[1000, 100000])
+    parser.add_argument("--orders-per-sku", type=int, default=40)
+    parser.add_argument("--days", type=int, default=180)
+    parser.add_argument("--reference-max-skus", type=int, default=2000)
+    args = parser.parse_args()
+    rng = np.random.default_rng(5)
+
+    ok = check_parity(synthetic_orders(300, 60, 90, rng, edge_cases=True))
+
+    print(f"\n{'skus':>9} {'order rows':>11} {'statsmodels s':>14} {'vectorized s':>13} {'speedup':>8}")
+    for n in args.skus:
+        orders = synthetic_orders(n, args.orders_per_sku, args.days, rng)
+        started = time.perf_counter()
+        compute_elasticities(orders)
+        fast = time.perf_counter() - started
+        slow = None
+        if n <= args.reference_max_skus:
+            started = time.perf_counter()
+            reference(orders)
+            slow = time.perf_counter() - started
+        slow_text = f"{slow:>14.2f}" if slow is not None else f"{'-':>14}"
+        speedup = f"{slow / fast:>7.0f}x" if slow is not None else f"{'-':>8}"
+        print(f"{n:>9} {len(orders):>11} {slow_text} {fast:>13.2f} {speedup}")
+        del orders
+
+    if not ok:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
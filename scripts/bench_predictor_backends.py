@@ -0,0 +1,106 @@
+"""
+Per-call latency and throughput of the demand predictor backends in
+services.prediction_service on synthetic LightGBM and XGBoost demand models.
+
+Each backend is timed on a single-SKU grid (--grid rows, the per-request shape; median
+and p99 over --calls calls) and on a stacked batch of --batch-skus grids (rows/s, the
+batch endpoint and snapshot shape). The DataFrame path (joblib backend) and XGBoost's
+DMatrix predict are included as the baselines the native backends replace. Outputs are
+checked against each other before timing.
+
+Usage: python scripts/bench_predictor_backends.py [--trees 300] [--calls 2000] [--batch-skus 1000]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import lightgbm as lgb
+import xgboost as xgb
+from services.prediction_service import serving_model
+
+FEATURE_COLUMNS = ['last_price', 'avg_price_7d', 'views_7d', 'addtocart_7d', 'conversion_7d',
+                   'inventory_qty', 'promo_active', 'inventory_age_days']
+
+def training_data(rng, n=30000):
+    price = rng.uniform(5, 200, n)
+    views = rng.poisson(300, n)
+    X = np.column_stack([price, price * rng.uniform(0.95, 1.05, n), views, rng.poisson(30, n),
+                         rng.uniform(0, 0.2, n), rng.integers(0, 500, n), rng.integers(0, 2, n),
+                         rng.integers(0, 120, n)]).astype(float)
+    y = np.maximum(views * 0.05 * (price / 50.0) ** -1.3 + rng.normal(0, 1, n), 0.0)
+    return X, y
+
+class DMatrixPredictor:
+    """
+    Baseline: XGBoost Booster.predict with a DMatrix built per call.
+    """
+    name = "xgboost-dmatrix"
+
+    def __init__(self, booster):
+        self.booster = booster
+
+    def predict(self, X):
+        return self.booster.predict(xgb.DMatrix(X, feature_names=FEATURE_COLUMNS))
+
+def time_calls(predict, X, calls):
+    predict(X)
+    samples = np.empty(calls)
+    for i in range(calls):
+        started = time.perf_counter()
+        predict(X)
+        samples[i] = time.perf_counter() - started
+    return samples
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--trees", type=int, default=300)
+    parser.add_argument("--grid", type=int, default=21)
+    parser.add_argument("--calls", type=int, default=2000)
+    parser.add_argument("--batch-skus", type=int, default=1000)
+    parser.add_argument("--batch-repeats", type=int, default=20)
+    args = parser.parse_args()
+    rng = np.random.default_rng(3)
+    X, y = training_data(rng)
+
+    booster = lgb.train({'objective': 'regression', 'verbosity': -1, 'num_leaves': 31, 'learning_rate': 0.05},
+                        lgb.Dataset(X, label=y, feature_name=FEATURE_COLUMNS), num_boost_round=args.trees)
+    lgb_meta = {'model_type': 'lightgbm', 'feature_columns': FEATURE_COLUMNS}
+    xgb_booster = xgb.train({'objective': 'reg:squarederror', 'max_depth': 6, 'learning_rate': 0.05},
+                            xgb.DMatrix(X, label=y, feature_names=FEATURE_COLUMNS), num_boost_round=args.trees)
+    xgb_meta = {'model_type': 'xgboost', 'feature_columns': FEATURE_COLUMNS}
+
+    candidates = [
+        ("lightgbm", serving_model(booster, lgb_meta, backend="booster")),
+        ("lightgbm", serving_model(booster, lgb_meta, backend="joblib")),
+        ("xgboost", serving_model(xgb_booster, xgb_meta, backend="booster")),
+        ("xgboost", DMatrixPredictor(xgb_booster)),
+    ]
+
+    grid = X[:args.grid].copy()
+    batch = np.tile(grid, (args.batch_skus, 1))
+    reference = {}
+    ok = True
+    for model, backend in candidates:
+        out = np.asarray(backend.predict(batch[:500]), dtype=float)
+        if model in reference and not np.allclose(out, reference[model][1], rtol=1e-5, atol=1e-5):
+            print(f"{model}/{backend.name} predictions differ from {model}/{reference[model][0]}")
+            ok = False
+        reference.setdefault(model, (backend.name, out))
+
+    print(f"{args.trees} trees; grid = {args.grid} rows, batch = {args.batch_skus} SKUs x {args.grid} rows")
+    print(f"{'model':<9} {'backend':<16} {'grid p50 us':>12} {'grid p99 us':>12} {'batch rows/s':>14}")
+    for model, backend in candidates:
+        samples = time_calls(backend.predict, grid, args.calls)
+        batch_seconds = np.median(time_calls(backend.predict, batch, args.batch_repeats))
+        print(f"{model:<9} {backend.name:<16} {np.percentile(samples, 50) * 1e6:>12.0f} "
+              f"{np.percentile(samples, 99) * 1e6:>12.0f} {len(batch) / batch_seconds:>14,.0f}")
+    if not ok:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""
+Compare candidate search modes of services.pricing_engine on a synthetic LightGBM demand
+model: best allowed revenue found and number of model evaluations per SKU.
+
+"fine" is a dense grid of --fine-steps points over the allowed price range and serves as
+the reference optimum; the breakpoints optimizer must match or beat it on every SKU.
+"adaptive" runs the coarse-to-fine search with the given --budget (default 21, the same
+number of evaluations as the grid). The per-SKU rows time one SKU at a time; the batch
+rows time grid and adaptive for all SKUs in one call, the shape the batch endpoint and
+the snapshot build use. The API only runs adaptive for batches.
+
+Usage: python scripts/bench_price_optimizer.py [--skus 200] [--trees 200] [--fine-steps 20001] [--budget 21]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import lightgbm as lgb
+from loguru import logger
+from services.pricing_engine import (
+    allowed_price_range, evaluate_candidates, refine_price_search, _candidate_prices,
+)
+from services.prediction_service import predict_units_for_prices, predict_units_for_price_grids
+
+FEATURE_COLUMNS = ['last_price', 'avg_price_7d', 'views_7d', 'addtocart_7d', 'conversion_7d',
+                   'inventory_qty', 'promo_active', 'inventory_age_days']
+VENDOR_RULE = {'max_discount': 0.2, 'max_daily_price_change': 0.15}
+
+def train_model(trees, rng):
+    n = 30000
+    price = rng.uniform(5, 200, n)
+    views = rng.poisson(300, n)
+    X = np.column_stack([price, price * rng.uniform(0.95, 1.05, n), views, rng.poisson(30, n),
+                         rng.uniform(0, 0.2, n), rng.integers(0, 500, n), rng.integers(0, 2, n),
+                         rng.integers(0, 120, n)]).astype(float)
+    units = np.maximum(views * 0.05 * (price / 50.0) ** -1.3 + rng.normal(0, 1, n), 0.0)
+    booster = lgb.train({'objective': 'regression', 'verbosity': -1, 'num_leaves': 31, 'learning_rate': 0.05},
+                        lgb.Dataset(X, label=units), num_boost_round=trees)
+    return booster, {'model_type': 'lightgbm', 'feature_columns': FEATURE_COLUMNS}
+
+def base_features_for(rng):
+    price = float(rng.uniform(10, 150))
+    return {'last_price': price, 'avg_price_7d': price, 'views_7d': int(rng.poisson(300)),
+            'addtocart_7d': int(rng.poisson(30)), 'conversion_7d': float(rng.uniform(0, 0.2)),
+            'inventory_qty': int(rng.integers(0, 500)), 'promo_active': int(rng.integers(0, 2)),
+            'inventory_age_days': int(rng.integers(0, 120))}
+
+def run_mode(model, meta, base_features, mode, fine_steps, budget):
+    current_price = base_features['last_price']
+    if mode == "fine":
+        lo, hi = allowed_price_range(VENDOR_RULE, current_price)
+        prices = np.linspace(lo, hi, fine_steps).tolist()
+    else:
+        prices, _ = _candidate_prices(mode, model, meta, current_price, VENDOR_RULE, steps=21, batch=True)
+    if mode == "adaptive":
+        pred = refine_price_search(model, meta, [base_features], [prices], [VENDOR_RULE], [current_price], budget=budget)[0]
+    else:
+        pred = predict_units_for_prices(model, meta, base_features, prices)
+    evaluation = evaluate_candidates(pred['price'].values, pred['predicted_units'].values, VENDOR_RULE, current_price)
+    best = evaluation['best_index']
+    return float(evaluation['expected_revenue'][best]), len(pred)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--skus", type=int, default=200)
+    parser.add_argument("--trees", type=int, default=200)
+    parser.add_argument("--fine-steps", type=int, default=20001)
+    parser.add_argument("--budget", type=int, default=21)
+    args = parser.parse_args()
+    logger.remove()  # prediction_service logs per-SKU debug output
+    rng = np.random.default_rng(7)
+    model, meta = train_model(args.trees, rng)
+    skus = [base_features_for(rng) for _ in range(args.skus)]
+
+    modes = ["grid", "adaptive", "breakpoints", "fine"]
+    revenue = {m: [] for m in modes}
+    evals = {m: [] for m in modes}
+    seconds = {}
+    for mode in modes:
+        started = time.perf_counter()
+        for features in skus:
+            r, n = run_mode(model, meta, features, mode, args.fine_steps, args.budget)
+            revenue[mode].append(r)
+            evals[mode].append(n)
+        seconds[mode] = time.perf_counter() - started
+
+    fine = np.asarray(revenue["fine"])
+    print(f"{args.skus} SKUs, {args.trees} trees")
+    print(f"{'mode':<12} {'evals/sku':>10} {'ms/sku':>8} {'mean gap vs fine':>17} {'SKUs below fine':>16}")
+    for mode in modes:
+        rev = np.asarray(revenue[mode])
+        gap = (fine - rev) / np.maximum(fine, 1e-9)
+        below = int(np.sum(rev < fine - 1e-9 * np.maximum(fine, 1.0)))
+        print(f"{mode:<12} {np.mean(evals[mode]):>10.1f} {seconds[mode] / args.skus * 1e3:>8.2f} "
+              f"{np.mean(gap) * 100:>16.4f}% {below:>16}")
+
+    # batch path (POST /price-suggestions/batch, snapshot build): one stacked predict for all
+    # SKUs' grids, against one stacked predict per refinement round
+    grids = [_candidate_prices("grid", model, meta, f['last_price'], VENDOR_RULE, steps=21, batch=True)[0] for f in skus]
+    coarse = [_candidate_prices("adaptive", model, meta, f['last_price'], VENDOR_RULE, steps=21, batch=True)[0] for f in skus]
+    batch_runs = {
+        "grid": lambda: predict_units_for_price_grids(model, meta, skus, grids),
+        "adaptive": lambda: refine_price_search(model, meta, skus, coarse, [VENDOR_RULE] * len(skus),
+                                                [f['last_price'] for f in skus], budget=args.budget),
+    }
+    print(f"\none batch of {args.skus} SKUs")
+    print(f"{'mode':<12} {'ms/sku':>8}")
+    for mode, run in batch_runs.items():
+        best = float("inf")
+        for _ in range(3):
+            started = time.perf_counter()
+            run()
+            best = min(best, time.perf_counter() - started)
+        print(f"{mode:<12} {best / args.skus * 1e3:>8.2f}")
+    if np.any(np.asarray(revenue["breakpoints"]) < fine - 1e-9 * np.maximum(fine, 1.0)):
+        print("breakpoints optimizer missed the fine-grid optimum")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,215 @@
+"""
+Throughput of the production server (gunicorn -c gunicorn.conf.py app:app) against the
+Flask development server (python app.py --dev) on the same app and routes.
+
+Each server is started in turn on a free port with the same environment, waited on
+until GET /ready returns 200, then driven for --duration seconds by --clients client
+processes with --client-threads keep-alive connections each, cycling through --routes.
+Default suggestions (/price-suggestions?sku=...) are answered from a synthetic suggestion
+snapshot of --snapshot-skus SKUs written to a temporary SUGGESTION_SNAPSHOT_DIR; routes
+that need MySQL (live suggestions, batch) can be added with --routes when a DB is
+configured. Reports requests/s, latency percentiles, non-200 responses, and the servers'
+total RSS and PSS (PSS splits shared pages between processes, so RSS - PSS shows what
+the forked workers share copy-on-write).
+
+Usage: python scripts/bench_server.py [--workers 4] [--duration 10] [--clients 2] [--client-threads 8]
+"""
+
+import argparse
+import http.client
+import json
+import multiprocessing
+import os
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import numpy as np
+
+DEFAULT_ROUTES = "/ready,/price-suggestions?sku={sku}"
+
+def write_snapshot(snapshot_dir, skus):
+    """
+    A suggestion snapshot in the format services.suggestion_snapshot.build_snapshot writes.
+    """
+    rng = np.random.default_rng(0)
+    version = datetime.utcnow().strftime("%Y%m%dT%H%M%SZ")
+    created_at = datetime.utcnow().isoformat()
+    entries = {}
+    for sku in skus:
+        price = float(rng.uniform(5, 200))
+        grid = np.round(np.linspace(0.8, 1.2, 21) * price, 2)
+        units = np.maximum(50 * (grid / price) ** -1.5 + rng.normal(0, 1, 21), 0)
+        best = int(np.argmax(grid * units))
+        entries[f"{sku}|"] = {
+            "sku": sku, "current_price": price, "suggested_price": float(grid[best]),
+            "expected_revenue": float(grid[best] * units[best]), "expected_units": float(units[best]),
+            "model_version": "bench", "model_segment": None, "elasticity": -1.5, "elasticity_r2": 0.6,
+            "elasticity_p_value": 0.01, "reason": "revenue_maximization", "constraints_applied": [],
+            "candidates": [{"price": float(p), "predicted_units": float(u), "allowed": True, "constraint_reasons": "",
+                            "expected_revenue": float(p * u)} for p, u in zip(grid, units)],
+            "optimizer": "grid", "model_evaluations": 21, "generated_at": created_at,
+        }
+    os.makedirs(snapshot_dir, exist_ok=True)
+    path = f"suggestions_{version}.json"
+    with open(os.path.join(snapshot_dir, path), "w") as f:
+        json.dump({"version": version, "created_at": created_at, "vendor_rules": {}, "entries": entries}, f)
+    with open(os.path.join(snapshot_dir, "current.json"), "w") as f:
+        json.dump({"version": version, "path": path, "created_at": created_at}, f)
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def wait_ready(port, proc, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"server exited with {proc.returncode}")
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=2)
+            conn.request("GET", "/ready")
+            if conn.getresponse().status == 200:
+                return
+        except OSError:
+            pass
+        time.sleep(0.5)
+    raise RuntimeError("server did not become ready")
+
+def memory_kb(pid):
+    """
+    (rss, pss) in kB summed over pid and its child processes.
+    """
+    pids = [pid]
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as f:
+            pids += [int(p) for p in f.read().split()]
+    except OSError:
+        pass
+    rss = pss = 0
+    for p in pids:
+        try:
+            with open(f"/proc/{p}/smaps_rollup") as f:
+                for line in f:
+                    if line.startswith("Rss:"):
+                        rss += int(line.split()[1])
+                    elif line.startswith("Pss:"):
+                        pss += int(line.split()[1])
+        except OSError:
+            pass
+    return rss, pss
+
+def client_thread(port, paths, offset, stop_at, out):
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+    latencies, errors, i = [], 0, offset
+    while time.monotonic() < stop_at:
+        path = paths[i % len(paths)]
+        i += 1
+        started = time.perf_counter()
+        try:
+            conn.request("GET", path)
+            response = conn.getresponse()
+            response.read()
+            if response.status != 200:
+                errors += 1
+            if response.getheader("Connection", "").lower() == "close":
+                conn.close()
+        except (OSError, http.client.HTTPException):
+            errors += 1
+            conn.close()
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+        latencies.append(time.perf_counter() - started)
+    out.append((latencies, errors))
+
+def client_process(args):
+    port, paths, threads, offset, stop_at = args
+    out = []
+    workers = [threading.Thread(target=client_thread, args=(port, paths, offset + 7919 * t, stop_at, out))
+               for t in range(threads)]
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    return [x for latencies, _ in out for x in latencies], sum(e for _, e in out)
+
+def drive(port, paths, clients, threads, duration):
+    stop_at = time.monotonic() + duration
+    with multiprocessing.get_context("fork").Pool(clients) as pool:
+        results = pool.map(client_process, [(port, paths, threads, 104729 * c, stop_at) for c in range(clients)])
+    latencies = np.array([x for lat, _ in results for x in lat])
+    return latencies, sum(e for _, e in results)
+
+def run_server(label, cmd, env, args, paths):
+    port = free_port()
+    env = dict(env, FLASK_PORT=str(port), FLASK_HOST="127.0.0.1")
+    log = open(os.path.join(env["BENCH_TMP"], f"{label}.log"), "w")
+    proc = subprocess.Popen(cmd, cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT, start_new_session=True)
+    try:
+        wait_ready(port, proc, args.ready_timeout)
+        drive(port, paths, 1, 2, min(2.0, args.duration))  # warm the connections and caches
+        latencies, errors = drive(port, paths, args.clients, args.client_threads, args.duration)
+        rss, pss = memory_kb(proc.pid)
+    finally:
+        os.killpg(proc.pid, signal.SIGTERM)
+        try:
+            proc.wait(30)
+        except subprocess.TimeoutExpired:
+            os.killpg(proc.pid, signal.SIGKILL)
+        log.close()
+    return {
+        "server": label,
+        "rps": len(latencies) / args.duration,
+        "p50_ms": np.percentile(latencies, 50) * 1000 if len(latencies) else float("nan"),
+        "p99_ms": np.percentile(latencies, 99) * 1000 if len(latencies) else float("nan"),
+        "errors": errors,
+        "requests": len(latencies),
+        "rss_mb": rss / 1024.0,
+        "pss_mb": pss / 1024.0,
+    }
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--threads", type=int, default=4, help="gunicorn threads per worker")
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--clients", type=int, default=2, help="client processes")
+    parser.add_argument("--client-threads", type=int, default=8, help="keep-alive connections per client process")
+    parser.add_argument("--routes", default=DEFAULT_ROUTES, help="comma-separated GET paths; {sku} is replaced per request")
+    parser.add_argument("--snapshot-skus", type=int, default=10000)
+    parser.add_argument("--ready-timeout", type=float, default=120.0)
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix="bench_server_")
+    skus = [f"BENCH_{i:06d}" for i in range(args.snapshot_skus)]
+    write_snapshot(os.path.join(tmp, "snapshots"), skus)
+    rng = np.random.default_rng(1)
+    paths = [route.format(sku=skus[int(rng.integers(len(skus)))])
+             for _ in range(1000) for route in args.routes.split(",")]
+    metrics_dir = os.path.join(tmp, "metrics")
+    env = dict(os.environ, BENCH_TMP=tmp, SUGGESTION_SNAPSHOT_DIR=os.path.join(tmp, "snapshots"), MODEL_PRELOAD="1")
+
+    results = [
+        run_server("flask-dev", [sys.executable, "app.py", "--dev"], env, args, paths),
+        run_server(f"gunicorn-{args.workers}x{args.threads}",
+                   [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "app:app"],
+                   dict(env, WEB_WORKERS=str(args.workers), WEB_THREADS=str(args.threads),
+                        PROMETHEUS_MULTIPROC_DIR=metrics_dir), args, paths),
+    ]
+    print(f"routes: {args.routes}; {args.clients} client processes x {args.client_threads} connections, "
+          f"{args.duration:.0f} s; {os.cpu_count()} CPUs; server logs in {tmp}")
+    print(f"{'server':<16} {'req/s':>9} {'p50 ms':>8} {'p99 ms':>8} {'non-200':>8} {'RSS MB':>8} {'PSS MB':>8}")
+    for r in results:
+        print(f"{r['server']:<16} {r['rps']:>9.0f} {r['p50_ms']:>8.2f} {r['p99_ms']:>8.2f} "
+              f"{r['errors']:>8} {r['rss_mb']:>8.0f} {r['pss_mb']:>8.0f}")
+
+if __name__ == "__main__":
+    main()
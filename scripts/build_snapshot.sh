@@ -0,0 +1,4 @@
+#!/usr/bin/env bash
+set -e
+# Precompute default price suggestions; run nightly after run_etl.sh and train_models.sh
+python services/suggestion_snapshot.py
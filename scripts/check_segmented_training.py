@@ -0,0 +1,105 @@
+"""
+Check segmented demand training on frames shaped like the training inputs: features as
+read from features_daily, orders with the etl.extract.ORDERS_COLUMNS projection (which has
+no vendor_id) and, for segments.by: vendor, per-SKU vendor order counts shaped like
+etl.extract.fetch_sku_vendors output. Trains into a temporary model directory and checks
+that every SKU is routed to the segment of its most frequent vendor, and that sku_hash
+segmentation routes through buckets.
+
+Usage: python scripts/check_segmented_training.py [--skus 60] [--days 60]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pandas as pd
+from etl.extract import ORDERS_COLUMNS, SKU_VENDOR_COLUMNS
+from models.model_utils import load_model, segment_index_name
+from models.train_demand import train_and_save_segmented
+
+VENDORS = ["vendor_1", "vendor_2", "vendor 3"]
+
+def extract_frame(data, columns):
+    """
+    DataFrame with the dtypes etl.extract._read_streaming produces for `columns`.
+    """
+    frame = pd.DataFrame(data, columns=list(columns))
+    for c, kind in columns.items():
+        frame[c] = pd.to_datetime(frame[c]) if kind == 'datetime' else frame[c].astype(kind)
+    return frame
+
+def synthetic_inputs(n_skus, days, rng):
+    skus = [f"SKU_{i:04d}" for i in range(n_skus)]
+    today = date.today()
+    feature_rows = []
+    for sku in skus:
+        base_price = rng.uniform(5, 200)
+        for d in range(days):
+            price = base_price * rng.uniform(0.8, 1.2)
+            views = int(rng.poisson(300))
+            feature_rows.append({
+                'feature_date': today - timedelta(days=days - d), 'sku': sku,
+                'sales_7d': int(max(views * 0.05 * (price / 50.0) ** -1.3 + rng.normal(0, 1), 0)),
+                'sales_14d': 0, 'sales_30d': 0, 'avg_price_7d': price, 'avg_price_14d': price, 'avg_price_30d': price,
+                'views_7d': views, 'addtocart_7d': int(rng.poisson(30)), 'conversion_7d': float(rng.uniform(0, 0.2)),
+                'inventory_qty': int(rng.integers(0, 500)), 'inventory_age_days': int(rng.integers(0, 120)),
+                'promo_active': int(rng.integers(0, 2)), 'last_price': price,
+            })
+    features = pd.DataFrame(feature_rows)
+
+    orders = extract_frame({
+        'order_id': np.arange(n_skus * 5),
+        'sku': np.repeat(skus, 5),
+        'order_ts': [pd.Timestamp.now() - pd.Timedelta(days=int(d)) for d in rng.integers(0, days, n_skus * 5)],
+        'quantity': rng.integers(1, 4, n_skus * 5),
+        'price': rng.uniform(5, 200, n_skus * 5),
+    }, ORDERS_COLUMNS)
+
+    # every SKU sells through two vendors; its main vendor gets more orders
+    main = {sku: VENDORS[i % len(VENDORS)] for i, sku in enumerate(skus)}
+    rows = []
+    for i, sku in enumerate(skus):
+        rows.append((sku, main[sku], 10))
+        rows.append((sku, VENDORS[(i + 1) % len(VENDORS)], 3))
+    sku_vendors = extract_frame({'sku': [r[0] for r in rows], 'vendor_id': [r[1] for r in rows],
+                                 'orders': [r[2] for r in rows]}, SKU_VENDOR_COLUMNS)
+    return features, orders, sku_vendors, main
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--skus", type=int, default=60)
+    parser.add_argument("--days", type=int, default=60)
+    args = parser.parse_args()
+    rng = np.random.default_rng(11)
+    features, orders, sku_vendors, main_vendor = synthetic_inputs(args.skus, args.days, rng)
+    config = {'model_type': 'lightgbm', 'params': {'num_boost_round': 30, 'early_stopping_rounds': 5},
+              'segments': {'by': 'vendor', 'min_rows': 100}}
+
+    ok = 'vendor_id' not in orders.columns
+    print(f"orders projection without vendor_id: {'ok' if ok else 'FAILED'}")
+    with tempfile.TemporaryDirectory() as model_dir:
+        _, index_meta = train_and_save_segmented(features, orders, config, model_dir=model_dir, sku_vendors=sku_vendors)
+        index, _ = load_model(model_dir, segment_index_name("demand_model"))
+        expected = {sku: vendor.replace(" ", "_") for sku, vendor in main_vendor.items()}
+        routed_ok = index['skus'] == expected and set(index['segments']) == set(expected.values())
+        print(f"by=vendor: {len(index['segments'])} segments, {index_meta['skus_routed']} SKUs routed: "
+              f"{'ok' if routed_ok else 'FAILED'}")
+        ok &= routed_ok
+
+        config['segments'] = {'by': 'sku_hash', 'buckets': 2, 'min_rows': 100}
+        _, index_meta = train_and_save_segmented(features, orders, config, model_dir=model_dir)
+        hash_ok = index_meta['skus_routed'] > 0 and index_meta['segment_by'] == 'sku_hash'
+        print(f"by=sku_hash: {len(index_meta['segments'])} segments, {index_meta['skus_routed']} SKUs routed: "
+              f"{'ok' if hash_ok else 'FAILED'}")
+        ok &= hash_ok
+    if not ok:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
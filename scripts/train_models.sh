@@ -2,6 +2,7 @@
 set -e
 python - <<'PY'
 from services.db_pool import SimpleMySQLPool
+from etl.extract import fetch_orders
 import pandas as pd
 from models.train_elasticity import train_and_save_all
 from models.train_demand import train_and_save
@@ -10,7 +11,7 @@ import yaml, os, json
 pool = SimpleMySQLPool.instance()
 conn = pool.get_conn()
 try:
-    orders = pd.read_sql("SELECT * FROM orders WHERE order_ts >= DATE_SUB(NOW(), INTERVAL 180 DAY)", conn)
+    orders = fetch_orders(since_days=180)
     features = pd.read_sql("SELECT * FROM features_daily", conn)
 finally:
     pool.return_conn(conn)
@@ -0,0 +1,173 @@
+# services/cache.py
+"""
+Small in-process read-through caches for serving-path lookups.
+Each cache is a bounded LRU with a per-entry TTL. A loader returning None is cached as a
+negative entry with its own (shorter) TTL so unknown keys don't hit the DB on every request.
+Caches are registered by name so writers (ETL, training) can invalidate them without
+importing the serving modules. Invalidation is per process; other workers rely on the TTL.
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+
+LOOKUP_CACHE_TTL_SEC = float(os.getenv("LOOKUP_CACHE_TTL_SEC", 300))
+LOOKUP_CACHE_NEGATIVE_TTL_SEC = float(os.getenv("LOOKUP_CACHE_NEGATIVE_TTL_SEC", 60))
+LOOKUP_CACHE_MAX_ENTRIES = int(os.getenv("LOOKUP_CACHE_MAX_ENTRIES", 50000))
+
+# Names of the serving-path lookup caches
+VENDOR_RULES_CACHE = "vendor_rules"
+ELASTICITY_CACHE = "elasticity"
+LATEST_PRICE_CACHE = "latest_price"
+FEATURES_CACHE = "features"
+
+class TTLCache:
+    def __init__(self, name, maxsize=LOOKUP_CACHE_MAX_ENTRIES, ttl=LOOKUP_CACHE_TTL_SEC,
+                 negative_ttl=LOOKUP_CACHE_NEGATIVE_TTL_SEC):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._data = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self._generation = 0  # bumped by invalidate() so in-flight loads don't store stale values
+        self.hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _lookup(self, key, now):
+        """
+        (found, value) for a live entry; expired entries are dropped. Caller holds the lock.
+        """
+        entry = self._data.get(key)
+        if entry is None:
+            return False, None
+        expires_at, value = entry
+        if expires_at <= now:
+            del self._data[key]
+            return False, None
+        self._data.move_to_end(key)
+        if value is None:
+            self.negative_hits += 1
+        else:
+            self.hits += 1
+        return True, value
+
+    def _store(self, key, value, now, generation):
+        if generation != self._generation:
+            return
+        ttl = self.negative_ttl if value is None else self.ttl
+        if ttl <= 0:
+            return
+        self._data[key] = (now + ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def get_or_load(self, key, loader):
+        """
+        Cached value for key, calling loader(key) on a miss. None results are cached negatively.
+        """
+        with self._lock:
+            found, value = self._lookup(key, time.monotonic())
+            if found:
+                return value
+            self.misses += 1
+            generation = self._generation
+        value = loader(key)
+        with self._lock:
+            self._store(key, value, time.monotonic(), generation)
+        return value
+
+    async def get_or_load_async(self, key, loader):
+        """
+        get_or_load for asyncio callers: loader(key) is awaited on a miss (e.g. a blocking
+        fetch run in an executor). The cache itself is never awaited on.
+        """
+        with self._lock:
+            found, value = self._lookup(key, time.monotonic())
+            if found:
+                return value
+            self.misses += 1
+            generation = self._generation
+        value = await loader(key)
+        with self._lock:
+            self._store(key, value, time.monotonic(), generation)
+        return value
+
+    def get_many(self, keys, bulk_loader):
+        """
+        dict key -> value for keys, calling bulk_loader(missing_keys) once for all misses.
+        bulk_loader returns a dict; keys absent from it are cached negatively (value None).
+        """
+        result = {}
+        missing = []
+        with self._lock:
+            now = time.monotonic()
+            for key in dict.fromkeys(keys):
+                found, value = self._lookup(key, now)
+                if found:
+                    result[key] = value
+                else:
+                    missing.append(key)
+            self.misses += len(missing)
+            generation = self._generation
+        if missing:
+            loaded = bulk_loader(missing)
+            with self._lock:
+                now = time.monotonic()
+                for key in missing:
+                    value = loaded.get(key)
+                    self._store(key, value, now, generation)
+                    result[key] = value
+        return result
+
+    def invalidate(self, keys=None):
+        """
+        Drop the given keys, or everything when keys is None.
+        """
+        with self._lock:
+            self._generation += 1
+            if keys is None:
+                self._data.clear()
+            else:
+                for key in keys:
+                    self._data.pop(key, None)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "name": self.name,
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "negative_hits": self.negative_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+_caches = {}
+_registry_lock = threading.Lock()
+
+def get_cache(name, **kwargs):
+    """
+    Process-wide cache registered under name, created with kwargs on first use.
+    """
+    with _registry_lock:
+        if name not in _caches:
+            _caches[name] = TTLCache(name, **kwargs)
+        return _caches[name]
+
+def invalidate(name, keys=None):
+    """
+    Invalidate keys (or all entries) of a named cache; no-op if this process never created it.
+    """
+    cache = _caches.get(name)
+    if cache is not None:
+        cache.invalidate(keys)
+
+def cache_stats():
+    return [cache.stats() for cache in list(_caches.values())]
@@ -1,14 +1,27 @@
 # services/db_pool.py
 """
-Simple DB pool manager using PyMySQL connection pooling semantics.
-This uses a naive pool implemented in Python; in production use a tested pool library (SQLAlchemy pool or mysqlclient's pooling).
+DB pool manager for PyMySQL connections.
+Connections are created lazily between DB_MIN_CONN and DB_MAX_CONN, validated on checkout
+(ping after DB_POOL_PING_INTERVAL_SEC of idleness), recycled after DB_POOL_MAX_AGE_SEC and
+trimmed back towards DB_MIN_CONN after DB_POOL_IDLE_TIMEOUT_SEC idle.
+Prefer `with pool.connection() as conn:` which always hands the connection back (and
+discards it if the block failed with a connection-level error).
+
+asyncio code runs its (blocking) queries with `await run_blocking(fn, *args)`, on a thread
+pool of DB_ASYNC_THREADS threads (default DB_MAX_CONN) shared by the whole process, so the
+number of threads does not grow with the number of in-flight requests.
 """
 
-from queue import Queue, Empty
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+import asyncio
 import pymysql
 import threading
+import time
 import os
 from loguru import logger
+from services.metrics import DB_POOL_WAIT
 from typing import Optional
 from dotenv import load_dotenv
 
@@ -20,55 +33,211 @@ DB_USER = os.getenv("DB_USER", "root")
 DB_PASSWORD = os.getenv("DB_PASSWORD", "thbs123!")
 DB_NAME = os.getenv("DB_NAME", "pricing_db")
 DB_MAX_CONN = int(os.getenv("DB_MAX_CONN", 10))
+DB_MIN_CONN = int(os.getenv("DB_MIN_CONN", 1))
+DB_POOL_TIMEOUT_SEC = float(os.getenv("DB_POOL_TIMEOUT_SEC", 5))
+DB_POOL_MAX_AGE_SEC = float(os.getenv("DB_POOL_MAX_AGE_SEC", 3600))
+DB_POOL_IDLE_TIMEOUT_SEC = float(os.getenv("DB_POOL_IDLE_TIMEOUT_SEC", 300))
+DB_POOL_PING_INTERVAL_SEC = float(os.getenv("DB_POOL_PING_INTERVAL_SEC", 30))
+# threads running blocking queries for asyncio callers (more would only wait for a connection)
+DB_ASYNC_THREADS = int(os.getenv("DB_ASYNC_THREADS", DB_MAX_CONN))
+
+def _connect(cursorclass=pymysql.cursors.DictCursor):
+    return pymysql.connect(host=DB_HOST, port=DB_PORT, user=DB_USER,
+                           password=DB_PASSWORD, database=DB_NAME,
+                           cursorclass=cursorclass,
+                           autocommit=True)
+
+class _Entry:
+    __slots__ = ("conn", "created_at", "last_used")
 
-class SimpleMySQLPool:
+    def __init__(self, conn):
+        self.conn = conn
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+
+class MySQLPool:
     _instance = None
     _lock = threading.Lock()
 
-    def __init__(self, size=10):
-        self.size = size
-        self._pool = Queue(maxsize=size)
-        for _ in range(size):
-            conn = pymysql.connect(host=DB_HOST, port=DB_PORT, user=DB_USER,
-                                   password=DB_PASSWORD, database=DB_NAME,
-                                   cursorclass=pymysql.cursors.DictCursor,
-                                   autocommit=True)
-            self._pool.put(conn)
-        logger.info(f"MySQL pool initialized with {size} connections")
+    def __init__(self, min_size=DB_MIN_CONN, max_size=DB_MAX_CONN, max_age=DB_POOL_MAX_AGE_SEC,
+                 idle_timeout=DB_POOL_IDLE_TIMEOUT_SEC, ping_interval=DB_POOL_PING_INTERVAL_SEC):
+        self.min_size = max(0, min(min_size, max_size))
+        self.max_size = max_size
+        self.max_age = max_age
+        self.idle_timeout = idle_timeout
+        self.ping_interval = ping_interval
+        self._cond = threading.Condition(threading.Lock())
+        self._idle = deque()  # most recently returned on the right
+        self._in_use = {}  # id(conn) -> _Entry
+        self._size = 0  # idle + in use + being created
+        self._closed = False
+        # stats
+        self.created = 0
+        self.closed_count = 0
+        self.checkouts = 0
+        self.timeouts = 0
+        self.validation_failures = 0
+        for _ in range(self.min_size):
+            self._size += 1
+            try:
+                self._idle.append(self._create())
+            except Exception as e:
+                logger.error(f"MySQL pool could not pre-open connection: {e}")
+                break
+        logger.info(f"MySQL pool initialized (min={self.min_size}, max={self.max_size}, open={self._size})")
 
     @classmethod
     def instance(cls):
         with cls._lock:
             if cls._instance is None:
-                cls._instance = SimpleMySQLPool(size=DB_MAX_CONN)
+                cls._instance = MySQLPool()
             return cls._instance
 
-    def get_conn(self, timeout=5):
+    @classmethod
+    def reset_after_fork(cls):
+        """
+        In a forked worker: forget the parent's pool without closing its connections
+        (that would send COM_QUIT on sockets the parent still owns); the worker opens its
+        own on first use.
+        """
+        global _executor, _executor_lock
+        cls._lock = threading.Lock()
+        cls._instance = None
+        _executor, _executor_lock = None, threading.Lock()
+
+    def _create(self):
+        """
+        Open a new connection into a slot already reserved by incrementing _size.
+        The caller must not hold the condition lock.
+        """
+        try:
+            entry = _Entry(_connect())
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+        with self._cond:
+            self.created += 1
+        return entry
+
+    def _discard(self, entry):
         try:
-            return self._pool.get(timeout=timeout)
-        except Empty:
-            raise RuntimeError("No DB connection available")
-    
+            entry.conn.close()
+        except Exception:
+            pass
+        with self._cond:
+            self._size -= 1
+            self.closed_count += 1
+            self._cond.notify()
+
+    def _usable(self, entry, now):
+        """
+        Age and liveness check for an idle connection taken out of the pool.
+        """
+        if self.max_age and now - entry.created_at > self.max_age:
+            return False
+        if not entry.conn.open:
+            return False
+        if now - entry.last_used >= self.ping_interval:
+            try:
+                entry.conn.ping(reconnect=False)
+            except Exception:
+                with self._cond:
+                    self.validation_failures += 1
+                return False
+        return True
+
+    def get_conn(self, timeout=DB_POOL_TIMEOUT_SEC):
+        """
+        Check out a validated connection, opening a new one if below max_size, otherwise
+        waiting up to timeout seconds. Pair with return_conn, or use connection().
+        """
+        started = time.monotonic()
+        deadline = started + timeout
+        while True:
+            entry = None
+            create = False
+            with self._cond:
+                if self._closed:
+                    raise RuntimeError("DB pool is closed")
+                while not self._idle and self._size >= self.max_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.timeouts += 1
+                        raise RuntimeError("No DB connection available")
+                    self._cond.wait(remaining)
+                if self._idle:
+                    entry = self._idle.pop()
+                else:
+                    self._size += 1  # reserve the slot before connecting outside the lock
+                    create = True
+            if create:
+                entry = self._create()
+            elif not self._usable(entry, time.monotonic()):
+                self._discard(entry)
+                continue
+            now = time.monotonic()
+            entry.last_used = now
+            with self._cond:
+                self._in_use[id(entry.conn)] = entry
+                self.checkouts += 1
+            DB_POOL_WAIT.observe(now - started)
+            return entry.conn
+
+    def return_conn(self, conn, discard=False):
+        """
+        Hand a connection back. Closed, over-age or explicitly discarded connections are
+        closed instead of being pooled; idle connections above min_size are trimmed.
+        """
+        with self._cond:
+            entry = self._in_use.pop(id(conn), None)
+        if entry is None:
+            # not checked out from this pool (e.g. pool was reset after fork)
+            try:
+                conn.close()
+            except Exception:
+                pass
+            return
+        now = time.monotonic()
+        if discard or self._closed or not conn.open or (self.max_age and now - entry.created_at > self.max_age):
+            self._discard(entry)
+            return
+        entry.last_used = now
+        stale = []
+        with self._cond:
+            self._idle.append(entry)
+            while len(self._idle) > self.min_size and now - self._idle[0].last_used > self.idle_timeout:
+                stale.append(self._idle.popleft())
+            self._cond.notify()
+        for old in stale:
+            self._discard(old)
+
+    @contextmanager
+    def connection(self, timeout=DB_POOL_TIMEOUT_SEC):
+        """
+        with pool.connection() as conn: ...
+        Always returns the connection; a connection-level error discards it.
+        """
+        conn = self.get_conn(timeout=timeout)
+        broken = False
+        try:
+            yield conn
+        except (pymysql.err.OperationalError, pymysql.err.InterfaceError):
+            broken = True
+            raise
+        finally:
+            self.return_conn(conn, discard=broken)
+
     def get_pandas_conn(self, timeout=5):
         """Get a connection suitable for pandas read_sql (without DictCursor)"""
         try:
-            conn = pymysql.connect(host=DB_HOST, port=DB_PORT, user=DB_USER,
-                                   password=DB_PASSWORD, database=DB_NAME,
-                                   autocommit=True)
+            conn = _connect(cursorclass=pymysql.cursors.Cursor)
             return conn
         except Exception as e:
             logger.error(f"Failed to create pandas connection: {e}")
             raise
 
-    def return_conn(self, conn):
-        try:
-            self._pool.put(conn, timeout=2)
-        except Exception:
-            try:
-                conn.close()
-            finally:
-                pass
-    
     def close_pandas_conn(self, conn):
         """Close a pandas connection (not returned to pool)"""
         try:
@@ -76,7 +245,53 @@ class SimpleMySQLPool:
         except Exception:
             pass
 
+    def stats(self):
+        """
+        Pool sizing stats: open/in-use/idle counts and lifetime counters. Checkout wait
+        time is the pricing_db_pool_wait_seconds histogram (services.metrics).
+        """
+        with self._cond:
+            return {
+                "size": self._size,
+                "in_use": len(self._in_use),
+                "idle": len(self._idle),
+                "min_size": self.min_size,
+                "max_size": self.max_size,
+                "created": self.created,
+                "closed": self.closed_count,
+                "checkouts": self.checkouts,
+                "timeouts": self.timeouts,
+                "validation_failures": self.validation_failures,
+            }
+
     def close_all(self):
-        while not self._pool.empty():
-            conn = self._pool.get_nowait()
-            conn.close()
+        with self._cond:
+            self._closed = True
+            idle = list(self._idle)
+            self._idle.clear()
+            self._cond.notify_all()
+        for entry in idle:
+            self._discard(entry)
+
+# Backwards-compatible name used throughout the codebase
+SimpleMySQLPool = MySQLPool
+
+_executor = None
+_executor_lock = threading.Lock()
+
+def db_executor():
+    """
+    Process-wide thread pool for blocking DB calls made from asyncio code.
+    """
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=DB_ASYNC_THREADS, thread_name_prefix="db-async")
+    return _executor
+
+async def run_blocking(fn, *args):
+    """
+    await fn(*args) run on db_executor(), leaving the event loop free meanwhile.
+    """
+    return await asyncio.get_running_loop().run_in_executor(db_executor(), fn, *args)
@@ -7,45 +7,194 @@ Assumes ETL extracts raw tables to DataFrames and then transforms.
 
 from datetime import datetime, timedelta, date
 import pandas as pd
-from services.db_pool import SimpleMySQLPool
+from services.db_pool import SimpleMySQLPool, run_blocking
+from services.cache import get_cache, invalidate, FEATURES_CACHE, LATEST_PRICE_CACHE
 import logging
 import json
+import os
+import time
+import numpy as np
 
 logger = logging.getLogger(__name__)
 
-def write_features_to_db(df: pd.DataFrame):
+FEATURES_LOAD_CHUNK_ROWS = int(os.getenv("FEATURES_LOAD_CHUNK_ROWS", 5000))
+
+# (column, kind, default when the column is missing or null), in features_daily order
+FEATURE_TABLE_COLUMNS = (
+    ('feature_date', 'date', None),
+    ('sku', 'str', None),
+    ('sales_7d', 'int', 0),
+    ('sales_14d', 'int', 0),
+    ('sales_30d', 'int', 0),
+    ('avg_price_7d', 'float', 0.0),
+    ('avg_price_14d', 'float', 0.0),
+    ('avg_price_30d', 'float', 0.0),
+    ('views_7d', 'int', 0),
+    ('addtocart_7d', 'int', 0),
+    ('conversion_7d', 'float', 0.0),
+    ('inventory_qty', 'int', 0),
+    ('inventory_age_days', 'int', 0),
+    ('promo_active', 'bool', False),
+    ('last_price', 'float', 0.0),
+)
+
+# rows, seconds and rows/sec of the most recent write_features_to_db call
+LAST_LOAD_REPORT = {}
+
+def _column_values(df: pd.DataFrame, name, kind, default):
+    """
+    Python values for one features_daily column, converted column-wise.
+    """
+    if name not in df.columns:
+        return [default] * len(df)
+    col = df[name]
+    if kind == 'date':
+        return pd.to_datetime(col).dt.strftime("%Y-%m-%d").tolist()
+    if kind == 'str':
+        return col.astype(str).tolist()
+    if kind == 'int':
+        return pd.to_numeric(col, errors='coerce').fillna(default).astype(np.int64).tolist()
+    if kind == 'bool':
+        return col.fillna(default).astype(bool).tolist()
+    values = pd.to_numeric(col, errors='coerce').astype(np.float64)
+    return values.replace([np.inf, -np.inf], np.nan).fillna(default).tolist()
+
+def feature_rows(df: pd.DataFrame):
+    """
+    features_daily parameter tuples for a feature DataFrame.
+    """
+    columns = [_column_values(df, name, kind, default) for name, kind, default in FEATURE_TABLE_COLUMNS]
+    return list(zip(*columns))
+
+def write_features_to_db(df: pd.DataFrame, chunk_rows=FEATURES_LOAD_CHUNK_ROWS):
     """
     Write the feature DataFrame to features_daily table.
     df must match schema fields.
+
+    Rows are bulk-loaded with chunked executemany into a session-private staging table
+    (CREATE TEMPORARY TABLE ... LIKE features_daily), then published with a single
+    REPLACE ... SELECT in one transaction, so readers see all of the new rows or none.
+    The staging table is dropped afterwards and on failure (and disappears with the
+    session if the connection dies). Returns {'rows', 'load_seconds',
+    'publish_seconds', 'rows_per_sec'}, also kept in LAST_LOAD_REPORT.
+    """
+    started = time.time()
+    rows = feature_rows(df)
+    columns = ", ".join(name for name, _, _ in FEATURE_TABLE_COLUMNS)
+    placeholders = ",".join(["%s"] * len(FEATURE_TABLE_COLUMNS))
+    staging = "features_daily_staging"
+    pool = SimpleMySQLPool.instance()
+    with pool.connection() as conn:
+        with conn.cursor() as cur:
+            try:
+                cur.execute(f"DROP TEMPORARY TABLE IF EXISTS {staging}")
+                cur.execute(f"CREATE TEMPORARY TABLE {staging} LIKE features_daily")
+                insert_sql = f"INSERT INTO {staging} ({columns}) VALUES ({placeholders})"
+                for start in range(0, len(rows), chunk_rows):
+                    cur.executemany(insert_sql, rows[start:start + chunk_rows])
+                conn.commit()
+                loaded = time.time()
+                cur.execute(f"REPLACE INTO features_daily ({columns}) SELECT {columns} FROM {staging}")
+                conn.commit()
+                published = time.time()
+            except Exception:
+                conn.rollback()
+                raise
+            finally:
+                try:
+                    cur.execute(f"DROP TEMPORARY TABLE IF EXISTS {staging}")
+                except Exception as e:
+                    logger.warning(f"Could not drop {staging}: {e}")
+    elapsed = published - started
+    report = {
+        'rows': len(rows),
+        'load_seconds': round(loaded - started, 3),
+        'publish_seconds': round(published - loaded, 3),
+        'rows_per_sec': round(len(rows) / elapsed, 1) if elapsed > 0 else None,
+    }
+    LAST_LOAD_REPORT.clear()
+    LAST_LOAD_REPORT.update(report)
+    logger.info("features_daily: published %d rows (load %.2fs, publish %.2fs, %s rows/s)",
+                report['rows'], report['load_seconds'], report['publish_seconds'], report['rows_per_sec'])
+    skus = df['sku'].unique().tolist() if 'sku' in df.columns else None
+    invalidate(FEATURES_CACHE, skus)
+    # latest price falls back to features_daily.last_price for SKUs without orders
+    invalidate(LATEST_PRICE_CACHE, skus)
+    return report
+
+# Used when a SKU has no row in features_daily (new SKU or feature store unavailable)
+DEFAULT_BASE_FEATURES = {
+    'last_price': 50.0,
+    'avg_price_7d': 50.0,
+    'views_7d': 100,
+    'addtocart_7d': 10,
+    'conversion_7d': 0.1,
+    'inventory_qty': 50,
+    'inventory_age_days': 5,
+    'promo_active': False,
+}
+
+def row_to_base_features(row: dict):
+    """
+    Convert a features_daily row into the base_features dict used by the pricing engine.
     """
+    return {
+        'last_price': float(row.get('last_price') or 0.0),
+        'avg_price_7d': float(row.get('avg_price_7d') or 0.0),
+        'views_7d': int(row.get('views_7d') or 0),
+        'addtocart_7d': int(row.get('addtocart_7d') or 0),
+        'conversion_7d': float(row.get('conversion_7d') or 0.0),
+        'inventory_qty': int(row.get('inventory_qty') or 0),
+        'inventory_age_days': int(row.get('inventory_age_days') or 0),
+        'promo_active': bool(row.get('promo_active') or False),
+    }
+
+_features_cache = get_cache(FEATURES_CACHE)
+
+def _fetch_latest_features_row(sku):
     pool = SimpleMySQLPool.instance()
-    conn = pool.get_conn()
-    try:
+    with pool.connection() as conn:
         with conn.cursor() as cur:
-            insert_sql = """
-            REPLACE INTO features_daily
-            (feature_date, sku, sales_7d, sales_14d, sales_30d, avg_price_7d, avg_price_14d, avg_price_30d,
-             views_7d, addtocart_7d, conversion_7d, inventory_qty, inventory_age_days, promo_active, last_price)
-            VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s)
-            """
-            for _, row in df.iterrows():
-                cur.execute(insert_sql, (
-                    row['feature_date'].strftime("%Y-%m-%d"),
-                    row['sku'],
-                    int(row.get('sales_7d', 0)),
-                    int(row.get('sales_14d', 0)),
-                    int(row.get('sales_30d', 0)),
-                    float(row.get('avg_price_7d') or 0.0),
-                    float(row.get('avg_price_14d') or 0.0),
-                    float(row.get('avg_price_30d') or 0.0),
-                    int(row.get('views_7d', 0)),
-                    int(row.get('addtocart_7d', 0)),
-                    float(row.get('conversion_7d', 0.0)),
-                    int(row.get('inventory_qty', 0)),
-                    int(row.get('inventory_age_days', 0)),
-                    bool(row.get('promo_active', False)),
-                    float(row.get('last_price') or 0.0),
-                ))
-        conn.commit()
-    finally:
-        pool.return_conn(conn)
+            cur.execute("SELECT * FROM features_daily WHERE sku=%s ORDER BY feature_date DESC LIMIT 1", (sku,))
+            return cur.fetchone()
+
+def _fetch_latest_features_rows(skus):
+    found = {}
+    if skus:
+        placeholders = ",".join(["%s"] * len(skus))
+        sql = f"""
+        SELECT f.* FROM features_daily f
+        JOIN (
+            SELECT sku, MAX(feature_date) AS mx FROM features_daily WHERE sku IN ({placeholders}) GROUP BY sku
+        ) latest ON f.sku = latest.sku AND f.feature_date = latest.mx
+        """
+        pool = SimpleMySQLPool.instance()
+        with pool.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(sql, skus)
+                for row in cur.fetchall():
+                    found[row['sku']] = row
+    return found
+
+def get_latest_features(sku):
+    """
+    Latest feature row for a SKU as base_features; defaults if none is stored.
+    Served from a read-through cache invalidated by write_features_to_db.
+    """
+    row = _features_cache.get_or_load(sku, _fetch_latest_features_row)
+    return row_to_base_features(row) if row else dict(DEFAULT_BASE_FEATURES)
+
+async def get_latest_features_async(sku):
+    """
+    asyncio variant of get_latest_features: a cache miss queries on the DB executor.
+    """
+    row = await _features_cache.get_or_load_async(sku, lambda key: run_blocking(_fetch_latest_features_row, key))
+    return row_to_base_features(row) if row else dict(DEFAULT_BASE_FEATURES)
+
+def get_latest_features_bulk(skus):
+    """
+    Latest feature row per SKU, with one query for all cache misses.
+    Returns dict sku -> base_features; SKUs without features get the defaults.
+    """
+    rows = _features_cache.get_many(skus, _fetch_latest_features_rows)
+    return {sku: row_to_base_features(row) if row else dict(DEFAULT_BASE_FEATURES) for sku, row in rows.items()}
@@ -23,8 +23,7 @@ def save_feedback(payload: dict):
     }
     """
     pool = SimpleMySQLPool.instance()
-    conn = pool.get_conn()
-    try:
+    with pool.connection() as conn:
         with conn.cursor() as cur:
             sql = """
             INSERT INTO vendor_feedback (suggestion_id, sku, vendor_id, feedback_ts, accepted, new_price, note)
@@ -39,6 +38,4 @@ def save_feedback(payload: dict):
                 payload.get('note')
             ))
         conn.commit()
-    finally:
-        pool.return_conn(conn)
     logger.info("Saved feedback for sku %s", payload.get('sku'))
@@ -0,0 +1,199 @@
+# services/metrics.py
+"""
+Prometheus metrics for the pricing service.
+Metric objects live here so every module records into the same registry.
+
+Multi-worker deployments set PROMETHEUS_MULTIPROC_DIR (an empty, writable directory) in the
+environment before the workers start; each process then writes its samples there and
+/metrics aggregates all of them. Gauges declare how they are combined across processes.
+The directory must be wiped on deploy, and a dead worker's files are released with
+mark_worker_dead(pid) (e.g. from the gunicorn child_exit hook).
+"""
+
+import os
+import threading
+import time
+from contextlib import contextmanager
+from prometheus_client import (Counter, Gauge, Histogram, CollectorRegistry, REGISTRY,
+                               generate_latest, CONTENT_TYPE_LATEST)
+
+PROMETHEUS_MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+METRICS_REFRESH_INTERVAL_SEC = float(os.getenv("METRICS_REFRESH_INTERVAL_SEC", 1.0))
+
+# Serving stages are sub-millisecond to tens of milliseconds
+STAGE_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+REQUEST_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+MODEL_RELOADS = Counter(
+    "pricing_model_reloads_total",
+    "Number of times a new demand model artifact was swapped in",
+    ["model"],
+)
+MODEL_RELOAD_FAILURES = Counter(
+    "pricing_model_reload_failures_total",
+    "Number of failed attempts to load a changed demand model artifact",
+    ["model"],
+)
+MODEL_LOADED_TIMESTAMP = Gauge(
+    "pricing_model_loaded_timestamp_seconds",
+    "Unix time at which the currently served demand model was loaded",
+    ["model"],
+    multiprocess_mode="livemax",
+)
+MODEL_INFO = Gauge(
+    "pricing_model_info",
+    "1 for the demand model version currently served (registry version, or meta saved_at for pre-registry artifacts)",
+    ["model", "version"],
+    multiprocess_mode="livemax",
+)
+
+SEGMENT_MODEL_REQUESTS = Counter(
+    "pricing_segment_model_requests_total",
+    "Segment demand model lookups by segment and result (hit: already loaded, miss: loaded "
+    "on demand, error: load failed and the global model served the SKU)",
+    ["model", "segment", "result"],
+)
+SEGMENT_MODEL_LOAD_SECONDS = Histogram(
+    "pricing_segment_model_load_seconds",
+    "Time to load a segment demand model on a cache miss",
+    ["model"],
+    buckets=REQUEST_BUCKETS,
+)
+SEGMENT_MODEL_CACHE = Gauge(
+    "pricing_segment_model_cache",
+    "Segment demand models held in memory: entries, and estimated bytes",
+    ["model", "unit"],
+    multiprocess_mode="livesum",
+)
+SEGMENT_MODEL_EVICTIONS = Counter(
+    "pricing_segment_model_evictions_total",
+    "Segment demand models evicted from memory to stay under DEMAND_SEGMENT_CACHE_MB",
+    ["model"],
+)
+
+REQUESTS = Counter(
+    "pricing_requests_total",
+    "API requests by endpoint, HTTP status and where the answer came from",
+    ["endpoint", "status", "served_from"],
+)
+REQUEST_LATENCY = Histogram(
+    "pricing_request_latency_seconds",
+    "End-to-end handler latency",
+    ["endpoint", "served_from"],
+    buckets=REQUEST_BUCKETS,
+)
+STAGE_LATENCY = Histogram(
+    "pricing_suggest_stage_seconds",
+    "Time spent in each stage of a price suggestion: feature_store (route), model_load, "
+    "feature_fetch, candidates, predict, constraints, persist (mode: single request or batch call)",
+    ["mode", "stage"],
+    buckets=STAGE_BUCKETS,
+)
+FALLBACKS = Counter(
+    "pricing_fallbacks_total",
+    "Degraded paths taken while serving (default_features, flat_demand)",
+    ["kind"],
+)
+
+DB_POOL_CONNECTIONS = Gauge(
+    "pricing_db_pool_connections",
+    "DB pool connections by state (open, in_use, idle)",
+    ["state"],
+    multiprocess_mode="livesum",
+)
+DB_POOL_WAIT = Histogram(
+    "pricing_db_pool_wait_seconds",
+    "Time spent waiting to check a connection out of the DB pool",
+    buckets=STAGE_BUCKETS,
+)
+WRITE_BEHIND_QUEUE = Gauge(
+    "pricing_write_behind_queue_rows",
+    "Rows waiting in the write-behind queue",
+    multiprocess_mode="livesum",
+)
+WRITE_BEHIND_DROPPED = Gauge(
+    "pricing_write_behind_dropped_rows",
+    "Rows dropped by the write-behind queue since process start",
+    multiprocess_mode="livesum",
+)
+CACHE_ENTRIES = Gauge(
+    "pricing_lookup_cache_entries",
+    "Entries held by each serving lookup cache",
+    ["cache"],
+    multiprocess_mode="livesum",
+)
+
+@contextmanager
+def stage_timer(stage, mode="single"):
+    """
+    with stage_timer("predict"): ... records the block's duration in STAGE_LATENCY.
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_LATENCY.labels(mode, stage).observe(time.perf_counter() - started)
+
+def set_model_version(model, version, previous=None):
+    if previous is not None and previous != version:
+        MODEL_INFO.labels(model, str(previous)).set(0)
+    MODEL_INFO.labels(model, str(version)).set(1)
+
+_last_refresh = 0.0
+_refresh_lock = threading.Lock()
+
+def refresh_runtime_gauges(force=False):
+    """
+    Copy this process's pool / write-behind / cache stats into gauges. Called after
+    requests (at most every METRICS_REFRESH_INTERVAL_SEC) so every worker keeps its own
+    samples current, not only the one that happens to serve the scrape.
+    """
+    global _last_refresh
+    now = time.monotonic()
+    if not force and now - _last_refresh < METRICS_REFRESH_INTERVAL_SEC:
+        return
+    if not _refresh_lock.acquire(blocking=False):
+        return
+    try:
+        _last_refresh = now
+        # imported lazily: these modules import this one
+        from services.db_pool import MySQLPool
+        from services.write_behind import WriteBehindWriter
+        from services.cache import cache_stats
+        pool = MySQLPool._instance
+        if pool is not None:
+            s = pool.stats()
+            DB_POOL_CONNECTIONS.labels("open").set(s["size"])
+            DB_POOL_CONNECTIONS.labels("in_use").set(s["in_use"])
+            DB_POOL_CONNECTIONS.labels("idle").set(s["idle"])
+        writer = WriteBehindWriter._instance
+        if writer is not None:
+            s = writer.stats()
+            WRITE_BEHIND_QUEUE.set(s["queued"])
+            WRITE_BEHIND_DROPPED.set(s["dropped"])
+        for s in cache_stats():
+            CACHE_ENTRIES.labels(s["name"]).set(s["size"])
+    finally:
+        _refresh_lock.release()
+
+def metrics_payload():
+    """
+    (body, content_type) for the /metrics endpoint, aggregated across worker processes
+    when PROMETHEUS_MULTIPROC_DIR is set.
+    """
+    refresh_runtime_gauges(force=True)
+    if PROMETHEUS_MULTIPROC_DIR:
+        from prometheus_client import multiprocess
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+def mark_worker_dead(pid):
+    """
+    Drop the live gauges of an exited worker (multiprocess mode only).
+    """
+    if PROMETHEUS_MULTIPROC_DIR:
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(pid)
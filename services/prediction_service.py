@@ -5,29 +5,527 @@ This module is used by pricing_engine and API.
 """
 
 import os
-import sys
+import time
+import threading
+from collections import OrderedDict
 import numpy as np
 import pandas as pd
-from models.model_utils import load_model
-from typing import Dict, Any
+from models.model_utils import (load_model, current_version, artifact_paths, segment_model_name,
+                                segment_index_name, route_segment)
+from services.metrics import (MODEL_RELOADS, MODEL_RELOAD_FAILURES, MODEL_LOADED_TIMESTAMP, FALLBACKS, set_model_version,
+                              SEGMENT_MODEL_REQUESTS, SEGMENT_MODEL_LOAD_SECONDS, SEGMENT_MODEL_CACHE,
+                              SEGMENT_MODEL_EVICTIONS)
+from typing import Dict, Any, List
 from loguru import logger
 
 DEFAULT_DEMAND_MODEL_DIR = os.getenv("DEMAND_MODEL_DIR", "./models_artifacts/demand")
 DEFAULT_ELASTICITY_DIR = os.getenv("ELASTICITY_MODEL_DIR", "./models_artifacts/elasticity")
+MODEL_RELOAD_INTERVAL_SEC = float(os.getenv("MODEL_RELOAD_INTERVAL_SEC", 30))
+# "booster": the model's native predictor chosen from meta['model_type'] (LightGBM on a NumPy
+# matrix, XGBoost via inplace_predict, anything else with a DataFrame); "joblib": always the
+# generic DataFrame path
+DEMAND_PREDICT_BACKEND = os.getenv("DEMAND_PREDICT_BACKEND", "booster").lower()
+# SKUs in the synthetic batch predicted after every load, before the model serves
+MODEL_WARMUP_BATCH = int(os.getenv("MODEL_WARMUP_BATCH", 64))
+# memory budget for lazily loaded segment demand models (estimated from artifact sizes)
+DEMAND_SEGMENT_CACHE_MB = float(os.getenv("DEMAND_SEGMENT_CACHE_MB", 512))
 
 def load_demand_model(model_dir=DEFAULT_DEMAND_MODEL_DIR, model_name="demand_model"):
     model, meta = load_model(model_dir, model_name)
     return model, meta
 
-def predict_units_for_prices(model, meta, base_features: Dict[str, Any], candidate_prices: list):
+class PredictorBackend:
     """
-    base_features: dict of feature_name -> value (includes last_price etc.)
-    candidate_prices: list of floats to test
-    Returns DataFrame with columns: price, predicted_units
+    Serving wrapper around a loaded model: predict() takes a float64 matrix whose columns
+    are meta['feature_columns'] and returns one prediction per row. `model` is the
+    wrapped object (Booster, estimator).
+    """
+    name = None
+
+    def __init__(self, model, meta):
+        self.model = model
+        self.feature_columns = list(meta.get('feature_columns') or [])
+
+    def predict(self, X):
+        raise NotImplementedError
+
+class LightGBMBackend(PredictorBackend):
+    """
+    Booster.predict on the NumPy matrix (no DataFrame); uses best_iteration like the default.
+    """
+    name = "lightgbm"
+
+    def predict(self, X):
+        return self.model.predict(X)
+
+class XGBoostBackend(PredictorBackend):
+    """
+    Booster.inplace_predict on the NumPy matrix: no DMatrix construction per call.
+    """
+    name = "xgboost"
+
+    def __init__(self, model, meta):
+        super().__init__(model, meta)
+        best = meta.get('best_iteration')
+        self.iteration_range = (0, int(best) + 1) if best is not None else (0, 0)
+
+    def predict(self, X):
+        return self.model.inplace_predict(X, iteration_range=self.iteration_range)
+
+class JoblibBackend(PredictorBackend):
+    """
+    Any estimator with predict(DataFrame), e.g. scikit-learn models saved with joblib.
+    """
+    name = "joblib"
+
+    def predict(self, X):
+        return self.model.predict(pd.DataFrame(X, columns=self.feature_columns))
+
+PREDICTOR_BACKENDS = {
+    'lightgbm': LightGBMBackend,
+    'xgboost': XGBoostBackend,
+    'joblib': JoblibBackend,
+}
+
+def _native_backend(model, meta):
+    model_type = meta.get('model_type')
+    module = type(model).__module__
+    if model_type == 'xgboost' or module.startswith('xgboost'):
+        return XGBoostBackend if hasattr(model, 'inplace_predict') else JoblibBackend
+    if model_type in (None, 'lightgbm') and module.startswith('lightgbm'):
+        return LightGBMBackend
+    return JoblibBackend
+
+def serving_model(model, meta, backend=DEMAND_PREDICT_BACKEND):
+    """
+    The PredictorBackend used for serving: chosen from the model metadata, or the
+    joblib backend when DEMAND_PREDICT_BACKEND asks for it.
+    """
+    if isinstance(model, PredictorBackend):
+        return model
+    if backend == "joblib":
+        return JoblibBackend(model, meta)
+    return _native_backend(model, meta)(model, meta)
+
+def model_version(meta):
+    return meta.get('version') or meta.get('saved_at')
+
+def warmup_model(model, meta, batch=MODEL_WARMUP_BATCH):
+    """
+    Run synthetic predictions at the serving shapes (one SKU grid, then a batch) so the
+    first real requests do not pay for lazy initialization. Returns the seconds taken.
+    """
+    from services.feature_store import DEFAULT_BASE_FEATURES
+    started = time.perf_counter()
+    base = dict(DEFAULT_BASE_FEATURES)
+    prices = list(np.linspace(0.8, 1.2, 21) * float(base.get('last_price', 50.0)))
+    predict_raw_units_for_price_grids(model, meta, [base], [prices])
+    if batch > 1:
+        predict_raw_units_for_price_grids(model, meta, [base] * batch, [prices] * batch)
+    return time.perf_counter() - started
+
+class DemandModelHolder:
+    """
+    Process-wide holder for the serving demand model.
+    The model is loaded once; a background thread polls the registry's CURRENT pointer
+    (or, for pre-registry flat artifacts, the files' mtime/size) and swaps in a new
+    (model, meta) pair when it changes. Every load is warmed up before the swap. Callers
+    take a snapshot via get() and keep using it for the whole request, so a swap never
+    affects in-flight requests.
+    """
+    _instances = {}
+    _lock = threading.Lock()
+
+    def __init__(self, model_dir=DEFAULT_DEMAND_MODEL_DIR, model_name="demand_model",
+                 reload_interval=MODEL_RELOAD_INTERVAL_SEC):
+        self.model_dir = model_dir
+        self.model_name = model_name
+        self.reload_interval = reload_interval
+        self._current = None  # (model, meta, signature) - replaced as a whole, never mutated
+        self._load_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._watcher = None
+        self.reload_count = 0
+        self.reload_failures = 0
+        self.loaded_at = None
+        self.warmup_seconds = None
+
+    @classmethod
+    def instance(cls, model_dir=DEFAULT_DEMAND_MODEL_DIR, model_name="demand_model"):
+        key = (os.path.abspath(model_dir), model_name)
+        with cls._lock:
+            if key not in cls._instances:
+                cls._instances[key] = DemandModelHolder(model_dir, model_name)
+            return cls._instances[key]
+
+    @classmethod
+    def reset_after_fork(cls):
+        """
+        In a forked worker: new locks (the parent's may have been held at fork time) and
+        a watcher thread per holder, after picking up any version published since the
+        parent loaded its model.
+        """
+        cls._lock = threading.Lock()
+        for holder in list(cls._instances.values()):
+            holder._load_lock = threading.Lock()
+            holder._stop = threading.Event()
+            holder._watcher = None
+            if holder._current is not None:
+                holder.reload_if_changed()
+                holder.start_watcher()
+
+    @property
+    def ready(self):
+        """
+        True once a model has been loaded and warmed up in this process.
+        """
+        return self._current is not None
+
+    def _artifact_signature(self):
+        version = current_version(self.model_dir, self.model_name)
+        if version is not None:
+            return ("version", version)
+        sig = []
+        for suffix in (".joblib", ".meta.json"):
+            path = os.path.join(self.model_dir, f"{self.model_name}{suffix}")
+            try:
+                st = os.stat(path)
+                sig.append((st.st_mtime_ns, st.st_size))
+            except OSError:
+                sig.append(None)
+        return tuple(sig)
+
+    def get(self):
+        """
+        Return the current (model, meta) pair, loading it on first use.
+        """
+        current = self._current
+        if current is None:
+            with self._load_lock:
+                if self._current is None:
+                    self._load(self._artifact_signature())
+                current = self._current
+            self.start_watcher()
+        return current[0], current[1]
+
+    def _load(self, signature):
+        version = signature[1] if signature and signature[0] == "version" else None
+        model, meta = load_model(self.model_dir, self.model_name, version=version)
+        model = serving_model(model, meta)
+        self.warmup_seconds = warmup_model(model, meta)
+        previous = self._current
+        self._current = (model, meta, signature)
+        self.loaded_at = time.time()
+        MODEL_LOADED_TIMESTAMP.labels(model=self.model_name).set(self.loaded_at)
+        set_model_version(self.model_name, model_version(meta), model_version(previous[1]) if previous else None)
+        logger.info(f"Demand model '{self.model_name}' loaded (version {model_version(meta)}, "
+                    f"warmup {self.warmup_seconds * 1000:.0f} ms)")
+
+    def reload_if_changed(self):
+        """
+        Swap in the artifact on disk if it differs from the loaded one.
+        Returns True when a new model was swapped in. A failed load keeps serving the old model.
+        """
+        signature = self._artifact_signature()
+        current = self._current
+        if current is not None and current[2] == signature:
+            return False
+        with self._load_lock:
+            if self._current is not current:
+                return False  # another thread swapped while we waited
+            try:
+                self._load(signature)
+            except Exception as e:
+                self.reload_failures += 1
+                MODEL_RELOAD_FAILURES.labels(model=self.model_name).inc()
+                logger.error(f"Demand model reload failed, keeping current model: {e}")
+                return False
+        if current is not None:
+            self.reload_count += 1
+            MODEL_RELOADS.labels(model=self.model_name).inc()
+        return True
+
+    def _watch(self):
+        while not self._stop.wait(self.reload_interval):
+            try:
+                self.reload_if_changed()
+            except Exception:
+                logger.exception("Demand model watcher error")
+
+    def start_watcher(self):
+        if self.reload_interval <= 0:
+            return
+        with self._lock:
+            if self._watcher is not None and self._watcher.is_alive():
+                return
+            self._stop.clear()
+            self._watcher = threading.Thread(target=self._watch, name=f"model-watcher-{self.model_name}", daemon=True)
+            self._watcher.start()
+
+    def stop_watcher(self, timeout=None):
+        self._stop.set()
+        watcher = self._watcher
+        if timeout is not None and watcher is not None:
+            watcher.join(timeout)
+
+    def stats(self):
+        current = self._current
+        return {
+            "model_name": self.model_name,
+            "model_version": model_version(current[1]) if current else None,
+            "ready": current is not None,
+            "warmup_seconds": self.warmup_seconds,
+            "backend": current[0].name if current else None,
+            "loaded_at": self.loaded_at,
+            "reload_count": self.reload_count,
+            "reload_failures": self.reload_failures,
+        }
+
+class SegmentModelCache:
+    """
+    Per-segment demand models (models.train_demand.train_and_save_segmented) for one model
+    name. The segment index <name>.segments maps SKUs to segment model versions; it is
+    re-read when its CURRENT version changes, checked at most every reload_interval seconds
+    on the request path. Segment models are loaded on first use and kept in an LRU bounded
+    by max_bytes, using the artifact size on disk as the memory estimate; the least recently
+    used ones are evicted. SKUs outside every segment, or whose segment model fails to load,
+    are served by the global model (DemandModelHolder). Callers keep the (model, meta) pair
+    they were given, so an eviction never affects an in-flight request.
+    """
+    _instances = {}
+    _lock = threading.Lock()
+
+    def __init__(self, model_dir=DEFAULT_DEMAND_MODEL_DIR, model_name="demand_model",
+                 max_bytes=DEMAND_SEGMENT_CACHE_MB * 1024 * 1024, reload_interval=MODEL_RELOAD_INTERVAL_SEC):
+        self.model_dir = model_dir
+        self.model_name = model_name
+        self.max_bytes = max_bytes
+        self.reload_interval = reload_interval
+        self._index = None  # (index version, index dict, index meta)
+        self._checked_at = None
+        self._models = OrderedDict()  # segment -> (model, meta, version, bytes), least recently used first
+        self._bytes = 0
+        self._failed = {}  # segment -> version that failed to load; not retried until the index changes
+        self._load_locks = {}
+        self._cache_lock = threading.Lock()
+        self._segment_stats = {}
+        self.evictions = 0
+
+    @classmethod
+    def instance(cls, model_dir=DEFAULT_DEMAND_MODEL_DIR, model_name="demand_model"):
+        key = (os.path.abspath(model_dir), model_name)
+        with cls._lock:
+            if key not in cls._instances:
+                cls._instances[key] = SegmentModelCache(model_dir, model_name)
+            return cls._instances[key]
+
+    @classmethod
+    def reset_after_fork(cls):
+        """
+        In a forked worker: new locks; models already loaded by the parent stay shared.
+        """
+        cls._lock = threading.Lock()
+        for cache in list(cls._instances.values()):
+            cache._cache_lock = threading.Lock()
+            cache._load_locks = {}
+
+    def refresh_index(self, force=False):
+        """
+        Re-read the segment index if its CURRENT version changed. Returns the index dict,
+        or None when the model is not segmented.
+        """
+        now = time.monotonic()
+        index = self._index
+        if not force and self._checked_at is not None and now - self._checked_at < self.reload_interval:
+            return index[1] if index else None
+        self._checked_at = now
+        name = segment_index_name(self.model_name)
+        version = current_version(self.model_dir, name)
+        if version is None:
+            if index is not None:
+                with self._cache_lock:
+                    self._index = None
+                    for segment in list(self._models):
+                        self._evict(segment)
+                    self._report_cache()
+            return None
+        if index is not None and index[0] == version:
+            return index[1]
+        try:
+            routes, meta = load_model(self.model_dir, name, version=version)
+        except Exception as e:
+            logger.error(f"Segment index {name}/{version} could not be loaded, keeping the previous one: {e}")
+            return index[1] if index else None
+        with self._cache_lock:
+            self._index = (version, routes, meta)
+            self._failed.clear()
+            # drop segment models the new index no longer points to
+            for segment, entry in list(self._models.items()):
+                if routes['segments'].get(segment) != entry[2]:
+                    self._evict(segment)
+            self._report_cache()
+        logger.info(f"Segment index '{name}' loaded (version {version}, by {routes.get('by')}, "
+                    f"{len(routes['segments'])} segments)")
+        return routes
+
+    def _stats_for(self, segment):
+        stats = self._segment_stats.get(segment)
+        if stats is None:
+            stats = self._segment_stats[segment] = {'hits': 0, 'misses': 0, 'errors': 0, 'loads': 0, 'load_seconds': 0.0}
+        return stats
+
+    def _evict(self, segment):
+        entry = self._models.pop(segment)
+        self._bytes -= entry[3]
+
+    def _report_cache(self):
+        SEGMENT_MODEL_CACHE.labels(self.model_name, "entries").set(len(self._models))
+        SEGMENT_MODEL_CACHE.labels(self.model_name, "bytes").set(self._bytes)
+
+    def get(self, segment, version):
+        """
+        (model, meta) for a segment model version, loading it on a miss; None if it cannot
+        be loaded.
+        """
+        with self._cache_lock:
+            hit = self._cached(segment, version)
+            if hit is not None:
+                return hit
+            if self._failed.get(segment) == version:
+                self._stats_for(segment)['errors'] += 1
+                SEGMENT_MODEL_REQUESTS.labels(self.model_name, segment, "error").inc()
+                return None
+            load_lock = self._load_locks.setdefault(segment, threading.Lock())
+        # one thread loads a segment; concurrent requests for it wait and then hit
+        with load_lock:
+            with self._cache_lock:
+                hit = self._cached(segment, version)
+            return hit if hit is not None else self._load(segment, version)
+
+    def _cached(self, segment, version):
+        # caller holds _cache_lock
+        entry = self._models.get(segment)
+        if entry is None or entry[2] != version:
+            return None
+        self._models.move_to_end(segment)
+        self._stats_for(segment)['hits'] += 1
+        SEGMENT_MODEL_REQUESTS.labels(self.model_name, segment, "hit").inc()
+        return entry[0], entry[1]
+
+    def _load(self, segment, version):
+        name = segment_model_name(self.model_name, segment)
+        started = time.perf_counter()
+        try:
+            model, meta = load_model(self.model_dir, name, version=version)
+            model = serving_model(model, meta)
+            size = os.path.getsize(artifact_paths(self.model_dir, name, version)[0])
+        except Exception as e:
+            with self._cache_lock:
+                self._failed[segment] = version
+                self._stats_for(segment)['errors'] += 1
+            SEGMENT_MODEL_REQUESTS.labels(self.model_name, segment, "error").inc()
+            logger.error(f"Segment model {name}/{version} could not be loaded, serving its SKUs with the global model: {e}")
+            return None
+        seconds = time.perf_counter() - started
+        SEGMENT_MODEL_LOAD_SECONDS.labels(self.model_name).observe(seconds)
+        SEGMENT_MODEL_REQUESTS.labels(self.model_name, segment, "miss").inc()
+        with self._cache_lock:
+            stats = self._stats_for(segment)
+            stats['misses'] += 1
+            stats['loads'] += 1
+            stats['load_seconds'] += seconds
+            if segment in self._models:
+                self._evict(segment)
+            self._models[segment] = (model, meta, version, size)
+            self._bytes += size
+            # the model just loaded is kept even if it alone exceeds the budget
+            while self._bytes > self.max_bytes and len(self._models) > 1:
+                self._evict(next(iter(self._models)))
+                self.evictions += 1
+                SEGMENT_MODEL_EVICTIONS.labels(self.model_name).inc()
+            self._report_cache()
+        return model, meta
+
+    def get_for_sku(self, sku):
+        """
+        (model, meta) of the segment model serving this SKU, or None for the global model.
+        """
+        index = self.refresh_index()
+        segment = route_segment(index, sku)
+        if segment is None:
+            return None
+        return self.get(segment, index['segments'][segment])
+
+    def stats(self):
+        index = self._index
+        with self._cache_lock:
+            per_segment = {}
+            for segment, s in sorted(self._segment_stats.items()):
+                lookups = s['hits'] + s['misses'] + s['errors']
+                per_segment[segment] = {
+                    **s,
+                    'hit_rate': s['hits'] / lookups if lookups else None,
+                    'mean_load_seconds': s['load_seconds'] / s['loads'] if s['loads'] else None,
+                    'loaded': segment in self._models,
+                }
+            return {
+                "index_version": index[0] if index else None,
+                "segment_by": index[1].get('by') if index else None,
+                "segments": len(index[1]['segments']) if index else 0,
+                "loaded": len(self._models),
+                "loaded_bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "evictions": self.evictions,
+                "per_segment": per_segment,
+            }
+
+def get_demand_model(model_dir=DEFAULT_DEMAND_MODEL_DIR, model_name="demand_model"):
+    """
+    Serving-path accessor: returns the cached (model, meta) snapshot for this process.
+    """
+    return DemandModelHolder.instance(model_dir, model_name).get()
+
+def get_demand_model_for_sku(sku, model_dir=DEFAULT_DEMAND_MODEL_DIR, model_name="demand_model"):
+    """
+    (model, meta) serving one SKU: its segment model when the registry has a segment index
+    routing the SKU, else the global demand model.
+    """
+    segmented = SegmentModelCache.instance(model_dir, model_name).get_for_sku(sku)
+    return segmented if segmented is not None else get_demand_model(model_dir, model_name)
+
+def get_demand_models_for_skus(skus, model_dir=DEFAULT_DEMAND_MODEL_DIR, model_name="demand_model"):
+    """
+    (model, meta) per SKU, aligned with skus (see get_demand_model_for_sku). The pairs are
+    held by the caller, so a batch spanning more segments than the memory budget still gets
+    every model; the cache itself stays within budget.
+    """
+    cache = SegmentModelCache.instance(model_dir, model_name)
+    global_model = None
+    models = []
+    for sku in skus:
+        pair = cache.get_for_sku(sku)
+        if pair is None:
+            if global_model is None:
+                global_model = get_demand_model(model_dir, model_name)
+            pair = global_model
+        models.append(pair)
+    return models
+
+def preload_serving_models(model_dir=DEFAULT_DEMAND_MODEL_DIR, model_name="demand_model"):
+    """
+    Load and warm up the demand model at server start, before the process reports ready
+    (GET /ready), and read the segment index if there is one (segment models themselves
+    load on first use). Returns the holder stats.
+    """
+    holder = DemandModelHolder.instance(model_dir, model_name)
+    holder.get()
+    SegmentModelCache.instance(model_dir, model_name).refresh_index(force=True)
+    return holder.stats()
+
+def _feature_rows(feature_cols, base_features: Dict[str, Any], candidate_prices):
+    """
+    One feature row per candidate price; only the price-derived features vary.
     """
-    feature_cols = meta.get('feature_columns', None)
-    if feature_cols is None:
-        raise ValueError("Model metadata must contain 'feature_columns' list")
     rows = []
     for p in candidate_prices:
         feat = base_features.copy()
@@ -35,32 +533,150 @@ def predict_units_for_prices(model, meta, base_features: Dict[str, Any], candida
             feat['last_price'] = p
         if 'avg_price_7d' in feat:
             feat['avg_price_7d'] = p
-        X_row = [feat.get(c, 0.0) for c in feature_cols]
-        rows.append(X_row)
-    X = pd.DataFrame(rows, columns=feature_cols)
+        rows.append([feat.get(c, 0.0) for c in feature_cols])
+    return rows
+
+def price_feature_matrix(feature_cols, base_features_list: List[Dict[str, Any]]):
+    """
+    (base, price_mask) for predict_raw_units_at_prices: one row of base features per SKU,
+    laid out as _feature_rows does, and a same-shaped mask of the price features that
+    _feature_rows overwrites with each candidate price.
+    """
+    base = np.array([[f.get(c, 0.0) for c in feature_cols] for f in base_features_list], dtype=np.float64)
+    price_mask = np.array([[c in ('last_price', 'avg_price_7d') and c in f for c in feature_cols]
+                           for f in base_features_list], dtype=bool)
+    return base.reshape(len(base_features_list), len(feature_cols)), price_mask.reshape(base.shape)
+
+def predict_raw_units_at_prices(model, meta, base, price_mask, sku_index, prices):
+    """
+    Predicted units (clipped at 0, before the flat-demand fallback) for rows base[sku_index]
+    at the given prices, in one model.predict. The array form of
+    predict_raw_units_for_price_grids for callers that track prices in NumPy arrays.
+    """
+    feature_cols = meta.get('feature_columns', None)
+    if feature_cols is None:
+        raise ValueError("Model metadata must contain 'feature_columns' list")
+    if len(sku_index) == 0:
+        return np.zeros(0)
+    X = np.where(price_mask[sku_index], np.asarray(prices, dtype=np.float64)[:, None], base[sku_index])
+    return np.maximum(np.asarray(_predict_rows(model, X, feature_cols), dtype=float), 0.0)
+
+def _predict_rows(model, rows, feature_cols):
+    """
+    Run the model on feature rows. Serving backends and LightGBM Boosters take a plain
+    float matrix (building a DataFrame costs more than the prediction itself for a 21-row
+    grid); other models get a DataFrame with the training column names.
+    """
+    if isinstance(model, PredictorBackend) or type(model).__module__.startswith('lightgbm.'):
+        return model.predict(np.asarray(rows, dtype=np.float64).reshape(len(rows), len(feature_cols)))
+    return model.predict(pd.DataFrame(rows, columns=feature_cols))
+
+# Constant-elasticity curve used when the model's demand does not vary with price
+FLAT_DEMAND_ELASTICITY = -2.0
+
+def flat_demand_units(prices, units, base_features: Dict[str, Any]):
+    """
+    (units, applied): if the predicted units are (near) constant across the prices, replace
+    them with a constant-elasticity curve around the current price so the optimizer still
+    has a signal. Array-only core of _apply_flat_demand_fallback.
+    """
+    units = np.asarray(units, dtype=float)
+    if len(units) < 2 or np.std(units, ddof=1) >= 1e-6:
+        return units, False
+    current_price = base_features.get('last_price')
+    base_units = units.mean()
+    if current_price and current_price > 0 and base_units > 0:
+        adjusted = base_units * (np.asarray(prices, dtype=float) / current_price) ** FLAT_DEMAND_ELASTICITY
+        return np.maximum(adjusted, 0.0), True
+    return units, False
+
+def flat_demand_units_matrix(prices, units, counts, current_prices):
+    """
+    flat_demand_units for many SKUs at once: row i holds counts[i] prices / units
+    followed by NaN padding, current_prices[i] is the SKU's base last_price (0 if unknown).
+    Returns (units, applied) with applied a bool per row.
+    """
+    counts = np.asarray(counts)
+    current_prices = np.asarray(current_prices, dtype=float)
+    mean = np.nansum(units, axis=1) / np.maximum(counts, 1)
+    var = np.nansum((units - mean[:, None]) ** 2, axis=1) / np.maximum(counts - 1, 1)
+    flat = (counts >= 2) & (np.sqrt(var) < 1e-6) & (current_prices > 0) & (mean > 0)
+    if not flat.any():
+        return units, flat
+    with np.errstate(invalid='ignore', divide='ignore'):
+        adjusted = mean[:, None] * (prices / np.where(flat, current_prices, 1.0)[:, None]) ** FLAT_DEMAND_ELASTICITY
+    return np.where(flat[:, None], np.maximum(adjusted, 0.0), units), flat
+
+def _apply_flat_demand_fallback(df, base_features: Dict[str, Any]):
+    """
+    If the model returns (near) constant demand across the price grid, fall back to a
+    constant-elasticity curve around the current price so the optimizer still has a signal.
+    """
+    logger.debug("Prediction std dev: {}", df['predicted_units'].std())
+    units, applied = flat_demand_units(df['price'].values, df['predicted_units'].values, base_features)
+    if applied:
+        df['predicted_units'] = units
+        FALLBACKS.labels("flat_demand").inc()
+        logger.debug("Applied heuristic elasticity {}", FLAT_DEMAND_ELASTICITY)
+    return df
+
+def predict_units_for_prices(model, meta, base_features: Dict[str, Any], candidate_prices: list):
+    """
+    base_features: dict of feature_name -> value (includes last_price etc.)
+    candidate_prices: list of floats to test
+    Returns DataFrame with columns: price, predicted_units
+    """
+    feature_cols = meta.get('feature_columns', None)
+    if feature_cols is None:
+        raise ValueError("Model metadata must contain 'feature_columns' list")
+    rows = _feature_rows(feature_cols, base_features, candidate_prices)
     try:
-        preds = model.predict(X)
+        preds = _predict_rows(model, rows, feature_cols)
     except Exception as e:
-        print(f"ERROR: Model predict failed: {e}", file=sys.stderr)
-        preds = model.predict(X)
-    
+        logger.error(f"Model predict failed: {e}")
+        preds = _predict_rows(model, rows, feature_cols)
+
     df = pd.DataFrame({'price': candidate_prices, 'predicted_units': np.maximum(preds, 0.0)})
+    return _apply_flat_demand_fallback(df, base_features)
 
-    std_dev = df['predicted_units'].std()
-    print(f"DEBUG: Prediction std dev: {std_dev}", file=sys.stderr)
-    
-    if std_dev < 1e-6:
-        current_price = base_features.get('last_price')
-        base_units = df['predicted_units'].mean()
-        print(f"DEBUG: Fallback triggered. Current price: {current_price}, Base units: {base_units}", file=sys.stderr)
-        
-        if current_price and current_price > 0 and base_units > 0:
-            elasticity = -2.0
-            prices = df['price'].values
-            adjusted_units = base_units * (prices / current_price) ** elasticity
-            df['predicted_units'] = np.maximum(adjusted_units, 0.0)
-            print(f"DEBUG: Applied heuristic elasticity {elasticity}", file=sys.stderr)
-        else:
-            print("DEBUG: Fallback skipped", file=sys.stderr)
+def predict_raw_units_for_price_grids(model, meta, base_features_list: List[Dict[str, Any]], candidate_prices_list: List[list]):
+    """
+    Stacks every SKU's candidate rows into one matrix and runs a single model.predict.
+    Returns one array of predicted units (clipped at 0) per SKU, before the flat-demand
+    fallback; see units_frame.
+    """
+    feature_cols = meta.get('feature_columns', None)
+    if feature_cols is None:
+        raise ValueError("Model metadata must contain 'feature_columns' list")
+    rows = []
+    for base_features, candidate_prices in zip(base_features_list, candidate_prices_list):
+        rows.extend(_feature_rows(feature_cols, base_features, candidate_prices))
+    if not rows:
+        return [np.zeros(0) for _ in candidate_prices_list]
+    preds = np.maximum(np.asarray(_predict_rows(model, rows, feature_cols), dtype=float), 0.0)
+    results = []
+    offset = 0
+    for candidate_prices in candidate_prices_list:
+        n = len(candidate_prices)
+        results.append(preds[offset:offset + n])
+        offset += n
+    return results
 
-    return df
+def units_frame(base_features: Dict[str, Any], candidate_prices, units):
+    """
+    DataFrame (price, predicted_units) for one SKU with the flat-demand fallback applied.
+    """
+    df = pd.DataFrame({'price': candidate_prices, 'predicted_units': units})
+    return _apply_flat_demand_fallback(df, base_features)
+
+def predict_units_for_price_grids(model, meta, base_features_list: List[Dict[str, Any]], candidate_prices_list: List[list]):
+    """
+    Batched variant of predict_units_for_prices for many SKUs: one model.predict over the
+    stacked candidate rows, then the flat-demand fallback per SKU.
+    Returns a list of DataFrames (price, predicted_units) aligned with the inputs.
+    """
+    if not candidate_prices_list:
+        return []
+    raw = predict_raw_units_for_price_grids(model, meta, base_features_list, candidate_prices_list)
+    return [units_frame(base_features, candidate_prices, units)
+            for base_features, candidate_prices, units in zip(base_features_list, candidate_prices_list, raw)]
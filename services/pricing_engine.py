@@ -4,15 +4,28 @@ Core pricing engine: takes SKU and candidate prices, constraints, elasticity and
 Provides explanation fields and respects vendor constraints.
 """
 
-from typing import Dict, Any
+from typing import Dict, Any, List
 import numpy as np
 import pandas as pd
 import yaml
 import os
-from services.prediction_service import load_demand_model, predict_units_for_prices
+import json
+import hashlib
+import time
+import weakref
+import asyncio
+import functools
+from services.prediction_service import (get_demand_model_for_sku, get_demand_models_for_skus, predict_units_for_prices,
+                                        predict_units_for_price_grids, predict_raw_units_at_prices, price_feature_matrix,
+                                        flat_demand_units_matrix, model_version)
+from services.tree_compiler import split_thresholds
 from models.model_utils import load_model
 from datetime import datetime
-from services.db_pool import SimpleMySQLPool
+from services.db_pool import SimpleMySQLPool, run_blocking
+from services.feature_store import get_latest_features_async, DEFAULT_BASE_FEATURES
+from services.write_behind import submit_row
+from services.cache import get_cache, invalidate, VENDOR_RULES_CACHE, ELASTICITY_CACHE, LATEST_PRICE_CACHE
+from services.metrics import stage_timer, STAGE_LATENCY, FALLBACKS
 import logging
 
 logger = logging.getLogger(__name__)
@@ -25,32 +38,41 @@ if os.path.exists(CONFIG_PATH):
 else:
     PRICING_CONFIG = {}
 
-def get_vendor_rules(vendor_id):
+# Candidate search: "grid" scores a fixed price grid; "breakpoints" scores the model's own
+# price split thresholds and finds the exact revenue-maximizing allowed price (tree models);
+# "adaptive" scores a coarse grid and then narrows brackets around the best candidates.
+OPTIMIZERS = ("grid", "breakpoints", "adaptive")
+# adaptive only pays off when its refinement rounds are shared by many SKUs
+SINGLE_SKU_OPTIMIZERS = ("grid", "breakpoints")
+PRICE_OPTIMIZER = os.getenv("PRICE_OPTIMIZER", PRICING_CONFIG.get('optimizer', "grid"))
+# Adaptive search: total model evaluations per SKU, coarse grid size, candidates refined per
+# round and the bracket width below which a candidate is not refined further
+PRICE_SEARCH_BUDGET = int(os.getenv("PRICE_SEARCH_BUDGET", PRICING_CONFIG.get('search_budget', 21)))
+PRICE_SEARCH_COARSE_STEPS = int(os.getenv("PRICE_SEARCH_COARSE_STEPS", PRICING_CONFIG.get('search_coarse_steps', 7)))
+PRICE_SEARCH_TOP_K = int(os.getenv("PRICE_SEARCH_TOP_K", PRICING_CONFIG.get('search_refine_top_k', 3)))
+PRICE_SEARCH_MIN_STEP = float(os.getenv("PRICE_SEARCH_MIN_STEP", PRICING_CONFIG.get('search_min_step', 0.01)))
+# Features set to the candidate price for every candidate row (see prediction_service._feature_rows)
+PRICE_FEATURES = ('last_price', 'avg_price_7d')
+
+def _fetch_vendor_rules(vendor_id):
     pool = SimpleMySQLPool.instance()
-    conn = pool.get_conn()
-    try:
+    with pool.connection() as conn:
         with conn.cursor() as cur:
             cur.execute("SELECT * FROM vendor_rules WHERE vendor_id=%s", (vendor_id,))
             row = cur.fetchone()
             return row
-    finally:
-        pool.return_conn(conn)
 
-def get_elasticity_for_sku(sku):
+def _fetch_elasticity_for_sku(sku):
     pool = SimpleMySQLPool.instance()
-    conn = pool.get_conn()
-    try:
+    with pool.connection() as conn:
         with conn.cursor() as cur:
             cur.execute("SELECT * FROM elasticity_results WHERE sku=%s", (sku,))
             row = cur.fetchone()
             return row
-    finally:
-        pool.return_conn(conn)
 
-def get_latest_price_for_sku(sku):
+def _fetch_latest_price_for_sku(sku):
     pool = SimpleMySQLPool.instance()
-    conn = pool.get_conn()
-    try:
+    with pool.connection() as conn:
         with conn.cursor() as cur:
             cur.execute("SELECT price FROM orders WHERE sku=%s ORDER BY order_ts DESC LIMIT 1", (sku,))
             row = cur.fetchone()
@@ -62,8 +84,121 @@ def get_latest_price_for_sku(sku):
             if r2:
                 return float(r2['last_price'])
             return None
-    finally:
-        pool.return_conn(conn)
+
+def _in_clause(values):
+    return ",".join(["%s"] * len(values))
+
+def _fetch_vendor_rules_bulk(vendor_ids):
+    """
+    dict vendor_id -> vendor_rules row for the given ids (missing ids are absent).
+    """
+    vendor_ids = list(dict.fromkeys(v for v in vendor_ids if v))
+    if not vendor_ids:
+        return {}
+    pool = SimpleMySQLPool.instance()
+    with pool.connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(f"SELECT * FROM vendor_rules WHERE vendor_id IN ({_in_clause(vendor_ids)})", vendor_ids)
+            return {row['vendor_id']: row for row in cur.fetchall()}
+
+def _fetch_elasticity_bulk(skus):
+    """
+    dict sku -> elasticity_results row for the given SKUs (missing SKUs are absent).
+    """
+    skus = list(dict.fromkeys(skus))
+    if not skus:
+        return {}
+    pool = SimpleMySQLPool.instance()
+    with pool.connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(f"SELECT * FROM elasticity_results WHERE sku IN ({_in_clause(skus)})", skus)
+            return {row['sku']: row for row in cur.fetchall()}
+
+def _fetch_latest_prices_bulk(skus):
+    """
+    dict sku -> most recent order price. SKUs without orders are absent; callers fall back
+    to the feature store last_price as get_latest_price_for_sku does.
+    """
+    skus = list(dict.fromkeys(skus))
+    if not skus:
+        return {}
+    sql = f"""
+    SELECT o.sku, o.price FROM orders o
+    JOIN (
+        SELECT sku, MAX(order_ts) AS mx FROM orders WHERE sku IN ({_in_clause(skus)}) GROUP BY sku
+    ) latest ON o.sku = latest.sku AND o.order_ts = latest.mx
+    """
+    pool = SimpleMySQLPool.instance()
+    with pool.connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(sql, skus)
+            prices = {}
+            for row in cur.fetchall():
+                prices.setdefault(row['sku'], float(row['price']))
+            return prices
+
+# Read-through caches in front of the lookups above. Vendor rules, elasticity and prices
+# change at most daily; writers call invalidate() and the TTL bounds staleness elsewhere.
+_vendor_rules_cache = get_cache(VENDOR_RULES_CACHE)
+_elasticity_cache = get_cache(ELASTICITY_CACHE)
+_latest_price_cache = get_cache(LATEST_PRICE_CACHE)
+
+def get_vendor_rules(vendor_id):
+    return _vendor_rules_cache.get_or_load(vendor_id, _fetch_vendor_rules)
+
+def get_elasticity_for_sku(sku):
+    return _elasticity_cache.get_or_load(sku, _fetch_elasticity_for_sku)
+
+def get_latest_price_for_sku(sku):
+    return _latest_price_cache.get_or_load(sku, _fetch_latest_price_for_sku)
+
+# asyncio variants: cache hits return without awaiting, misses query on the DB executor
+async def get_vendor_rules_async(vendor_id):
+    return await _vendor_rules_cache.get_or_load_async(vendor_id, lambda key: run_blocking(_fetch_vendor_rules, key))
+
+async def get_elasticity_for_sku_async(sku):
+    return await _elasticity_cache.get_or_load_async(sku, lambda key: run_blocking(_fetch_elasticity_for_sku, key))
+
+async def get_latest_price_for_sku_async(sku):
+    return await _latest_price_cache.get_or_load_async(sku, lambda key: run_blocking(_fetch_latest_price_for_sku, key))
+
+def get_vendor_rules_bulk(vendor_ids):
+    vendor_ids = [v for v in vendor_ids if v]
+    found = _vendor_rules_cache.get_many(vendor_ids, _fetch_vendor_rules_bulk)
+    return {k: v for k, v in found.items() if v is not None}
+
+def get_elasticity_bulk(skus):
+    found = _elasticity_cache.get_many(skus, _fetch_elasticity_bulk)
+    return {k: v for k, v in found.items() if v is not None}
+
+def get_latest_prices_bulk(skus):
+    found = _latest_price_cache.get_many(skus, _fetch_latest_prices_bulk)
+    return {k: v for k, v in found.items() if v is not None}
+
+def upsert_vendor_rule(vendor_id, min_margin=None, max_discount=None, max_daily_price_change=None, note=None):
+    """
+    Create or update a vendor's pricing rule; unspecified fields keep their stored value
+    (or the table default for a new vendor). Invalidates the cached rule.
+    """
+    fields = {
+        'min_margin': min_margin,
+        'max_discount': max_discount,
+        'max_daily_price_change': max_daily_price_change,
+        'note': note,
+    }
+    fields = {k: v for k, v in fields.items() if v is not None}
+    columns = ["vendor_id"] + list(fields)
+    sql = f"INSERT INTO vendor_rules ({', '.join(columns)}) VALUES ({_in_clause(columns)})"
+    if fields:
+        sql += " ON DUPLICATE KEY UPDATE " + ", ".join(f"{c}=VALUES({c})" for c in fields)
+    else:
+        sql = sql.replace("INSERT INTO", "INSERT IGNORE INTO", 1)
+    pool = SimpleMySQLPool.instance()
+    with pool.connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(sql, [vendor_id] + list(fields.values()))
+        conn.commit()
+    invalidate(VENDOR_RULES_CACHE, [vendor_id])
 
 def _generate_candidate_prices(current_price, grid_relative=None, steps=21, min_price=0.5, max_price=10000.0, include_price=None):
     """
@@ -89,41 +224,296 @@ def _generate_candidate_prices(current_price, grid_relative=None, steps=21, min_
             
     return sorted(list(set(candidates)))
 
+_breakpoint_cache = weakref.WeakKeyDictionary()
+
+def price_breakpoints(model, meta):
+    """
+    Sorted split thresholds of the demand model on the price features, cached per loaded
+    model object. Raises ValueError for models that are not LightGBM tree ensembles.
+    """
+    try:
+        return _breakpoint_cache[model]
+    except KeyError:
+        pass
+    feature_cols = meta.get('feature_columns') or []
+    indices = [feature_cols.index(f) for f in PRICE_FEATURES if f in feature_cols]
+    thresholds = split_thresholds(getattr(model, 'model', model), indices)
+    _breakpoint_cache[model] = thresholds
+    return thresholds
+
+def _breakpoint_candidate_prices(model, meta, current_price, vendor_rule, include_price=None):
+    """
+    Candidate prices at which the best allowed price is guaranteed to be found.
+
+    With every other feature fixed, a tree model's demand is constant on each interval
+    (t_i, t_i+1] between consecutive price thresholds (splits send x <= t left), so revenue
+    price * units rises within an interval and peaks at its right end. Scoring the allowed
+    range's endpoints plus every threshold inside it therefore covers the exact optimum
+    over the whole continuous allowed range. Returns None when the model's thresholds
+    cannot be read or no price is allowed, so the caller falls back to the grid.
+    """
+    limits = allowed_price_range(vendor_rule, current_price)
+    if limits is None:
+        return None
+    try:
+        thresholds = price_breakpoints(model, meta)
+    except ValueError as e:
+        logger.warning("Breakpoint optimizer unavailable, using grid: %s", e)
+        return None
+    lo, hi = limits
+    inner = thresholds[(thresholds > lo) & (thresholds < hi)]
+    extra = [include_price] if include_price is not None else []
+    return np.unique(np.concatenate([[lo, hi], inner, extra])).tolist()
+
+def _coarse_candidate_prices(current_price, vendor_rule, grid_relative=None, coarse_steps=PRICE_SEARCH_COARSE_STEPS, include_price=None):
+    """
+    Starting points of the adaptive search: an even grid over the allowed price range, or the
+    relative grid (e.g. pricing.price_grid_relative) clipped into it. None if nothing is allowed.
+    """
+    limits = allowed_price_range(vendor_rule, current_price)
+    if limits is None:
+        return None
+    lo, hi = limits
+    if grid_relative and current_price:
+        points = np.clip([current_price * (1.0 + rel) for rel in grid_relative], lo, hi)
+        points = np.concatenate([[lo, hi], points])
+    else:
+        points = np.linspace(lo, hi, max(2, coarse_steps))
+    extra = [include_price] if include_price is not None else []
+    return np.unique(np.concatenate([points, extra])).tolist()
+
+def refine_price_search(model, meta, base_features_list, coarse_prices_list, vendor_rules, current_prices,
+                        budget=PRICE_SEARCH_BUDGET, top_k=PRICE_SEARCH_TOP_K, min_step=PRICE_SEARCH_MIN_STEP):
+    """
+    Coarse-to-fine search for many SKUs. Starting from each SKU's coarse prices, every round
+    takes the top_k allowed candidates by expected revenue and halves the bracket to each of
+    their evaluated neighbours, until the SKU's evaluation budget is used or every bracket is
+    narrower than 2 * min_step. Each round is one stacked model.predict over all SKUs still
+    refining. Returns one DataFrame (price, predicted_units) of all evaluated prices per SKU,
+    sorted by price, with the flat-demand fallback decided over the full set.
+
+    All SKUs are refined together: evaluated prices and units are kept in (SKUs x budget)
+    arrays padded with NaN, so a round is a fixed number of NumPy operations however many
+    SKUs it covers.
+    """
+    n_skus = len(coarse_prices_list)
+    if not n_skus:
+        return []
+    counts = np.array([len(p) for p in coarse_prices_list], dtype=np.intp)
+    width = max(budget, int(counts.max()))
+    filled = np.arange(width) < counts[:, None]
+    prices = np.full((n_skus, width), np.nan)
+    prices[filled] = np.concatenate([np.asarray(p, dtype=float) for p in coarse_prices_list])
+    units = np.full((n_skus, width), np.nan)
+    base, price_mask = price_feature_matrix(meta.get('feature_columns') or [], base_features_list)
+    sku_index, _ = np.nonzero(filled)
+    units[filled] = predict_raw_units_at_prices(model, meta, base, price_mask, sku_index, prices[filled])
+
+    limits = np.array([_constraint_limits(rule) for rule in vendor_rules], dtype=float).reshape(n_skus, 2)
+    current = np.array([float(c) if c else 0.0 for c in current_prices])
+    fallback_prices = np.array([float(f.get('last_price') or 0.0) for f in base_features_list])
+    rows = np.arange(n_skus)[:, None]
+    while True:
+        order = np.argsort(prices, axis=1, kind='stable')  # NaN padding sorts last
+        p = prices[rows, order]
+        u, _ = flat_demand_units_matrix(p, units[rows, order], counts, fallback_prices)
+        with np.errstate(invalid='ignore'):
+            revenue = np.nan_to_num(p * u, nan=-np.inf)
+        ranked = np.where(_allowed_matrix(p, limits[:, 0], limits[:, 1], current), revenue, -np.inf)
+        top = np.argsort(-ranked, axis=1, kind='stable')[:, :top_k]
+        top_ok = ranked[rows, top] > -np.inf
+        p_top = p[rows, top]
+        # midpoints towards the lower and upper neighbour of each top candidate, in that order
+        points = np.full(top.shape + (2,), np.nan)
+        for side, offset in enumerate((-1, 1)):
+            k = top + offset
+            ok = top_ok & (k >= 0) & (k < counts[:, None])
+            p_k = p[rows, np.clip(k, 0, width - 1)]
+            with np.errstate(invalid='ignore'):
+                ok &= np.abs(p_k - p_top) > 2 * min_step
+            points[..., side] = np.where(ok, (p_top + p_k) / 2, np.nan)
+        points = points.reshape(n_skus, -1)
+        keep = ~np.isnan(points)
+        for c in range(1, points.shape[1]):
+            keep[:, c] &= ~(points[:, :c] == points[:, c:c + 1]).any(axis=1)
+        position = np.cumsum(keep, axis=1)
+        keep &= position <= (budget - counts)[:, None]
+        if not keep.any():
+            break
+        new_rows, new_cols = np.nonzero(keep)
+        new_prices = points[new_rows, new_cols]
+        slots = counts[new_rows] + position[new_rows, new_cols] - 1
+        prices[new_rows, slots] = new_prices
+        units[new_rows, slots] = predict_raw_units_at_prices(model, meta, base, price_mask, new_rows, new_prices)
+        counts += keep.sum(axis=1)
+
+    order = np.argsort(prices, axis=1, kind='stable')
+    p = prices[rows, order]
+    u, flat = flat_demand_units_matrix(p, units[rows, order], counts, fallback_prices)
+    if flat.any():
+        FALLBACKS.labels("flat_demand").inc(int(flat.sum()))
+    return [pd.DataFrame({'price': p[i, :n], 'predicted_units': u[i, :n]}) for i, n in enumerate(counts)]
+
+def _candidate_prices(optimizer, model, meta, current_price, vendor_rule, grid_relative=None, steps=21, include_price=None,
+                      batch=False):
+    """
+    (candidate_prices, optimizer actually used) for the requested optimizer mode. For
+    "adaptive" these are the coarse starting points refined by refine_price_search.
+    "adaptive" is batch-only: its sequential refinement rounds make a single SKU slower
+    than the grid, so single requests use the grid.
+    """
+    if optimizer == "breakpoints":
+        prices = _breakpoint_candidate_prices(model, meta, current_price, vendor_rule, include_price)
+        if prices is not None:
+            return prices, "breakpoints"
+    elif optimizer == "adaptive" and batch:
+        prices = _coarse_candidate_prices(current_price, vendor_rule, grid_relative, include_price=include_price)
+        if prices is not None:
+            return prices, "adaptive"
+    elif optimizer not in OPTIMIZERS:
+        raise ValueError(f"Unknown optimizer: {optimizer}")
+    return _generate_candidate_prices(current_price, grid_relative=grid_relative, steps=steps, include_price=include_price), "grid"
+
+# Constraint violations are kept as a bitmask per candidate and only decoded to
+# reason names when a response needs them. Order defines the decoded string order.
+CONSTRAINT_EXCEEDS_MAX_DISCOUNT = 1
+CONSTRAINT_EXCEEDS_DAILY_CHANGE = 2
+CONSTRAINT_BELOW_MIN_PRICE = 4
+CONSTRAINT_ABOVE_MAX_PRICE = 8
+CONSTRAINT_REASONS = (
+    (CONSTRAINT_EXCEEDS_MAX_DISCOUNT, "exceeds_max_discount"),
+    (CONSTRAINT_EXCEEDS_DAILY_CHANGE, "exceeds_daily_change_limit"),
+    (CONSTRAINT_BELOW_MIN_PRICE, "below_min_price"),
+    (CONSTRAINT_ABOVE_MAX_PRICE, "above_max_price"),
+)
+NO_ALLOWED_CANDIDATES_REASON = "no_allowed_candidates; returning_best_violating_constraints"
+
+def _constraint_limits(vendor_rule: Dict):
+    """
+    (max_discount, max_daily_change) from the vendor rule, falling back to config defaults.
+    """
+    max_discount = float(vendor_rule.get('max_discount')) if vendor_rule and vendor_rule.get('max_discount') is not None else PRICING_CONFIG.get('max_discount', 0.30)
+    max_daily_change = float(vendor_rule.get('max_daily_price_change')) if vendor_rule and vendor_rule.get('max_daily_price_change') is not None else PRICING_CONFIG.get('daily_price_change_limit_pct', 0.15)
+    return max_discount, max_daily_change
+
+def constraint_mask(prices: np.ndarray, vendor_rule: Dict, current_price: float):
+    """
+    Bitmask of violated constraints per candidate price (0 = allowed).
+    Vendor constraints: max_discount vs current price, daily change limit; global min/max price.
+    """
+    prices = np.asarray(prices, dtype=float)
+    max_discount, max_daily_change = _constraint_limits(vendor_rule)
+    mask = np.zeros(prices.shape, dtype=np.uint8)
+    if current_price:
+        mask |= np.where(prices < current_price * (1 - max_discount) - 1e-9, CONSTRAINT_EXCEEDS_MAX_DISCOUNT, 0).astype(np.uint8)
+        change = np.abs(prices - current_price) / max(1e-6, current_price)
+        mask |= np.where(change > max_daily_change + 1e-9, CONSTRAINT_EXCEEDS_DAILY_CHANGE, 0).astype(np.uint8)
+    mask |= np.where(prices < PRICING_CONFIG.get('min_price', 0.5), CONSTRAINT_BELOW_MIN_PRICE, 0).astype(np.uint8)
+    mask |= np.where(prices > PRICING_CONFIG.get('max_price', 100000.0), CONSTRAINT_ABOVE_MAX_PRICE, 0).astype(np.uint8)
+    return mask
+
+def _allowed_matrix(prices, max_discount, max_daily_change, current_prices):
+    """
+    constraint_mask(...) == 0 for a (SKUs x candidates) price matrix, with one set of limits
+    per row (NaN prices are not allowed).
+    """
+    max_discount = np.asarray(max_discount, dtype=float)[:, None]
+    max_daily_change = np.asarray(max_daily_change, dtype=float)[:, None]
+    current = np.asarray(current_prices, dtype=float)[:, None]
+    has_current = current != 0
+    with np.errstate(invalid='ignore'):
+        allowed = (prices >= PRICING_CONFIG.get('min_price', 0.5)) & (prices <= PRICING_CONFIG.get('max_price', 100000.0))
+        allowed &= ~has_current | (prices >= current * (1 - max_discount) - 1e-9)
+        change = np.abs(prices - current) / np.maximum(1e-6, current)
+        allowed &= ~has_current | (change <= max_daily_change + 1e-9)
+    return allowed
+
+def allowed_price_range(vendor_rule: Dict, current_price: float):
+    """
+    (lo, hi) bounds of the prices constraint_mask allows, or None if no price is allowed.
+    """
+    max_discount, max_daily_change = _constraint_limits(vendor_rule)
+    lo = PRICING_CONFIG.get('min_price', 0.5)
+    hi = PRICING_CONFIG.get('max_price', 100000.0)
+    if current_price:
+        lo = max(lo, current_price * (1 - max_discount), current_price * (1 - max_daily_change))
+        hi = min(hi, current_price * (1 + max_daily_change))
+    if lo > hi:
+        return None
+    return float(lo), float(hi)
+
+def decode_constraint_mask(mask: int):
+    """
+    Comma-separated reason names for a constraint bitmask ("" when allowed).
+    """
+    return ",".join(name for bit, name in CONSTRAINT_REASONS if mask & bit)
+
+def _select_best(allowed: np.ndarray, revenue: np.ndarray):
+    """
+    Masked argmax of revenue over allowed candidates -> (index, reason).
+    """
+    ranked = np.where(np.isnan(revenue), -np.inf, revenue)
+    if allowed.any():
+        best_index = int(np.argmax(np.where(allowed, ranked, -np.inf)))
+        if not allowed[best_index]:
+            # every allowed revenue is NaN
+            best_index = int(np.flatnonzero(allowed)[0])
+        return best_index, ""
+    # fallback: choose highest expected_revenue even if disallowed, but note constraint
+    return int(np.argmax(ranked)), NO_ALLOWED_CANDIDATES_REASON
+
+def evaluate_candidates(prices, predicted_units, vendor_rule: Dict, current_price: float):
+    """
+    Vectorized candidate evaluation: constraints, expected revenue and best candidate.
+    Returns dict of arrays (price, predicted_units, constraint_mask, allowed, expected_revenue)
+    plus best_index and best_reason. The best candidate is the masked argmax of expected
+    revenue over allowed candidates, or over all candidates if none is allowed; ties resolve
+    to the lowest price.
+    """
+    prices = np.asarray(prices, dtype=float)
+    units = np.asarray(predicted_units, dtype=float)
+    mask = constraint_mask(prices, vendor_rule, current_price)
+    allowed = mask == 0
+    revenue = prices * units
+    best_index, best_reason = _select_best(allowed, revenue)
+    return {
+        'price': prices,
+        'predicted_units': units,
+        'constraint_mask': mask,
+        'allowed': allowed,
+        'expected_revenue': revenue,
+        'best_index': best_index,
+        'best_reason': best_reason,
+    }
+
+def candidate_records(evaluation):
+    """
+    Response view of an evaluation: one dict per candidate with decoded constraint reasons.
+    Each distinct mask is decoded once.
+    """
+    reasons = {int(m): decode_constraint_mask(int(m)) for m in np.unique(evaluation['constraint_mask'])}
+    return [
+        {
+            'price': float(p),
+            'predicted_units': float(u),
+            'allowed': bool(a),
+            'constraint_reasons': reasons[int(m)],
+            'expected_revenue': float(r),
+        }
+        for p, u, a, m, r in zip(evaluation['price'], evaluation['predicted_units'], evaluation['allowed'],
+                                 evaluation['constraint_mask'], evaluation['expected_revenue'])
+    ]
+
 def apply_constraints(candidate_df: pd.DataFrame, vendor_rule: Dict, current_price: float):
     """
     Apply vendor constraints: min_margin, max_discount vs current price, daily change limit
     Adds a boolean 'allowed' column and 'constraint_reasons'.
     """
     candidate_df = candidate_df.copy()
-    reasons = []
-    allowed = []
-    min_margin = float(vendor_rule.get('min_margin')) if vendor_rule and vendor_rule.get('min_margin') is not None else PRICING_CONFIG.get('min_margin', 0.10)
-    max_discount = float(vendor_rule.get('max_discount')) if vendor_rule and vendor_rule.get('max_discount') is not None else PRICING_CONFIG.get('max_discount', 0.30)
-    max_daily_change = float(vendor_rule.get('max_daily_price_change')) if vendor_rule and vendor_rule.get('max_daily_price_change') is not None else PRICING_CONFIG.get('daily_price_change_limit_pct', 0.15)
-    for _, row in candidate_df.iterrows():
-        p = row['price']
-        rlist = []
-        allowed_flag = True
-        # discount vs current price:
-        if current_price and p < current_price * (1 - max_discount) - 1e-9:
-            allowed_flag = False
-            rlist.append("exceeds_max_discount")
-        # daily change limit
-        if current_price and (abs(p - current_price) / max(1e-6, current_price) > max_daily_change + 1e-9):
-            allowed_flag = False
-            rlist.append("exceeds_daily_change_limit")
-        # price floor (min price)
-        if p < PRICING_CONFIG.get('min_price', 0.5):
-            allowed_flag = False
-            rlist.append("below_min_price")
-        # price ceiling (max price)
-        if p > PRICING_CONFIG.get('max_price', 100000.0):
-            allowed_flag = False
-            rlist.append("above_max_price")
-        allowed.append(allowed_flag)
-        reasons.append(",".join(rlist) if rlist else "")
-    candidate_df['allowed'] = allowed
-    candidate_df['constraint_reasons'] = reasons
+    mask = constraint_mask(candidate_df['price'].values, vendor_rule, current_price)
+    reasons = {int(m): decode_constraint_mask(int(m)) for m in np.unique(mask)}
+    candidate_df['allowed'] = mask == 0
+    candidate_df['constraint_reasons'] = [reasons[int(m)] for m in mask]
     return candidate_df
 
 def compute_expected_revenue(candidate_df):
@@ -138,72 +528,53 @@ def pick_best_candidate(candidate_df):
     """
     Choose highest expected_revenue among allowed candidates.
     """
-    allowed = candidate_df[candidate_df['allowed'] == True]
-    if allowed.empty:
-        # fallback: choose highest expected_revenue even if disallowed, but note constraint
-        best = candidate_df.sort_values('expected_revenue', ascending=False).iloc[0]
-        best_reason = "no_allowed_candidates; returning_best_violating_constraints"
-    else:
-        best = allowed.sort_values('expected_revenue', ascending=False).iloc[0]
-        best_reason = ""
-    return best.to_dict(), best_reason
+    best_index, best_reason = _select_best(candidate_df['allowed'].values.astype(bool),
+                                           candidate_df['expected_revenue'].values.astype(float))
+    return candidate_df.iloc[best_index].to_dict(), best_reason
 
 def store_price_suggestion(sku, current_price, best_candidate, explanation, constraints_applied, model_version, api_request_id=None):
-    pool = SimpleMySQLPool.instance()
-    conn = pool.get_conn()
-    try:
-        with conn.cursor() as cur:
-            sql = """
-            INSERT INTO price_suggestions
-            (sku, request_ts, current_price, suggested_price, expected_revenue, expected_units, elasticity, reason, constraints_applied, model_version, api_request_id)
-            VALUES ( %s, NOW(), %s, %s, %s, %s, %s, %s, %s, %s, %s)
-            """
-            cur.execute(sql, (
-                sku, current_price, best_candidate['price'], float(best_candidate['expected_revenue']),
-                float(best_candidate['predicted_units']), None, explanation, str(constraints_applied),
-                model_version, api_request_id
-            ))
-        conn.commit()
-    finally:
-        pool.return_conn(conn)
+    """
+    Queue the suggestion audit row for the background writer (see services.write_behind).
+    """
+    submit_row('price_suggestions', (
+        sku, datetime.now(), current_price, best_candidate['price'], float(best_candidate['expected_revenue']),
+        float(best_candidate['predicted_units']), None, explanation, str(constraints_applied),
+        model_version, api_request_id
+    ))
 
-def suggest_price_for_sku(sku: str, base_features: dict, vendor_id: str = None, grid_relative: list = None, steps: int = 21, model_name="demand_model", target_price: float = None):
+def store_demand_prediction(sku, base_features, best_candidate, model_version):
     """
-    Main entrypoint for price suggestion.
-    Returns dict with suggested price, details, candidates, elasticity info, model metadata.
+    Record the model's demand prediction at the suggested price in demand_predictions,
+    which daily monitoring compares against realised sales. The table keeps one row per
+    SKU and day (the latest prediction), so it does not grow with request traffic.
     """
-    # 1) load models and metadata
-    model, meta = load_demand_model()
-    # 2) get current price
-    current_price = get_latest_price_for_sku(sku) or base_features.get('last_price') or 0.0
-    # 3) generate candidate prices
-    candidate_prices = _generate_candidate_prices(current_price, grid_relative=grid_relative, steps=steps, include_price=target_price)
-    # 4) vendor rules
-    vendor_rule = get_vendor_rules(vendor_id) if vendor_id else None
-    # 5) predict units for each candidate price
-    pred_df = predict_units_for_prices(model, meta, base_features, candidate_prices)
-    # 6) apply constraints
-    candidates = apply_constraints(pred_df, vendor_rule, current_price)
-    # 7) compute expected revenue
-    candidates = compute_expected_revenue(candidates)
-    # 8) select best candidate
-    best_candidate, best_reason = pick_best_candidate(candidates)
-    # 9) gather elasticity info
-    elasticity_row = get_elasticity_for_sku(sku)
-    # 10) prepare result
+    features_hash = hashlib.sha256(json.dumps(base_features, sort_keys=True, default=str).encode()).hexdigest()
+    now = datetime.now()
+    submit_row('demand_predictions', (
+        sku, now.date(), now, float(best_candidate['predicted_units']), model_version,
+        features_hash, float(best_candidate['price'])
+    ))
+
+def _build_suggestion(sku, current_price, evaluation, meta, elasticity_row, target_price=None):
+    """
+    Assemble the response dict for one SKU from its candidate evaluation.
+    """
+    candidates = candidate_records(evaluation)
+    best_candidate = candidates[evaluation['best_index']]
     result = {
         "sku": sku,
         "current_price": current_price,
         "suggested_price": float(best_candidate['price']),
         "expected_revenue": float(best_candidate['expected_revenue']),
         "expected_units": float(best_candidate['predicted_units']),
-        "model_version": meta.get('saved_at') if meta else None,
+        "model_version": model_version(meta) if meta else None,
+        "model_segment": meta.get('segment') if meta else None,
         "elasticity": elasticity_row.get('elasticity') if elasticity_row else None,
         "elasticity_r2": elasticity_row.get('r_squared') if elasticity_row else None,
         "elasticity_p_value": elasticity_row.get('p_value') if elasticity_row else None,
-        "candidates": candidates.to_dict(orient='records'),
-        "reason": best_reason or "revenue_maximization",
-        "constraints_applied": [c for c in candidates['constraint_reasons'].unique() if c],
+        "candidates": candidates,
+        "reason": evaluation['best_reason'] or "revenue_maximization",
+        "constraints_applied": list(dict.fromkeys(c['constraint_reasons'] for c in candidates if c['constraint_reasons'])),
         "generated_at": datetime.utcnow().isoformat()
     }
 
@@ -211,11 +582,198 @@ def suggest_price_for_sku(sku: str, base_features: dict, vendor_id: str = None,
         target_cand = next((c for c in result['candidates'] if abs(c['price'] - target_price) < 1e-4), None)
         if target_cand:
             result['target_price_details'] = target_cand
+    return result, best_candidate
+
+def _predict_candidates(model, meta, base_features, candidate_prices, used_optimizer, vendor_rule, current_price):
+    """
+    Predicted units per candidate price (refining around the best ones in adaptive mode).
+    """
+    if used_optimizer == "adaptive":
+        return refine_price_search(model, meta, [base_features], [candidate_prices], [vendor_rule], [current_price])[0]
+    return predict_units_for_prices(model, meta, base_features, candidate_prices)
+
+def _finish_suggestion(sku, base_features, current_price, vendor_rule, elasticity_row, meta, pred_df, used_optimizer,
+                       target_price, mode="single"):
+    """
+    Constraints, best candidate and response for one SKU, then queue its audit rows.
+    """
+    with stage_timer("constraints", mode):
+        evaluation = evaluate_candidates(pred_df['price'].values, pred_df['predicted_units'].values, vendor_rule, current_price)
+        result, best_candidate = _build_suggestion(sku, current_price, evaluation, meta, elasticity_row, target_price)
+        result['optimizer'] = used_optimizer
+        result['model_evaluations'] = len(pred_df)
+    with stage_timer("persist", mode):
+        try:
+            store_price_suggestion(sku, current_price, best_candidate, result['reason'], result['constraints_applied'], result['model_version'])
+            store_demand_prediction(sku, base_features, best_candidate, result['model_version'])
+        except Exception as e:
+            logger.exception("Failed to persist price suggestion")
+    return result
 
-    # 11) store suggestion in DB asynchronously if desired; here store synchronously
+def suggest_price_for_sku(sku: str, base_features: dict, vendor_id: str = None, grid_relative: list = None, steps: int = 21, model_name="demand_model", target_price: float = None, optimizer: str = None):
+    """
+    Main entrypoint for price suggestion.
+    Returns dict with suggested price, details, candidates, elasticity info, model metadata.
+    optimizer: "grid", "breakpoints" or "adaptive" (default PRICE_OPTIMIZER; "adaptive" is
+    batch-only and runs as "grid" here); the response reports the optimizer used and the
+    number of model evaluations.
+    """
+    # 1) take a snapshot of the cached model (the SKU's segment model if it has one); a
+    #    concurrent hot swap does not affect this request
+    with stage_timer("model_load"):
+        model, meta = get_demand_model_for_sku(sku, model_name=model_name)
+    # 2) current price, vendor rules and elasticity info (cached lookups)
+    with stage_timer("feature_fetch"):
+        current_price = get_latest_price_for_sku(sku) or base_features.get('last_price') or 0.0
+        vendor_rule = get_vendor_rules(vendor_id) if vendor_id else None
+        elasticity_row = get_elasticity_for_sku(sku)
+    # 3) generate candidate prices
+    with stage_timer("candidates"):
+        candidate_prices, used_optimizer = _candidate_prices(optimizer or PRICE_OPTIMIZER, model, meta, current_price, vendor_rule,
+                                                             grid_relative=grid_relative, steps=steps, include_price=target_price)
+    # 4) predict units for each candidate price
+    with stage_timer("predict"):
+        pred_df = _predict_candidates(model, meta, base_features, candidate_prices, used_optimizer, vendor_rule, current_price)
+    # 5) apply constraints, compute expected revenue, select the best candidate and prepare the result
+    # 6) queue the suggestion and prediction for the background writer
+    return _finish_suggestion(sku, base_features, current_price, vendor_rule, elasticity_row, meta, pred_df,
+                              used_optimizer, target_price)
+
+async def _features_or_default(sku):
     try:
-        store_price_suggestion(sku, current_price, best_candidate, result['reason'], result['constraints_applied'], result['model_version'])
+        return await get_latest_features_async(sku)
     except Exception as e:
-        logger.exception("Failed to persist price suggestion")
+        logger.error(f"Error fetching features: {e}")
+        FALLBACKS.labels("default_features").inc()
+        return dict(DEFAULT_BASE_FEATURES)
 
-    return result
+async def _no_value():
+    return None
+
+async def suggest_price_for_sku_async(sku: str, base_features: dict = None, vendor_id: str = None, grid_relative: list = None, steps: int = 21, model_name="demand_model", target_price: float = None, optimizer: str = None):
+    """
+    asyncio variant of suggest_price_for_sku for the async API (api/asgi.py). The feature
+    (when base_features is None; defaults if the lookup fails), latest price, vendor rules
+    and elasticity lookups run concurrently, their DB queries on the DB executor, and the
+    model lookup (which can read an artifact from disk and wait on the load lock) and the
+    prediction run in the loop's default executor, so one event loop holds many requests
+    in flight. Returns the same response as suggest_price_for_sku.
+    """
+    loop = asyncio.get_running_loop()
+    with stage_timer("model_load", "async"):
+        model, meta = await loop.run_in_executor(None, functools.partial(get_demand_model_for_sku, sku, model_name=model_name))
+    with stage_timer("feature_fetch", "async"):
+        features, latest_price, vendor_rule, elasticity_row = await asyncio.gather(
+            _features_or_default(sku) if base_features is None else _no_value(),
+            get_latest_price_for_sku_async(sku),
+            get_vendor_rules_async(vendor_id) if vendor_id else _no_value(),
+            get_elasticity_for_sku_async(sku),
+        )
+    base_features = features if base_features is None else base_features
+    current_price = latest_price or base_features.get('last_price') or 0.0
+    with stage_timer("candidates", "async"):
+        candidate_prices, used_optimizer = _candidate_prices(optimizer or PRICE_OPTIMIZER, model, meta, current_price, vendor_rule,
+                                                             grid_relative=grid_relative, steps=steps, include_price=target_price)
+    with stage_timer("predict", "async"):
+        pred_df = await loop.run_in_executor(
+            None, _predict_candidates, model, meta, base_features, candidate_prices, used_optimizer, vendor_rule, current_price)
+    return _finish_suggestion(sku, base_features, current_price, vendor_rule, elasticity_row, meta, pred_df,
+                              used_optimizer, target_price, mode="async")
+
+def suggest_prices_for_skus(items: List[Dict[str, Any]], features_by_sku: Dict[str, dict], vendor_id: str = None, grid_relative: list = None, steps: int = 21, model_name="demand_model", api_request_id=None, persist=True, optimizer: str = None):
+    """
+    Batch entrypoint: price many SKUs with bulk lookups and a single model.predict call.
+    items: list of {'sku': str, 'vendor_id': optional str, 'price': optional target price}
+    features_by_sku: dict sku -> base_features (see feature_store.get_latest_features_bulk)
+    Returns a list aligned with items; each entry is either a suggestion dict with
+    status 'ok' or {'sku', 'status': 'error', 'error'}. A failure for one SKU does not
+    affect the others. persist=False skips the audit rows (used by offline snapshot builds).
+    """
+    skus = [item['sku'] for item in items]
+    with stage_timer("model_load", "batch"):
+        models = get_demand_models_for_skus(skus, model_name=model_name)
+    with stage_timer("feature_fetch", "batch"):
+        latest_prices = get_latest_prices_bulk(skus)
+        vendor_rules = get_vendor_rules_bulk([item.get('vendor_id') or vendor_id for item in items])
+        elasticity_rows = get_elasticity_bulk(skus)
+
+    results = [None] * len(items)
+    prepared = []  # (index, current_price, candidate_prices, optimizer used)
+    started = time.perf_counter()
+    for i, item in enumerate(items):
+        sku = item['sku']
+        try:
+            base_features = features_by_sku[sku]
+            current_price = latest_prices.get(sku) or base_features.get('last_price') or 0.0
+            model, meta = models[i]
+            candidate_prices, used_optimizer = _candidate_prices(optimizer or PRICE_OPTIMIZER, model, meta, current_price,
+                                                                 vendor_rules.get(item.get('vendor_id') or vendor_id),
+                                                                 grid_relative=grid_relative, steps=steps, include_price=item.get('price'),
+                                                                 batch=True)
+            prepared.append((i, current_price, candidate_prices, used_optimizer))
+        except Exception as e:
+            logger.exception("Batch suggestion failed for sku %s", sku)
+            results[i] = {"sku": sku, "status": "error", "error": str(e)}
+    STAGE_LATENCY.labels("batch", "candidates").observe(time.perf_counter() - started)
+
+    with stage_timer("predict", "batch"):
+        pred_dfs = [None] * len(prepared)
+        # one predict call per (search mode, model); without segments there is a single model
+        groups = {}
+        for n, p in enumerate(prepared):
+            groups.setdefault((p[3] == "adaptive", id(models[p[0]][0])), []).append(n)
+        for (adaptive, _), group in groups.items():
+            model, meta = models[prepared[group[0]][0]]
+            features_list = [features_by_sku[items[prepared[n][0]]['sku']] for n in group]
+            prices_list = [prepared[n][2] for n in group]
+            rules = [vendor_rules.get(items[prepared[n][0]].get('vendor_id') or vendor_id) for n in group]
+            try:
+                if adaptive:
+                    dfs = refine_price_search(model, meta, features_list, prices_list, rules, [prepared[n][1] for n in group])
+                else:
+                    dfs = predict_units_for_price_grids(model, meta, features_list, prices_list)
+                for n, df in zip(group, dfs):
+                    pred_dfs[n] = df
+            except Exception:
+                # one bad SKU must not fail the group: retry its SKUs one by one
+                logger.exception("Batch predict failed for a group of %d SKUs, retrying them individually", len(group))
+                for n, base_features, rule in zip(group, features_list, rules):
+                    i, current_price, candidate_prices, used_optimizer = prepared[n]
+                    try:
+                        pred_dfs[n] = _predict_candidates(model, meta, base_features, candidate_prices, used_optimizer, rule, current_price)
+                    except Exception as e:
+                        logger.exception("Batch suggestion failed for sku %s", items[i]['sku'])
+                        results[i] = {"sku": items[i]['sku'], "status": "error", "error": str(e)}
+
+    # constraints and persist alternate per SKU; their times are summed over the batch
+    constraints_sec = persist_sec = 0.0
+    for (i, current_price, _, used_optimizer), pred_df in zip(prepared, pred_dfs):
+        if pred_df is None:
+            continue  # failed in the predict stage
+        item = items[i]
+        sku = item['sku']
+        try:
+            t0 = time.perf_counter()
+            vendor_rule = vendor_rules.get(item.get('vendor_id') or vendor_id)
+            evaluation = evaluate_candidates(pred_df['price'].values, pred_df['predicted_units'].values, vendor_rule, current_price)
+            result, best_candidate = _build_suggestion(sku, current_price, evaluation, models[i][1], elasticity_rows.get(sku), item.get('price'))
+            result['optimizer'] = used_optimizer
+            result['model_evaluations'] = len(pred_df)
+            t1 = time.perf_counter()
+            constraints_sec += t1 - t0
+            if persist:
+                try:
+                    store_price_suggestion(sku, current_price, best_candidate, result['reason'], result['constraints_applied'], result['model_version'], api_request_id)
+                    store_demand_prediction(sku, features_by_sku[sku], best_candidate, result['model_version'])
+                except Exception:
+                    logger.exception("Failed to persist price suggestion")
+                persist_sec += time.perf_counter() - t1
+            result['status'] = "ok"
+            results[i] = result
+        except Exception as e:
+            logger.exception("Batch suggestion failed for sku %s", sku)
+            results[i] = {"sku": sku, "status": "error", "error": str(e)}
+    STAGE_LATENCY.labels("batch", "constraints").observe(constraints_sec)
+    if persist:
+        STAGE_LATENCY.labels("batch", "persist").observe(persist_sec)
+    return results
@@ -0,0 +1,302 @@
+# services/suggestion_snapshot.py
+"""
+Precomputed default price suggestions.
+
+build_snapshot() runs the batch pricing path after ETL and training for every SKU in
+features_daily, once without a vendor and once for each vendor that sold or stocked the
+SKU in the last SUGGESTION_SNAPSHOT_PAIR_DAYS days (orders / inventory). It writes a
+versioned snapshot file under SUGGESTION_SNAPSHOT_DIR, switches the `current.json` pointer
+to it, stores the rows in price_suggestion_snapshot and prunes all but the newest
+SUGGESTION_SNAPSHOT_KEEP_VERSIONS versions of both. Entries keep the served fields only
+(no candidate grid). The snapshot also records the vendor rules it was computed with.
+
+At serving time SuggestionSnapshot keeps the current snapshot in memory as pre-serialized
+JSON, so a default request (no target price) for a known SKU/vendor pair is answered
+without touching the model or the DB. A vendor entry is only served while the vendor's
+current rule (services.pricing_engine.get_vendor_rules, cached) matches the recorded one;
+after upsert_vendor_rule the pair is computed live.
+"""
+
+import sys
+import os
+# Add parent directory to path to allow running as a script
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import glob
+import json
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+from services.db_pool import SimpleMySQLPool
+from services.feature_store import get_latest_features_bulk
+from services.pricing_engine import suggest_prices_for_skus, store_demand_prediction, get_vendor_rules, get_vendor_rules_bulk
+from loguru import logger
+
+SUGGESTION_SNAPSHOT_DIR = os.getenv("SUGGESTION_SNAPSHOT_DIR", "./models_artifacts/snapshots")
+SUGGESTION_SNAPSHOT_MAX_AGE_HOURS = float(os.getenv("SUGGESTION_SNAPSHOT_MAX_AGE_HOURS", 36))
+SUGGESTION_SNAPSHOT_CHECK_INTERVAL_SEC = float(os.getenv("SUGGESTION_SNAPSHOT_CHECK_INTERVAL_SEC", 60))
+SUGGESTION_SNAPSHOT_PAIR_DAYS = int(os.getenv("SUGGESTION_SNAPSHOT_PAIR_DAYS", 90))
+SUGGESTION_SNAPSHOT_KEEP_VERSIONS = int(os.getenv("SUGGESTION_SNAPSHOT_KEEP_VERSIONS", 3))
+SNAPSHOT_BATCH_SIZE = 500
+POINTER_FILE = "current.json"
+# vendor_rules fields that change the computed suggestion
+RULE_FIELDS = ('min_margin', 'max_discount', 'max_daily_price_change')
+
+def _snapshot_key(sku, vendor_id):
+    return f"{sku}|{vendor_id or ''}"
+
+def _rule_fingerprint(rule):
+    """
+    JSON-comparable form of a vendor rule's constraint fields (None for no rule).
+    """
+    if not rule:
+        return None
+    return [None if rule.get(f) is None else float(rule.get(f)) for f in RULE_FIELDS]
+
+def _vendor_pairs(cur, skus, vendor_ids=None, days=SUGGESTION_SNAPSHOT_PAIR_DAYS):
+    """
+    dict sku -> sorted vendor_ids that sold or stocked the SKU in the last `days` days,
+    restricted to skus (and to vendor_ids when given).
+    """
+    cur.execute("""
+        SELECT DISTINCT sku, vendor_id FROM orders
+        WHERE vendor_id IS NOT NULL AND order_ts >= DATE_SUB(NOW(), INTERVAL %s DAY)
+        UNION
+        SELECT DISTINCT sku, vendor_id FROM inventory
+        WHERE vendor_id IS NOT NULL AND snapshot_ts >= DATE_SUB(NOW(), INTERVAL %s DAY)
+    """, (days, days))
+    known = set(skus)
+    allowed = set(vendor_ids) if vendor_ids is not None else None
+    pairs = defaultdict(set)
+    for row in cur.fetchall():
+        if row['sku'] in known and (allowed is None or row['vendor_id'] in allowed):
+            pairs[row['sku']].add(row['vendor_id'])
+    return {sku: sorted(vendors) for sku, vendors in pairs.items()}
+
+def build_snapshot(output_dir=SUGGESTION_SNAPSHOT_DIR, vendor_ids=None, batch_size=SNAPSHOT_BATCH_SIZE, write_table=True,
+                   record_predictions=True, keep=SUGGESTION_SNAPSHOT_KEEP_VERSIONS):
+    """
+    Compute default suggestions for every SKU (no vendor) and its observed SKU/vendor pairs
+    (only vendor_ids, if given), publish them as a new snapshot version and prune old
+    versions. With record_predictions, each SKU's vendor-less suggestion is also stored as
+    its demand_predictions row for the day. Returns (version, path, count).
+    """
+    pool = SimpleMySQLPool.instance()
+    with pool.connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT DISTINCT sku FROM features_daily")
+            skus = [row['sku'] for row in cur.fetchall()]
+            pairs = _vendor_pairs(cur, skus, vendor_ids)
+
+    version = datetime.utcnow().strftime("%Y%m%dT%H%M%SZ")
+    created_at = datetime.utcnow().isoformat()
+    # recorded before computing: a rule changed mid-build then mismatches and is served live
+    all_vendors = sorted({v for vendors in pairs.values() for v in vendors})
+    rules = get_vendor_rules_bulk(all_vendors)
+    vendor_rules = {v: _rule_fingerprint(rules.get(v)) for v in all_vendors}
+    entries = {}
+    failed = 0
+    started = time.time()
+    for start in range(0, len(skus), batch_size):
+        chunk = skus[start:start + batch_size]
+        features_by_sku = get_latest_features_bulk(chunk)
+        items = [{'sku': sku, 'vendor_id': vendor_id, 'price': None}
+                 for sku in chunk for vendor_id in [None] + pairs.get(sku, [])]
+        results = suggest_prices_for_skus(items, features_by_sku, steps=21, persist=False)
+        for item, result in zip(items, results):
+            if result.get('status') != "ok":
+                failed += 1
+                continue
+            entry = {k: v for k, v in result.items() if k != 'status'}
+            entries[_snapshot_key(item['sku'], item['vendor_id'])] = entry
+            if item['vendor_id'] is None and record_predictions:
+                # today's demand_predictions row for the SKU, whichever path serves it
+                store_demand_prediction(item['sku'], features_by_sku[item['sku']],
+                                        {'price': result['suggested_price'], 'predicted_units': result['expected_units']},
+                                        result.get('model_version'))
+
+    os.makedirs(output_dir, exist_ok=True)
+    path = os.path.join(output_dir, f"suggestions_{version}.json")
+    payload = {"version": version, "created_at": created_at, "vendor_rules": vendor_rules, "entries": entries}
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(payload, f, default=str)
+    os.replace(tmp_path, path)
+
+    if write_table:
+        _write_snapshot_table(version, entries)
+
+    # switch the pointer last so servers only ever see a complete snapshot
+    pointer_tmp = os.path.join(output_dir, POINTER_FILE + ".tmp")
+    with open(pointer_tmp, "w") as f:
+        json.dump({"version": version, "path": os.path.basename(path), "created_at": created_at}, f)
+    os.replace(pointer_tmp, os.path.join(output_dir, POINTER_FILE))
+    prune_snapshots(output_dir, keep=keep, prune_table=write_table)
+
+    logger.info(f"Suggestion snapshot {version}: {len(entries)} entries ({sum(len(v) for v in pairs.values())} vendor pairs), "
+                f"{failed} failures, {time.time() - started:.1f}s")
+    return version, path, len(entries)
+
+def prune_snapshots(output_dir=SUGGESTION_SNAPSHOT_DIR, keep=SUGGESTION_SNAPSHOT_KEEP_VERSIONS, prune_table=True):
+    """
+    Delete all but the newest `keep` snapshot versions (files and price_suggestion_snapshot
+    rows), never the current one.
+    """
+    try:
+        with open(os.path.join(output_dir, POINTER_FILE)) as f:
+            current = json.load(f)['version']
+    except (OSError, ValueError, KeyError):
+        current = None
+    files = sorted(glob.glob(os.path.join(output_dir, "suggestions_*.json")))
+    versions = [os.path.basename(p)[len("suggestions_"):-len(".json")] for p in files]
+    kept = set(versions[-keep:] if keep > 0 else []) | ({current} if current else set())
+    for version, path in zip(versions, files):
+        if version not in kept:
+            os.remove(path)
+    if prune_table and kept:
+        pool = SimpleMySQLPool.instance()
+        with pool.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(f"DELETE FROM price_suggestion_snapshot WHERE snapshot_version NOT IN ({','.join(['%s'] * len(kept))})",
+                            sorted(kept))
+            conn.commit()
+
+def _write_snapshot_table(version, entries, chunk_size=1000):
+    sql = """
+    REPLACE INTO price_suggestion_snapshot
+    (snapshot_version, sku, vendor_id, suggested_price, expected_revenue, model_version, suggestion)
+    VALUES (%s,%s,%s,%s,%s,%s,%s)
+    """
+    rows = []
+    for key, s in entries.items():
+        sku, vendor_id = key.split("|", 1)
+        rows.append((version, sku, vendor_id, s['suggested_price'], s['expected_revenue'], s.get('model_version'), json.dumps(s, default=str)))
+    pool = SimpleMySQLPool.instance()
+    with pool.connection() as conn:
+        with conn.cursor() as cur:
+            for start in range(0, len(rows), chunk_size):
+                cur.executemany(sql, rows[start:start + chunk_size])
+        conn.commit()
+
+class SuggestionSnapshot:
+    """
+    In-memory view of the current snapshot. Each entry is kept as its serialized JSON
+    object plus the few fields needed for the audit row, so serving is a dict lookup and
+    a bytes concatenation. The pointer file is re-checked at most every check_interval seconds.
+    """
+    _instance = None
+    _lock = threading.Lock()
+
+    def __init__(self, snapshot_dir=SUGGESTION_SNAPSHOT_DIR, max_age_hours=SUGGESTION_SNAPSHOT_MAX_AGE_HOURS,
+                 check_interval=SUGGESTION_SNAPSHOT_CHECK_INTERVAL_SEC):
+        self.snapshot_dir = snapshot_dir
+        self.max_age = timedelta(hours=max_age_hours)
+        self.check_interval = check_interval
+        self._state = None  # (pointer_mtime_ns, version, created_at, entries, vendor_rules)
+        self._next_check = 0.0
+        self._reload_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.rule_mismatches = 0
+
+    @classmethod
+    def instance(cls):
+        with cls._lock:
+            if cls._instance is None:
+                cls._instance = SuggestionSnapshot()
+            return cls._instance
+
+    def _maybe_reload(self):
+        now = time.monotonic()
+        if now < self._next_check:
+            return
+        with self._reload_lock:
+            if now < self._next_check:
+                return
+            self._next_check = now + self.check_interval
+            pointer = os.path.join(self.snapshot_dir, POINTER_FILE)
+            try:
+                mtime = os.stat(pointer).st_mtime_ns
+            except OSError:
+                return
+            if self._state is not None and self._state[0] == mtime:
+                return
+            try:
+                with open(pointer) as f:
+                    ptr = json.load(f)
+                with open(os.path.join(self.snapshot_dir, ptr['path'])) as f:
+                    payload = json.load(f)
+                entries = {}
+                for key, s in payload['entries'].items():
+                    body = json.dumps(s, default=str, sort_keys=True).encode()
+                    audit = (s['current_price'], s['suggested_price'], s['expected_revenue'], s['expected_units'],
+                             s['reason'], s['constraints_applied'], s.get('model_version'))
+                    entries[key] = (body, audit)
+                created_at = datetime.fromisoformat(payload['created_at'])
+                self._state = (mtime, payload['version'], created_at, entries, payload.get('vendor_rules', {}))
+                logger.info(f"Loaded suggestion snapshot {payload['version']} ({len(entries)} entries)")
+            except Exception as e:
+                logger.error(f"Failed to load suggestion snapshot, keeping previous: {e}")
+
+    def preload(self):
+        """
+        Load the current snapshot now (server start) instead of on the first request.
+        """
+        self._maybe_reload()
+        return self.stats()
+
+    def lookup(self, sku, vendor_id=None):
+        """
+        (version, json_bytes, audit_fields) for a fresh snapshot entry, or None on a miss.
+        """
+        self._maybe_reload()
+        state = self._state
+        if state is None or datetime.utcnow() - state[2] > self.max_age:
+            self.misses += 1
+            return None
+        entry = state[3].get(_snapshot_key(sku, vendor_id))
+        if entry is None:
+            self.misses += 1
+            return None
+        if vendor_id and not self._rule_unchanged(state[4], vendor_id):
+            self.misses += 1
+            self.rule_mismatches += 1
+            return None
+        self.hits += 1
+        return state[1], entry[0], entry[1]
+
+    @staticmethod
+    def _rule_unchanged(recorded, vendor_id):
+        """
+        Whether the vendor's current rule is the one the snapshot was computed with. A
+        failed rule lookup keeps serving the snapshot (the live path would need the DB too).
+        """
+        if vendor_id not in recorded:
+            return False
+        try:
+            current = get_vendor_rules(vendor_id)
+        except Exception as e:
+            logger.warning(f"Vendor rule lookup failed, serving snapshot entry: {e}")
+            return True
+        return _rule_fingerprint(current) == recorded[vendor_id]
+
+    def stats(self):
+        state = self._state
+        return {
+            "version": state[1] if state else None,
+            "entries": len(state[3]) if state else 0,
+            "hits": self.hits,
+            "misses": self.misses,
+            "rule_mismatches": self.rule_mismatches,
+        }
+
+def snapshot_response_body(json_bytes, extra: dict):
+    """
+    Splice extra top-level fields into a pre-serialized JSON object.
+    """
+    return json_bytes[:-1] + b", " + json.dumps(extra)[1:].encode()
+
+if __name__ == "__main__":
+    version, path, count = build_snapshot()
+    print(f"Snapshot {version} written to {path} ({count} entries)")
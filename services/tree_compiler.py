@@ -0,0 +1,42 @@
+# services/tree_compiler.py
+"""
+Read the split structure of a trained LightGBM demand model from its JSON dump.
+
+split_thresholds() lists the thresholds a model splits on for the given feature columns;
+the breakpoint optimizer (services.pricing_engine) scores prices only at those
+thresholds, since a tree model's output is constant between them. Only numerical
+decisions (x <= threshold goes left) are supported; other decision types raise
+ValueError and the caller falls back to the grid.
+"""
+
+import numpy as np
+
+def _booster_of(model):
+    if hasattr(model, "dump_model") and type(model).__module__.startswith("lightgbm"):
+        return model
+    if hasattr(model, "booster_"):
+        return model.booster_  # sklearn wrapper (LGBMRegressor)
+    raise ValueError(f"Not a LightGBM model: {type(model).__name__}")
+
+def split_thresholds(model, feature_indices):
+    """
+    Sorted unique split thresholds on the given feature columns of a LightGBM model. For
+    fixed values of the other features the model output is constant on every interval
+    (t_i, t_i+1] between consecutive thresholds of these features.
+    """
+    dump = _booster_of(model).dump_model()
+    wanted = set(feature_indices)
+    found = []
+    for tree in dump["tree_info"]:
+        stack = [tree["tree_structure"]]
+        while stack:
+            spec = stack.pop()
+            if "leaf_value" in spec:
+                continue
+            if spec.get("decision_type", "<=") != "<=":
+                raise ValueError(f"Unsupported decision type: {spec.get('decision_type')}")
+            if int(spec["split_feature"]) in wanted:
+                found.append(float(spec["threshold"]))
+            stack.append(spec["left_child"])
+            stack.append(spec["right_child"])
+    return np.unique(np.asarray(found, dtype=np.float64))
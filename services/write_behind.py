@@ -0,0 +1,188 @@
+# services/write_behind.py
+"""
+Write-behind queue for audit inserts made on the request path
+(price_suggestions, api_logs, demand_predictions).
+Request threads enqueue row tuples; a background thread batches them per table and
+writes each batch with executemany. A batch is flushed when it reaches
+WRITE_BEHIND_BATCH_SIZE rows or WRITE_BEHIND_FLUSH_INTERVAL_SEC has passed.
+When the queue is full, submit() waits up to WRITE_BEHIND_BLOCK_SEC (backpressure) and
+then drops the row and counts it. Pending rows are drained at interpreter exit.
+"""
+
+import atexit
+import os
+import threading
+import time
+from queue import Queue, Empty, Full
+from services.db_pool import SimpleMySQLPool
+from loguru import logger
+
+WRITE_BEHIND_ENABLED = os.getenv("WRITE_BEHIND_ENABLED", "1").lower() not in ("0", "false", "no")
+WRITE_BEHIND_MAX_QUEUE = int(os.getenv("WRITE_BEHIND_MAX_QUEUE", 10000))
+WRITE_BEHIND_BATCH_SIZE = int(os.getenv("WRITE_BEHIND_BATCH_SIZE", 200))
+WRITE_BEHIND_FLUSH_INTERVAL_SEC = float(os.getenv("WRITE_BEHIND_FLUSH_INTERVAL_SEC", 1.0))
+WRITE_BEHIND_BLOCK_SEC = float(os.getenv("WRITE_BEHIND_BLOCK_SEC", 0.05))
+
+INSERT_SQL = {
+    'price_suggestions': """
+        INSERT INTO price_suggestions
+        (sku, request_ts, current_price, suggested_price, expected_revenue, expected_units, elasticity, reason, constraints_applied, model_version, api_request_id)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+    """,
+    'api_logs': """
+        INSERT INTO api_logs (endpoint, request_ts, request_body, response_body, latency_ms)
+        VALUES (%s, %s, %s, %s, %s)
+    """,
+    # one row per SKU and day: a later prediction replaces the day's earlier one
+    'demand_predictions': """
+        INSERT INTO demand_predictions (sku, pred_date, pred_ts, predicted_units, model_version, features_hash, price_tested)
+        VALUES (%s, %s, %s, %s, %s, %s, %s)
+        ON DUPLICATE KEY UPDATE pred_ts = VALUES(pred_ts), predicted_units = VALUES(predicted_units),
+            model_version = VALUES(model_version), features_hash = VALUES(features_hash), price_tested = VALUES(price_tested)
+    """,
+}
+
+class WriteBehindWriter:
+    _instance = None
+    _lock = threading.Lock()
+
+    def __init__(self, max_queue=WRITE_BEHIND_MAX_QUEUE, batch_size=WRITE_BEHIND_BATCH_SIZE,
+                 flush_interval=WRITE_BEHIND_FLUSH_INTERVAL_SEC, block_timeout=WRITE_BEHIND_BLOCK_SEC):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.block_timeout = block_timeout
+        self._queue = Queue(maxsize=max_queue)
+        self._stop = threading.Event()
+        self._thread = None
+        self._thread_lock = threading.Lock()
+        self.enqueued = 0
+        self.dropped = 0
+        self.written = 0
+        self.failed = 0
+        self.flushes = 0
+
+    @classmethod
+    def instance(cls):
+        with cls._lock:
+            if cls._instance is None:
+                cls._instance = WriteBehindWriter()
+                atexit.register(cls._instance.shutdown)
+            return cls._instance
+
+    @classmethod
+    def reset_after_fork(cls):
+        """
+        In a forked worker: forget the parent's writer (its thread did not survive the fork
+        and its queued rows are the parent's to write) so the worker starts its own.
+        """
+        cls._lock = threading.Lock()
+        previous, cls._instance = cls._instance, None
+        if previous is not None:
+            atexit.unregister(previous.shutdown)
+
+    def _ensure_started(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._thread_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+                self._thread.start()
+
+    def submit(self, table, row: tuple):
+        """
+        Queue one row for `table`. Returns False if the row was dropped because the queue
+        stayed full for block_timeout seconds.
+        """
+        if table not in INSERT_SQL:
+            raise ValueError(f"Unknown write-behind table: {table}")
+        if self._stop.is_set():
+            # shutting down: write through so nothing is lost
+            self._write({table: [row]})
+            return True
+        self._ensure_started()
+        try:
+            self._queue.put((table, row), timeout=self.block_timeout)
+        except Full:
+            self.dropped += 1
+            if self.dropped % 1000 == 1:
+                logger.warning(f"Write-behind queue full, dropped {self.dropped} rows so far")
+            return False
+        self.enqueued += 1
+        return True
+
+    def _run(self):
+        pending = {}
+        pending_rows = 0
+        deadline = time.monotonic() + self.flush_interval
+        while True:
+            timeout = max(0.0, deadline - time.monotonic())
+            try:
+                table, row = self._queue.get(timeout=timeout)
+                pending.setdefault(table, []).append(row)
+                pending_rows += 1
+            except Empty:
+                pass
+            now = time.monotonic()
+            if pending_rows >= self.batch_size or now >= deadline:
+                if pending_rows:
+                    self._write(pending)
+                    pending, pending_rows = {}, 0
+                deadline = now + self.flush_interval
+            if self._stop.is_set() and self._queue.empty():
+                if pending_rows:
+                    self._write(pending)
+                return
+
+    def _write(self, batches):
+        pool = SimpleMySQLPool.instance()
+        for table, rows in batches.items():
+            try:
+                with pool.connection() as conn:
+                    with conn.cursor() as cur:
+                        cur.executemany(INSERT_SQL[table], rows)
+                    conn.commit()
+                self.written += len(rows)
+            except Exception as e:
+                self.failed += len(rows)
+                logger.error(f"Write-behind flush of {len(rows)} {table} rows failed: {e}")
+        self.flushes += 1
+
+    def shutdown(self, timeout=10.0):
+        """
+        Stop accepting queued writes and drain everything pending.
+        """
+        self._stop.set()
+        thread = self._thread
+        if thread is not None and thread.is_alive():
+            thread.join(timeout)
+        # rows queued after the thread exited (or if it never started)
+        leftovers = {}
+        while True:
+            try:
+                table, row = self._queue.get_nowait()
+            except Empty:
+                break
+            leftovers.setdefault(table, []).append(row)
+        if leftovers:
+            self._write(leftovers)
+
+    def stats(self):
+        return {
+            "queued": self._queue.qsize(),
+            "enqueued": self.enqueued,
+            "dropped": self.dropped,
+            "written": self.written,
+            "failed": self.failed,
+            "flushes": self.flushes,
+        }
+
+def submit_row(table, row: tuple):
+    """
+    Persist an audit row: queued for the background writer, or written synchronously
+    when WRITE_BEHIND_ENABLED is off.
+    """
+    if not WRITE_BEHIND_ENABLED:
+        WriteBehindWriter.instance()._write({table: [row]})
+        return True
+    return WriteBehindWriter.instance().submit(table, row)
@@ -160,6 +160,10 @@ def run_etl():
     """Run ETL process"""
     logger.info("Running ETL process...")
     try:
+        if os.getenv("ETL_MODE", "full").lower() == "incremental":
+            from etl.incremental import run_incremental_etl
+            logger.info(f"Incremental ETL: {run_incremental_etl()}")
+            return True
         from etl.extract import fetch_orders, fetch_inventory_snapshot, fetch_product_analytics, fetch_promotions
         from etl.transform import build_features
         from etl.load import load_features
@@ -188,15 +192,16 @@ def run_training():
     logger.info("Running model training...")
     try:
         from services.db_pool import SimpleMySQLPool
+        from etl.extract import fetch_orders
         import pandas as pd
         from models.train_elasticity import train_and_save_all
-        from models.train_demand import train_and_save
+        from models.train_demand import train_and_save_segmented
         import yaml
         
         pool = SimpleMySQLPool.instance()
         conn = pool.get_pandas_conn()
         try:
-            orders = pd.read_sql("SELECT * FROM orders WHERE order_ts >= DATE_SUB(NOW(), INTERVAL 180 DAY)", conn)
+            orders = fetch_orders(since_days=180)
             features = pd.read_sql("SELECT * FROM features_daily", conn)
         finally:
             pool.close_pandas_conn(conn)
@@ -212,7 +217,7 @@ def run_training():
             if os.path.exists(cfg_path):
                 with open(cfg_path) as f:
                     cfg = yaml.safe_load(f)['models']['demand']
-            train_and_save(features, orders, cfg)
+            train_and_save_segmented(features, orders, cfg)
             logger.info("Models trained successfully.")
         return True
     except Exception as e:
@@ -221,6 +226,20 @@ def run_training():
         traceback.print_exc()
         return False
 
+def run_snapshot():
+    """Precompute default price suggestions for the API"""
+    logger.info("Building suggestion snapshot...")
+    try:
+        from services.suggestion_snapshot import build_snapshot
+        version, path, count = build_snapshot()
+        logger.info(f"Snapshot {version}: {count} suggestions")
+        return True
+    except Exception as e:
+        logger.error(f"Snapshot build failed: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
 def start_flask():
     """Start Flask application"""
     logger.info("Starting Flask application...")
@@ -257,6 +276,9 @@ def main():
     
     # Step 7: Train models
     run_training()
+
+    # Step 7b: Precompute default suggestions
+    run_snapshot()
     
     # Step 8: Start Flask
     print("\n" + "="*60)